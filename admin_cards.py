@@ -0,0 +1,105 @@
+"""
+Копии карточки заявки у администраторов.
+
+Новая заявка рассылается каждому администратору отдельным сообщением.
+track_admin_cards() запоминает (chat_id, message_id) каждой доставленной
+копии, а edit_admin_cards() при смене статуса (отписал, оплачено,
+удалено) правит все копии одной рассылкой через очередь отправки:
+у остальных администраторов сразу пропадают неактуальные кнопки.
+
+Статус может смениться раньше, чем доставлены и записаны все копии.
+Поэтому после рассылки track_admin_cards() ещё раз сверяет записанные
+копии с текущим состоянием заявки; копии, которые уже показывают его,
+пропускаются без вызова API.
+"""
+import asyncio
+import logging
+from typing import Iterable, List, Optional, Set, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from captions import admin_card, admin_card_deleted, admin_card_markup, employee_name, sent_captions
+from outbound import FanOut, OutboundScheduler, Priority, fan_out
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+_tracking_tasks: Set[asyncio.Task] = set()
+
+
+def track_admin_cards(
+    outbound: OutboundScheduler,
+    db: Storage,
+    payment_id: int,
+    delivery: FanOut,
+    caption: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+) -> asyncio.Task:
+    """Сохранять копии карточки по мере доставки; рассылку не задерживает"""
+    async def track() -> None:
+        copies: List[Tuple[int, int]] = []
+        async for chat_id, message in delivery.delivered():
+            if not isinstance(message, Message):
+                continue
+            sent_captions.remember(chat_id, message.message_id, caption, reply_markup)
+            copies.append((chat_id, message.message_id))
+            try:
+                await db.add_admin_message(payment_id, chat_id, message.message_id)
+            except Exception as e:
+                logger.error(f"Admin card of payment #{payment_id} in chat {chat_id} will not be synced: {e}")
+        if copies and not outbound.closed:
+            await _resync_admin_cards(outbound, db, payment_id, copies)
+    
+    task = asyncio.create_task(track())
+    _tracking_tasks.add(task)
+    task.add_done_callback(_tracking_tasks.discard)
+    return task
+
+
+async def _resync_admin_cards(
+    outbound: OutboundScheduler,
+    db: Storage,
+    payment_id: int,
+    copies: List[Tuple[int, int]]
+) -> None:
+    """Довести копии, записанные после смены статуса, до текущей карточки"""
+    try:
+        payment = await db.get_payment_by_id(payment_id)
+        if payment is None:
+            edit_admin_cards(outbound, copies, admin_card_deleted(payment_id))
+        else:
+            edit_admin_cards(outbound, copies, admin_card(payment, await employee_name(db, payment)), admin_card_markup(payment))
+    except Exception as e:
+        logger.error(f"Failed to resync admin cards of payment #{payment_id}: {e}")
+
+
+async def drain(timeout: float = 5.0) -> None:
+    """Дождаться записи копий карточек (при остановке: после очереди отправки, до закрытия хранилища)"""
+    if not _tracking_tasks:
+        return
+    _, pending = await asyncio.wait(set(_tracking_tasks), timeout=timeout)
+    if pending:
+        logger.warning(f"Admin card tracking not finished on shutdown: {len(pending)} requests will not be synced")
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def edit_admin_cards(
+    outbound: OutboundScheduler,
+    copies: Iterable[Tuple[int, int]],
+    caption: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+) -> FanOut:
+    """
+    Заменить подпись во всех копиях карточки (chat_id, message_id).
+    
+    Копии, которые уже показывают эту подпись и клавиатуру, пропускаются
+    без вызова API. Правки идут параллельно с высоким приоритетом и
+    с лимитами очереди отправки; ошибки пишутся в лог.
+    """
+    edits = {method.chat_id: method for method in sent_captions.edits(copies, caption, reply_markup)}
+    delivery = fan_out(outbound, edits, edits.__getitem__, Priority.HIGH)
+    for chat_id, task in delivery.tasks.items():
+        sent_captions.watch(edits[chat_id], task)
+    return delivery
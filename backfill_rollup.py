@@ -0,0 +1,30 @@
+"""
+Пересчёт дневных итогов выплат (payment_daily_rollup)
+При обновлении схемы итоги заполняются автоматически; запускайте скрипт,
+если таблицу заявок правили вручную в обход бота
+"""
+import asyncio
+from database import Database
+
+
+async def backfill_rollup():
+    """Пересчитать payment_daily_rollup по таблице payments"""
+    
+    db = Database()
+    await db.init_db()
+    
+    print("🔄 Пересчитываем дневные итоги...\n")
+    rows = await db.rebuild_payment_rollup()
+    
+    stats = await db.get_statistics(days=30)
+    print(f"📊 Строк итогов: {rows}")
+    print(f"  ✅ Оплачено за 30 дней: {stats['total_paid']}")
+    print(f"  💰 Сумма за 30 дней: {stats['total_amount']}")
+    
+    await db.close()
+
+
+if __name__ == "__main__":
+    print("🚀 Пересчёт статистики выплат\n")
+    asyncio.run(backfill_rollup())
+    print("\n✅ Готово!")
@@ -0,0 +1,102 @@
+"""
+Микробенчмарк: сборка Payment из 100k строк.
+
+Сравнивает прежнюю сборку по именам (row.keys() на каждое необязательное
+поле) с PaymentMapper, который разбирает раскладку колонок один раз.
+
+Запуск: python benchmarks/bench_payment_mapper.py [кол-во строк]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database, PaymentMapper, _parse_timestamp, to_epoch_ms
+from models import Payment
+
+
+def legacy_map(rows):
+    """
+    Сборка Payment в том виде, в каком она была до PaymentMapper.
+    
+    Время разбирается тем же _parse_timestamp, что и в маппере: сравнивается
+    только доступ к полям, а не преобразование миллисекунд.
+    """
+    payments = []
+    for row in rows:
+        payments.append(Payment(
+            id=row['id'],
+            employee_id=row['employee_id'],
+            employee_username=row['employee_username'],
+            employee_first_name=row['employee_first_name'] if 'employee_first_name' in row.keys() else None,
+            balance=row['balance'],
+            username_field=row['username_field'],
+            screenshot_file_id=row['screenshot_file_id'],
+            status=row['status'],
+            payment_amount=row['payment_amount'],
+            replied=bool(row['replied']) if 'replied' in row.keys() else False,
+            employee_message_id=row['employee_message_id'] if 'employee_message_id' in row.keys() else None,
+            created_at=_parse_timestamp(row['created_at']),
+            paid_at=_parse_timestamp(row['paid_at'])
+        ))
+    return payments
+
+
+def mapper_map(rows, cursor):
+    return PaymentMapper.for_cursor(cursor).map_all(rows)
+
+
+async def seed(db: Database, count: int) -> None:
+    base = datetime(2025, 1, 1)
+    async with db.transaction() as conn:
+        await conn.executemany(
+            """INSERT INTO payments (
+                   employee_id, employee_username, employee_first_name, balance, username_field,
+                   screenshot_file_id, status, payment_amount, replied, created_at, paid_at
+               ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                (
+                    i % 500, f"user{i % 500}", "Имя", "100$", f"@acc{i}", f"file_{i}",
+                    "paid" if i % 3 else "pending", 15 if i % 3 else None, i % 2,
+                    to_epoch_ms(base + timedelta(seconds=i)),
+                    to_epoch_ms(base + timedelta(seconds=i, minutes=5)) if i % 3 else None
+                )
+                for i in range(count)
+            )
+        )
+
+
+async def run(count: int, repeats: int = 5) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        await db.init_db()
+        await seed(db, count)
+        
+        async with db.get_connection() as conn:
+            cursor = await conn.execute("SELECT * FROM payments")
+            rows = await cursor.fetchall()
+        
+        print(f"Строк: {len(rows)}, повторов: {repeats} (лучший результат)\n")
+        
+        results = {}
+        for name, fn in (("до (row.keys)", lambda: legacy_map(rows)),
+                         ("после (PaymentMapper)", lambda: mapper_map(rows, cursor))):
+            best = float("inf")
+            for _ in range(repeats):
+                started = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - started)
+            results[name] = len(rows) / best
+            print(f"  {name:<24} {results[name]:>12,.0f} строк/с")
+        
+        before, after = results.values()
+        print(f"\nУскорение: x{after / before:.2f}")
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
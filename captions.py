@@ -0,0 +1,200 @@
+"""
+Подписи карточек заявки.
+
+Все виды карточки строятся здесь из Payment: карточка администратора
+(новая, отписал, оплачена, удалена), карточка сотрудника, элемент
+и сводка списка "Мои заявки", объявление в группу и уведомление об оплате.
+
+CaptionCache помнит хеш последней подписи и клавиатуры, отправленных
+в каждое сообщение (chat, message). Правка, которая ничего не меняет
+(повторный клик, тот же статус у другого администратора), пропускается
+локально: без вызова Bot API и без ответа "message is not modified".
+"""
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageCaption
+from aiogram.types import InlineKeyboardMarkup
+
+from keyboards import get_admin_payment_keyboard
+from models import Payment
+from storage import Storage
+from utils import format_user_link
+
+REPLIED_MARK = "✍️ <b>Отписал</b>"
+
+
+async def employee_name(db: Storage, payment: Payment) -> str:
+    """Имя сотрудника для карточки: из заявки, из каталога сотрудников или username"""
+    return payment.employee_first_name or await db.get_employee_name(payment.employee_id) or payment.employee_username or "Не указано"
+
+
+def _details(payment: Payment) -> str:
+    return (
+        f"💰 <b>Баланс:</b> {payment.balance}\n"
+        f"🔑 <b>Юзернейм:</b> {payment.username_field}"
+    )
+
+
+def admin_card(payment: Payment, name: str) -> str:
+    """Карточка заявки у администратора в текущем статусе"""
+    employee = (
+        f"👤 <b>Сотрудник:</b> {format_user_link(payment.employee_id, payment.employee_username)}\n"
+        f"👨 <b>Имя:</b> {name}\n"
+    )
+    if payment.status == "paid":
+        replied = f"\n{REPLIED_MARK}" if payment.replied else ""
+        return (
+            f"✅ <b>Заявка #{payment.id} ОПЛАЧЕНА</b>\n\n"
+            f"{employee}{_details(payment)}\n"
+            f"💵 <b>Сумма оплаты:</b> {payment.payment_amount}"
+            f"{replied}"
+        )
+    replied = f"\n\n{REPLIED_MARK}" if payment.replied else ""
+    return f"📋 <b>Новая заявка #{payment.id}</b>\n\n{employee}{_details(payment)}{replied}"
+
+
+def admin_card_markup(payment: Payment) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки администратора: только пока заявка не оплачена"""
+    return get_admin_payment_keyboard(payment.id) if payment.status == "pending" else None
+
+
+def admin_card_deleted(payment_id: int) -> str:
+    return f"🗑 <b>Заявка #{payment_id} удалена сотрудником</b>"
+
+
+def employee_card(payment: Payment) -> str:
+    """Подтверждение созданной заявки у сотрудника"""
+    replied = f"\n\n{REPLIED_MARK}" if payment.replied else ""
+    return (
+        f"✅ <b>Заявка #{payment.id} успешно создана!</b>\n\n"
+        f"{_details(payment)}\n\n"
+        f"Ожидайте обработки администратором."
+        f"{replied}"
+    )
+
+
+def employee_card_deleted(payment_id: int) -> str:
+    return f"🗑 <b>Заявка #{payment_id} удалена</b>"
+
+
+def my_payment_card(payment: Payment) -> str:
+    """Заявка в списке «📋 Мои заявки»"""
+    replied = f"\n{REPLIED_MARK}" if payment.replied else ""
+    return (
+        f"📋 <b>Заявка #{payment.id}</b>\n"
+        f"📅 <b>Создана:</b> {payment.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
+        f"{_details(payment)}\n"
+        f"📊 <b>Статус:</b> ⏳ Ожидает обработки"
+        f"{replied}"
+    )
+
+
+def my_payments_summary(payments: Iterable[Payment]) -> str:
+    """Сводка страницы «📋 Мои заявки» под альбомом со скриншотами"""
+    lines = [
+        f"• <b>#{payment.id}</b> — {payment.balance}, {payment.username_field}"
+        f"{' ✍️' if payment.replied else ''}"
+        for payment in payments
+    ]
+    return (
+        "📋 <b>Ваши активные заявки</b>\n\n"
+        + "\n".join(lines)
+        + "\n\nНажмите 🗑 с номером заявки, чтобы удалить её."
+    )
+
+
+def group_paid_announcement(payment: Payment, name: str) -> str:
+    return (
+        "✅ <b>Оплачено</b>\n\n"
+        f"🔑 <b>Юзернейм:</b> {payment.username_field}\n"
+        f"💵 <b>Оплата:</b> {payment.payment_amount}\n"
+        f"👤 <b>Сотрудник:</b> {format_user_link(payment.employee_id, payment.employee_username)}\n"
+        f"👨 <b>Имя:</b> {name}"
+    )
+
+
+def employee_paid_notice(payment: Payment, name: str) -> str:
+    return (
+        f"✅ <b>Ваша заявка #{payment.id} оплачена!</b>\n\n"
+        f"👨 <b>Имя:</b> {name}\n"
+        f"💵 <b>Сумма:</b> {payment.payment_amount}\n"
+        f"🔑 <b>Юзернейм:</b> {payment.username_field}\n\n"
+        "Спасибо за работу! 🎉"
+    )
+
+
+def _fingerprint(caption: str, reply_markup: Optional[InlineKeyboardMarkup]) -> bytes:
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else ""
+    return hashlib.blake2b(f"{caption}\0{markup}".encode(), digest_size=16).digest()
+
+
+class CaptionCache:
+    """Хеши последних подписей по сообщениям (chat_id, message_id), LRU на max_size записей"""
+    
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._sent: "OrderedDict[Tuple[int, int], bytes]" = OrderedDict()
+        self.skipped = 0
+    
+    def remember(self, chat_id: int, message_id: int, caption: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        """Запомнить подпись, с которой сообщение было отправлено"""
+        self._sent[(chat_id, message_id)] = _fingerprint(caption, reply_markup)
+        self._sent.move_to_end((chat_id, message_id))
+        while len(self._sent) > self.max_size:
+            self._sent.popitem(last=False)
+    
+    def claim(self, chat_id: int, message_id: int, caption: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> bool:
+        """
+        True — подпись новая, её надо отправить (и она уже запомнена, чтобы
+        параллельная такая же правка не ушла второй раз); False — сообщение
+        уже выглядит так.
+        """
+        key = (chat_id, message_id)
+        if self._sent.get(key) == _fingerprint(caption, reply_markup):
+            self._sent.move_to_end(key)
+            self.skipped += 1
+            return False
+        self.remember(chat_id, message_id, caption, reply_markup)
+        return True
+    
+    def forget(self, chat_id: int, message_id: int) -> None:
+        """Неизвестно, что показывает сообщение (правка не удалась)"""
+        self._sent.pop((chat_id, message_id), None)
+    
+    def edits(
+        self,
+        copies: Iterable[Tuple[int, int]],
+        caption: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None
+    ) -> Iterator[EditMessageCaption]:
+        """Правки подписи только для тех сообщений (chat_id, message_id), где она изменится"""
+        for chat_id, message_id in dict(copies).items():
+            if self.claim(chat_id, message_id, caption, reply_markup):
+                yield EditMessageCaption(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    caption=caption,
+                    parse_mode="HTML",
+                    reply_markup=reply_markup
+                )
+    
+    def watch(self, method: EditMessageCaption, future: asyncio.Future) -> None:
+        """Забыть подпись, если правка не дошла (кроме "message is not modified")"""
+        def done(future: asyncio.Future) -> None:
+            if future.cancelled():
+                self.forget(method.chat_id, method.message_id)
+                return
+            error = future.exception()
+            if error is None or isinstance(error, TelegramBadRequest) and "message is not modified" in error.message:
+                return
+            self.forget(method.chat_id, method.message_id)
+        
+        future.add_done_callback(done)
+
+
+# Общий кэш процесса: правки карточек идут из разных хендлеров
+sent_captions = CaptionCache()
@@ -1,4 +1,5 @@
 import os
+import re
 from typing import List
 from dotenv import load_dotenv
 
@@ -17,6 +18,57 @@ class Config:
     
     GROUP_CHAT_ID: int = int(os.getenv("GROUP_CHAT_ID", "0"))
     
+    # Движок хранилища: sqlite (по умолчанию) или memory (без диска, данные теряются при перезапуске)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "sqlite").strip().lower()
+    
+    # Групповая фиксация мелких UPDATE (одна транзакция на пачку вместо fsync на клик)
+    DB_WRITE_BEHIND: bool = os.getenv("DB_WRITE_BEHIND", "0").strip().lower() in ("1", "true", "yes")
+    DB_FLUSH_INTERVAL_MS: int = int(os.getenv("DB_FLUSH_INTERVAL_MS", "5"))
+    DB_FLUSH_MAX_BATCH: int = int(os.getenv("DB_FLUSH_MAX_BATCH", "64"))
+    
+    # Пул соединений только для чтения (статистика, списки) и лимит времени на запрос; 0 — без лимита
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+    DB_READ_TIMEOUT_MS: int = int(os.getenv("DB_READ_TIMEOUT_MS", "10000"))
+    
+    # Запросы дольше порога пишутся в slow_queries.log с планом выполнения; 0 — не писать
+    DB_SLOW_QUERY_MS: int = int(os.getenv("DB_SLOW_QUERY_MS", "200"))
+    
+    # Состояния диалогов FSM в SQLite (при STORAGE_BACKEND=sqlite): брошенный диалог сбрасывается через
+    # FSM_STATE_TTL_HOURS (0 — никогда), изменения пишутся пачкой раз в FSM_FLUSH_INTERVAL_MS
+    FSM_STATE_TTL_HOURS: float = float(os.getenv("FSM_STATE_TTL_HOURS", "24"))
+    FSM_FLUSH_INTERVAL_MS: int = int(os.getenv("FSM_FLUSH_INTERVAL_MS", "50"))
+    # Кэш чтения FSM: число ключей и срок жизни (сек); 0 — без срока (один процесс)
+    FSM_CACHE_SIZE: int = int(os.getenv("FSM_CACHE_SIZE", "1000"))
+    FSM_CACHE_TTL: float = float(os.getenv("FSM_CACHE_TTL", "0"))
+    
+    # Как часто (сек) перечитывать каталог сотрудников: его меняет и migrate_employees.py
+    # из отдельного процесса; 0 — только при старте
+    EMPLOYEE_CACHE_TTL: float = float(os.getenv("EMPLOYEE_CACHE_TTL", "60"))
+    
+    # Перенос оплаченных заявок старше N дней в архив; 0 — не архивировать
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+    ARCHIVE_INTERVAL_MINUTES: int = int(os.getenv("ARCHIVE_INTERVAL_MINUTES", "60"))
+    
+    # Лимиты исходящих сообщений (Telegram: ~30/с на бота, 1/с в личный чат, 20/мин в группу)
+    OUTBOUND_GLOBAL_RATE: float = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+    OUTBOUND_PRIVATE_RATE: float = float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))
+    OUTBOUND_GROUP_RATE_PER_MINUTE: float = float(os.getenv("OUTBOUND_GROUP_RATE_PER_MINUTE", "20"))
+    
+    # HTTP-эндпоинт /metrics в формате Prometheus; 0 — выключен
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    
+    # Вебхук вместо long polling: публичный адрес (https://bot.example.com); пусто — polling
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    # Сколько апдейтов обрабатывается одновременно и сколько может ждать в очереди
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "16"))
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+    
     @classmethod
     def validate(cls) -> bool:
         if not cls.BOT_TOKEN:
@@ -25,6 +77,25 @@ class Config:
             raise ValueError("ADMIN_ID не установлен в .env файле")
         if not cls.GROUP_CHAT_ID:
             raise ValueError("GROUP_CHAT_ID не установлен в .env файле")
+        if cls.STORAGE_BACKEND not in ("sqlite", "memory"):
+            raise ValueError(f"Неизвестный STORAGE_BACKEND: {cls.STORAGE_BACKEND} (sqlite или memory)")
+        if min(cls.OUTBOUND_GLOBAL_RATE, cls.OUTBOUND_PRIVATE_RATE, cls.OUTBOUND_GROUP_RATE_PER_MINUTE) <= 0:
+            raise ValueError("Лимиты OUTBOUND_* должны быть больше нуля")
+        if not 0 <= cls.METRICS_PORT <= 65535:
+            raise ValueError(f"Некорректный METRICS_PORT: {cls.METRICS_PORT}")
+        if cls.FSM_CACHE_SIZE <= 0 or cls.FSM_FLUSH_INTERVAL_MS < 0:
+            raise ValueError("FSM_CACHE_SIZE должен быть больше нуля, FSM_FLUSH_INTERVAL_MS — не меньше нуля")
+        if cls.WEBHOOK_URL:
+            if not cls.WEBHOOK_URL.startswith("https://"):
+                raise ValueError("WEBHOOK_URL должен начинаться с https://")
+            if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", cls.WEBHOOK_SECRET):
+                raise ValueError("WEBHOOK_SECRET обязателен для вебхука: 1-256 символов A-Z, a-z, 0-9, _ и -")
+            if not cls.WEBHOOK_PATH.startswith("/"):
+                raise ValueError(f"WEBHOOK_PATH должен начинаться с /: {cls.WEBHOOK_PATH}")
+            if not 0 < cls.WEBHOOK_PORT <= 65535:
+                raise ValueError(f"Некорректный WEBHOOK_PORT: {cls.WEBHOOK_PORT}")
+            if min(cls.WEBHOOK_WORKERS, cls.WEBHOOK_QUEUE_SIZE) <= 0:
+                raise ValueError("WEBHOOK_WORKERS и WEBHOOK_QUEUE_SIZE должны быть больше нуля")
         return True
     
     @classmethod
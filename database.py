@@ -1,114 +1,551 @@
+import asyncio
 import aiosqlite
+import json
 import logging
-from typing import List, Optional
-from models import Payment
-from datetime import datetime
+import time
+from dataclasses import fields
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+from models import FSMRecord, OutboxMessage, Payment
+from migrations import apply_migrations
+from storage import EmployeeRow, decode_cursor, encode_cursor
+from metrics import QueryMetrics, TimedConnection, detach_call, instrument
+from datetime import datetime, timedelta, timezone
 from contextlib import asynccontextmanager
+from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[T]]
 
-class Database:
+
+def to_epoch_ms(value: datetime) -> int:
+    """Миллисекунды UTC от эпохи; наивное время считается местным, как у datetime.now()"""
+    return round(value.timestamp() * 1000)
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, int):
+        # Местное наивное время, как и у моделей; миллисекунды без потерь на float
+        return datetime.fromtimestamp(value // 1000) + timedelta(milliseconds=value % 1000)
+    # ISO-текст остаётся в базах, которые ещё не прошли migrate_timestamps_to_epoch()
+    return datetime.fromisoformat(value)
+
+
+def _as_epoch_ms(value: Any) -> Optional[int]:
+    """Значение колонки времени (миллисекунды или старый ISO-текст) в миллисекундах"""
+    if value is None or isinstance(value, int):
+        return value
+    return to_epoch_ms(_parse_timestamp(value))
+
+
+def _payment_page_cursor(row: aiosqlite.Row) -> str:
+    """
+    Токен страницы заявок из хранимого ключа, а не из разобранного datetime.
+    
+    Токены идут в callback_data кнопок (до 64 байт). Старая ISO-метка туда
+    не помещается, поэтому для таких строк в токене остаётся только id.
+    """
+    created_at = row['created_at']
+    return encode_cursor(created_at if isinstance(created_at, int) else None, row['id'])
+
+
+def _utc_day(epoch_ms: int) -> str:
+    return datetime.fromtimestamp(epoch_ms // 1000, timezone.utc).date().isoformat()
+
+
+# День выплаты (UTC) для строк обоих форматов: миллисекунды или местный ISO-текст
+PAID_DAY_SQL = (
+    "CASE typeof(paid_at) WHEN 'integer' THEN date(paid_at / 1000, 'unixepoch') "
+    "ELSE date(paid_at, 'utc') END"
+)
+
+# Колонки времени, которые migrate_timestamps_to_epoch() переводит в миллисекунды
+TIMESTAMP_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "payments": ("created_at", "paid_at"),
+    "payments_archive": ("created_at", "paid_at", "archived_at"),
+    "employees": ("added_at",),
+}
+
+
+# Колонки заявки в явном порядке: в старых базах часть из них добавлена через ALTER
+PAYMENT_COLUMNS = (
+    "id, employee_id, employee_username, employee_first_name, balance, username_field, "
+    "screenshot_file_id, status, payment_amount, replied, employee_message_id, created_at, paid_at"
+)
+
+
+class PaymentMapper:
+    """
+    Собирает Payment из строк результата по позициям колонок.
+    
+    Раскладка колонок разбирается один раз на запрос (и кэшируется по
+    набору имён), поэтому на строку не тратится ни row.keys(), ни поиск
+    по имени. Колонки, которых нет в результате, получают значения по
+    умолчанию модели.
+    """
+    
+    FIELDS: Tuple[str, ...] = tuple(f.name for f in fields(Payment))
+    _CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+        "replied": bool,
+        "created_at": _parse_timestamp,
+        "paid_at": _parse_timestamp,
+    }
+    _cache: Dict[Tuple[str, ...], "PaymentMapper"] = {}
+    
+    def __init__(self, columns: Sequence[str]):
+        position = {name: i for i, name in enumerate(columns)}
+        defaults = Payment.__dataclass_fields__
+        plan = []
+        for name in self.FIELDS:
+            converter = self._CONVERTERS.get(name)
+            if name in position:
+                plan.append((position[name], converter, None))
+            else:
+                default = defaults[name].default
+                plan.append((None, None, converter(default) if converter and default is not None else default))
+        self._plan = tuple(plan)
+    
+    @classmethod
+    def for_columns(cls, columns: Sequence[str]) -> "PaymentMapper":
+        key = tuple(columns)
+        mapper = cls._cache.get(key)
+        if mapper is None:
+            mapper = cls._cache[key] = cls(key)
+        return mapper
+    
+    @classmethod
+    def for_cursor(cls, cursor) -> "PaymentMapper":
+        return cls.for_columns([column[0] for column in cursor.description])
+    
+    def __call__(self, row: Sequence[Any]) -> Payment:
+        return Payment(*[
+            (row[pos] if converter is None else converter(row[pos])) if pos is not None else default
+            for pos, converter, default in self._plan
+        ])
+    
+    def map_all(self, rows: Iterable[Sequence[Any]]) -> List[Payment]:
+        return [self(row) for row in rows]
+
+
+class EmployeeDirectory:
+    """
+    Каталог активных сотрудников в памяти процесса (user_id -> имя).
+    
+    Загружается из БД целиком и дальше поддерживается сквозной записью
+    из add_employee/remove_employee, так что проверки доступа не делают
+    I/O. max_staleness (секунды) задаёт, как часто перечитывать таблицу,
+    если её меняют другие процессы; None — не перечитывать.
+    """
+    
+    def __init__(self, max_staleness: Optional[float] = None):
+        self.max_staleness = max_staleness
+        self._names: Dict[int, Optional[str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._journal: Optional[List[Tuple[int, Optional[str], bool]]] = None
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
     
-    def __init__(self, db_path: str = "bot_database.db"):
+    @property
+    def is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        return self.max_staleness is None or time.monotonic() - self._loaded_at < self.max_staleness
+    
+    def begin_load(self) -> None:
+        # Изменения, пришедшие во время чтения таблицы, применяются поверх снимка
+        self._journal = []
+    
+    def finish_load(self, rows: Iterable[Tuple[int, Optional[str]]]) -> None:
+        names = dict(rows)
+        for user_id, first_name, active in self._journal or ():
+            if active:
+                names[user_id] = first_name
+            else:
+                names.pop(user_id, None)
+        self._names = names
+        self._journal = None
+        self._loaded_at = time.monotonic()
+    
+    def abort_load(self) -> None:
+        self._journal = None
+    
+    def put(self, user_id: int, first_name: Optional[str]) -> None:
+        self._names[user_id] = first_name
+        if self._journal is not None:
+            self._journal.append((user_id, first_name, True))
+    
+    def discard(self, user_id: int) -> None:
+        self._names.pop(user_id, None)
+        if self._journal is not None:
+            self._journal.append((user_id, None, False))
+    
+    def name(self, user_id: int) -> Optional[str]:
+        return self._names.get(user_id)
+    
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._names
+    
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+class ReadPool:
+    """
+    Пул соединений только для чтения (mode=ro, PRAGMA query_only).
+    
+    В режиме WAL читатели не ждут писателя и друг друга, поэтому тяжёлая
+    выборка не задерживает фиксацию оплат. Соединения открываются по
+    требованию, не больше size. query_timeout (секунды) ограничивает одно
+    обращение к пулу: зависший запрос прерывается через progress handler
+    SQLite и завершается ошибкой "interrupted".
+    """
+    
+    def __init__(
+        self,
+        open_connection: Callable[[], Awaitable[aiosqlite.Connection]],
+        size: int = 4,
+        query_timeout: Optional[float] = None
+    ):
+        self.size = max(1, size)
+        self.query_timeout = query_timeout
+        self._open_connection = open_connection
+        self._connections: List[aiosqlite.Connection] = []
+        self._idle: List[aiosqlite.Connection] = []
+        self._opening = 0
+        self._deadlines: Dict[aiosqlite.Connection, Optional[float]] = {}
+        self._available: Optional[asyncio.Condition] = None
+        self._trace: Optional[Callable[[str], None]] = None
+    
+    def _condition(self) -> asyncio.Condition:
+        if self._available is None:
+            self._available = asyncio.Condition()
+        return self._available
+    
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await self._open_connection()
+        
+        def expired() -> int:
+            # Вызывается из потока соединения каждые N шагов виртуальной машины SQLite
+            deadline = self._deadlines.get(conn)
+            return 1 if deadline is not None and time.monotonic() > deadline else 0
+        
+        await conn.set_progress_handler(expired, 1000)
+        if self._trace is not None:
+            await conn.set_trace_callback(self._trace)
+        return conn
+    
+    async def acquire(self, timeout: Optional[float] = None) -> aiosqlite.Connection:
+        available = self._condition()
+        async with available:
+            while not self._idle and len(self._connections) + self._opening >= self.size:
+                await available.wait()
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                conn = None
+                self._opening += 1
+        
+        if conn is None:
+            try:
+                conn = await self._connect()
+            finally:
+                async with available:
+                    self._opening -= 1
+                    if conn is not None:
+                        self._connections.append(conn)
+                    available.notify()
+        
+        self._deadlines[conn] = time.monotonic() + timeout if timeout else None
+        return conn
+    
+    async def release(self, conn: aiosqlite.Connection) -> None:
+        self._deadlines[conn] = None
+        available = self._condition()
+        async with available:
+            if conn in self._connections:
+                self._idle.append(conn)
+            available.notify()
+    
+    async def set_trace_callback(self, callback: Optional[Callable[[str], None]]) -> None:
+        self._trace = callback
+        for conn in self._connections:
+            await conn.set_trace_callback(callback)
+    
+    async def close(self) -> None:
+        connections, self._connections, self._idle = self._connections, [], []
+        self._deadlines.clear()
+        for conn in connections:
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.warning(f"Failed to close read connection: {e}")
+
+
+# Замер времени каждого метода; служебные методы соединения не замеряются
+@instrument(exclude=("connect", "set_trace_callback"))
+class Database:
+
+    def __init__(
+        self,
+        db_path: str = "bot_database.db",
+        busy_timeout_ms: int = 5000,
+        cache_size_kib: int = 16384,
+        mmap_size: int = 64 * 1024 * 1024,
+        write_behind: bool = False,
+        flush_interval: float = 0.005,
+        flush_max_batch: int = 64,
+        employee_cache_ttl: Optional[float] = None,
+        read_pool_size: int = 4,
+        read_timeout: Optional[float] = None,
+        slow_query_threshold: Optional[float] = 0.2
+    ):
         self.db_path = db_path
-        self._connection = None
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_max_batch = max(1, flush_max_batch)
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.employees = EmployeeDirectory(employee_cache_ttl)
+        self._directory_lock: Optional[asyncio.Lock] = None
+        # База в памяти видна только своему соединению: тогда читаем через писателя
+        in_memory = db_path == ":memory:" or "mode=memory" in db_path
+        self._read_pool: Optional[ReadPool] = (
+            ReadPool(self._open_reader, read_pool_size, read_timeout)
+            if read_pool_size > 0 and not in_memory else None
+        )
+        self.metrics = QueryMetrics(slow_query_threshold)
+        self._timed: Dict[aiosqlite.Connection, TimedConnection] = {}
+    
+    async def connect(self) -> aiosqlite.Connection:
+        """Открыть долгоживущее соединение (один раз на процесс)"""
+        if self._connection is not None:
+            return self._timed_connection(self._connection)
+        
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        
+        async with self._connect_lock:
+            if self._connection is None:
+                try:
+                    conn = await aiosqlite.connect(self.db_path)
+                    conn.row_factory = aiosqlite.Row
+                    await self._configure_connection(conn)
+                except Exception as e:
+                    logger.error(f"Database connection error: {e}")
+                    raise
+                self._connection = conn
+                logger.info(f"Database connection opened: {self.db_path}")
+        return self._timed_connection(self._connection)
+    
+    def _timed_connection(self, conn: aiosqlite.Connection) -> TimedConnection:
+        # Одна обёртка на соединение: вызывающий код может сравнивать соединения по is
+        timed = self._timed.get(conn)
+        if timed is None:
+            timed = self._timed[conn] = TimedConnection(conn, self.metrics)
+        return timed
+    
+    async def _configure_connection(self, conn: aiosqlite.Connection) -> None:
+        # Действует только для новой (пустой) базы; существующую переводит vacuum_full()
+        await conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await conn.execute("PRAGMA journal_mode = WAL")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        await conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        await conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        await conn.execute("PRAGMA temp_store = MEMORY")
     
     @asynccontextmanager
-    async def get_connection(self):
-        conn = None
+    async def get_connection(self, stream: bool = False):
+        """
+        Соединение для чтения из пула; запись идёт через transaction().
+        
+        stream=True снимает ограничение по времени — для потоковых выборок,
+        которые держат соединение, пока потребитель перебирает строки.
+        """
+        writer = await self.connect()
+        if self._read_pool is None:
+            yield writer
+            return
+        conn = await self._read_pool.acquire(None if stream else self._read_pool.query_timeout)
         try:
-            conn = await aiosqlite.connect(self.db_path)
-            conn.row_factory = aiosqlite.Row
-            yield conn
-        except Exception as e:
-            logger.error(f"Database connection error: {e}")
-            raise
+            yield self._timed_connection(conn)
         finally:
-            if conn:
-                await conn.close()
+            await self._read_pool.release(conn)
     
+    async def _open_reader(self) -> aiosqlite.Connection:
+        uri = f"{Path(self.db_path).absolute().as_uri()}?mode=ro"
+        conn = await aiosqlite.connect(uri, uri=True)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA query_only = 1")
+        await conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        await conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        await conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        await conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
     
-    async def init_db(self):
+    async def set_trace_callback(self, callback: Optional[Callable[[str], None]]) -> None:
+        """Трассировка SQL на всех соединениях (писатель и пул чтения); None — выключить"""
+        conn = await self.connect()
+        await conn.set_trace_callback(callback)
+        if self._read_pool is not None:
+            await self._read_pool.set_trace_callback(callback)
+    
+    def _get_write_lock(self) -> asyncio.Lock:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """Транзакция записи: сериализуется, фиксируется или откатывается целиком"""
+        conn = await self.connect()
+        async with self._get_write_lock():
+            try:
+                yield conn
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+    
+    async def _write(self, op: WriteOp) -> T:
+        """
+        Выполнить мутацию в транзакции.
+        
+        В режиме write-behind мутация ставится в очередь и фиксируется
+        одной транзакцией вместе с соседними (group commit); вызывающий
+        получает результат только после фиксации своей пачки.
+        """
+        if not self.write_behind:
+            async with self.transaction() as conn:
+                return await op(conn)
+        
+        if self._flusher is None or self._flusher.done():
+            self._write_queue = asyncio.Queue()
+            self._flusher = asyncio.create_task(self._flush_loop())
+        
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((op, future))
+        return await future
+    
+    async def _flush_loop(self) -> None:
+        # Задача создаётся из первого вызова _write, но пишет за всех вызывающих
+        detach_call()
+        loop = asyncio.get_running_loop()
+        queue = self._write_queue
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_max_batch:
+                if queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit_batch(batch)
+    
+    async def _commit_batch(self, batch: List[Tuple[WriteOp, asyncio.Future]]) -> None:
         try:
-            async with self.get_connection() as db:
-                # Таблица сотрудников
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS employees (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        added_at TIMESTAMP NOT NULL,
-                        added_by INTEGER NOT NULL,
-                        is_active INTEGER DEFAULT 1
-                    )
-                """)
-                
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS payments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        employee_id INTEGER NOT NULL,
-                        employee_username TEXT,
-                        balance TEXT NOT NULL,
-                        username_field TEXT NOT NULL,
-                        screenshot_file_id TEXT NOT NULL,
-                        status TEXT NOT NULL DEFAULT 'pending',
-                        payment_amount INTEGER,
-                        replied INTEGER DEFAULT 0,
-                        employee_message_id INTEGER,
-                        created_at TIMESTAMP NOT NULL,
-                        paid_at TIMESTAMP
-                    )
-                """)
-                
-                await db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_employee_status 
-                    ON payments(employee_id, status)
-                """)
-                await db.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_status 
-                    ON payments(status)
-                """)
-                
-                try:
-                    await db.execute("ALTER TABLE payments ADD COLUMN replied INTEGER DEFAULT 0")
-                except:
-                    pass
-                try:
-                    await db.execute("ALTER TABLE payments ADD COLUMN employee_message_id INTEGER")
-                except:
-                    pass
+            async with self.transaction() as conn:
+                results = [await op(conn) for op, _ in batch]
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            # Одна сбойная мутация не должна откатывать соседей по пачке
+            logger.warning(f"Group commit of {len(batch)} writes failed, retrying one by one: {e}")
+            for op, future in batch:
                 try:
-                    await db.execute("ALTER TABLE payments ADD COLUMN employee_first_name TEXT")
-                except:
-                    pass
-                    
-                await db.commit()
-                logger.info("Database initialized successfully")
+                    async with self.transaction() as conn:
+                        result = await op(conn)
+                except Exception as single_error:
+                    if not future.done():
+                        future.set_exception(single_error)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def _stop_flusher(self) -> None:
+        if self._flusher is None:
+            return
+        if not self._flusher.done():
+            self._write_queue.put_nowait(None)
+            await self._flusher
+        self._flusher = None
+        self._write_queue = None
+    
+    
+    async def init_db(self):
+        try:
+            conn = await self.connect()
+            async with self._get_write_lock():
+                version = await apply_migrations(conn)
+            await self.reload_employee_directory()
+            logger.info(f"Database initialized successfully (schema v{version})")
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
             raise
     
     
+    _INSERT_PAYMENT = """
+        INSERT INTO payments (
+            employee_id, employee_username, employee_first_name, balance, username_field,
+            screenshot_file_id, status, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    
+    @staticmethod
+    def _payment_params(payment: Payment) -> tuple:
+        return (
+            payment.employee_id,
+            payment.employee_username,
+            payment.employee_first_name,
+            payment.balance,
+            payment.username_field,
+            payment.screenshot_file_id,
+            payment.status,
+            to_epoch_ms(payment.created_at) if payment.created_at else now_ms()
+        )
+    
     async def create_payment(self, payment: Payment) -> int:
         try:
-            async with self.get_connection() as db:
-                cursor = await db.execute("""
-                    INSERT INTO payments (
-                        employee_id, employee_username, employee_first_name, balance, username_field,
-                        screenshot_file_id, status, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    payment.employee_id,
-                    payment.employee_username,
-                    payment.employee_first_name,
-                    payment.balance,
-                    payment.username_field,
-                    payment.screenshot_file_id,
-                    payment.status,
-                    payment.created_at
-                ))
-                await db.commit()
+            async with self.transaction() as db:
+                cursor = await db.execute(self._INSERT_PAYMENT, self._payment_params(payment))
                 payment_id = cursor.lastrowid
                 logger.info(f"Created payment request #{payment_id} for user {payment.employee_id}")
                 return payment_id
@@ -116,6 +553,20 @@ class Database:
             logger.error(f"Failed to create payment: {e}")
             raise
     
+    async def create_payments_many(self, payments: Iterable[Payment]) -> int:
+        """Создать пачку заявок одной транзакцией; возвращает число созданных"""
+        params = [self._payment_params(payment) for payment in payments]
+        if not params:
+            return 0
+        try:
+            async with self.transaction() as db:
+                await db.executemany(self._INSERT_PAYMENT, params)
+            logger.info(f"Created {len(params)} payment requests in bulk")
+            return len(params)
+        except Exception as e:
+            logger.error(f"Failed to bulk-create {len(params)} payments: {e}")
+            raise
+    
     
     async def get_payment_by_id(self, payment_id: int) -> Optional[Payment]:
         try:
@@ -125,22 +576,15 @@ class Database:
                     (payment_id,)
                 )
                 row = await cursor.fetchone()
-                if row:
-                    return Payment(
-                        id=row['id'],
-                        employee_id=row['employee_id'],
-                        employee_username=row['employee_username'],
-                        employee_first_name=row['employee_first_name'] if 'employee_first_name' in row.keys() else None,
-                        balance=row['balance'],
-                        username_field=row['username_field'],
-                        screenshot_file_id=row['screenshot_file_id'],
-                        status=row['status'],
-                        payment_amount=row['payment_amount'],
-                        replied=bool(row['replied']) if 'replied' in row.keys() else False,
-                        employee_message_id=row['employee_message_id'] if 'employee_message_id' in row.keys() else None,
-                        created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None,
-                        paid_at=datetime.fromisoformat(row['paid_at']) if row['paid_at'] else None
+                if row is None:
+                    # Старые рассчитанные заявки лежат в архиве
+                    cursor = await db.execute(
+                        f"SELECT {PAYMENT_COLUMNS} FROM payments_archive WHERE id = ?",
+                        (payment_id,)
                     )
+                    row = await cursor.fetchone()
+                if row:
+                    return PaymentMapper.for_cursor(cursor)(row)
                 return None
         except Exception as e:
             logger.error(f"Failed to get payment #{payment_id}: {e}")
@@ -155,126 +599,612 @@ class Database:
                     (employee_id,)
                 )
                 rows = await cursor.fetchall()
-                payments = []
-                for row in rows:
-                    payments.append(Payment(
-                        id=row['id'],
-                        employee_id=row['employee_id'],
-                        employee_username=row['employee_username'],
-                        employee_first_name=row['employee_first_name'] if 'employee_first_name' in row.keys() else None,
-                        balance=row['balance'],
-                        username_field=row['username_field'],
-                        screenshot_file_id=row['screenshot_file_id'],
-                        status=row['status'],
-                        payment_amount=row['payment_amount'],
-                        replied=bool(row['replied']) if 'replied' in row.keys() else False,
-                        employee_message_id=row['employee_message_id'] if 'employee_message_id' in row.keys() else None,
-                        created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None,
-                        paid_at=datetime.fromisoformat(row['paid_at']) if row['paid_at'] else None
-                    ))
-                return payments
+                return PaymentMapper.for_cursor(cursor).map_all(rows)
         except Exception as e:
             logger.error(f"Failed to get pending payments for user {employee_id}: {e}")
             return []
     
-    
-    async def update_payment_status(self, payment_id: int, status: str, payment_amount: int) -> None:
+    async def get_user_pending_payments_page(
+        self,
+        employee_id: int,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        newer: bool = False
+    ) -> Tuple[List[Payment], Optional[str], Optional[str]]:
+        """
+        Страница ожидающих заявок сотрудника (новые первыми).
+        
+        Возвращает заявки и токены соседних страниц: более старых и более
+        новых (None — в эту сторону страниц нет). Пагинация по ключу
+        (created_at, id), поэтому стоимость страницы не зависит от её номера.
+        С newer=True берутся заявки новее курсора (ближайшие к нему, для
+        кнопки "назад"). Наличие страниц проверяется только в направлении
+        запроса: токен обратной стороны может привести к пустой странице.
+        """
         try:
+            params: List[Any] = [employee_id]
+            after = ""
+            order = "ASC" if newer else "DESC"
+            
             async with self.get_connection() as db:
-                await db.execute(
-                    "UPDATE payments SET status = ?, payment_amount = ?, paid_at = ? WHERE id = ?",
-                    (status, payment_amount, datetime.now(), payment_id)
+                if cursor:
+                    created_at, row_id = decode_cursor(cursor)
+                    if created_at is None:
+                        # Токен без времени (заявка со старой ISO-меткой): ключ берётся из строки.
+                        # Если её уже нет, страница пуста, и бот покажет первую
+                        lookup = await db.execute("SELECT created_at FROM payments WHERE id = ?", (row_id,))
+                        anchor = await lookup.fetchone()
+                        created_at = anchor['created_at'] if anchor else None
+                    after = f"AND (created_at, id) {'>' if newer else '<'} (?, ?)"
+                    params.extend((created_at, row_id))
+                params.append(limit + 1)
+                result = await db.execute(
+                    f"""SELECT * FROM payments
+                        WHERE employee_id = ? AND status = 'pending' {after}
+                        ORDER BY created_at {order}, id {order}
+                        LIMIT ?""",
+                    params
                 )
-                await db.commit()
-                logger.info(f"Updated payment #{payment_id} to status '{status}' with amount {payment_amount}")
+                rows = await result.fetchall()
+                mapper = PaymentMapper.for_cursor(result)
+            
+            more = len(rows) > limit
+            rows = rows[:limit]
+            if newer:
+                rows.reverse()
+            older_cursor = newer_cursor = None
+            if rows and (newer or more):
+                older_cursor = _payment_page_cursor(rows[-1])
+            if rows and (more if newer else cursor):
+                newer_cursor = _payment_page_cursor(rows[0])
+            return mapper.map_all(rows), older_cursor, newer_cursor
+        except Exception as e:
+            logger.error(f"Failed to get pending payments page for user {employee_id}: {e}")
+            return [], None, None
+    
+    async def iter_user_pending_payments(self, employee_id: int, batch_size: int = 100) -> AsyncIterator[Payment]:
+        """Потоково перебрать ожидающие заявки сотрудника пачками по batch_size строк"""
+        async with self.get_connection(stream=True) as db:
+            result = await db.execute(
+                """SELECT * FROM payments
+                   WHERE employee_id = ? AND status = 'pending'
+                   ORDER BY created_at DESC, id DESC""",
+                (employee_id,)
+            )
+            try:
+                mapper = PaymentMapper.for_cursor(result)
+                while True:
+                    rows = await result.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield mapper(row)
+            finally:
+                await result.close()
+    
+    
+    async def update_payment_status(self, payment_id: int, status: str, payment_amount: int) -> None:
+        async def op(db: aiosqlite.Connection) -> None:
+            cursor = await db.execute(
+                "SELECT employee_id, employee_username, status, payment_amount, paid_at FROM payments WHERE id = ?",
+                (payment_id,)
+            )
+            previous = await cursor.fetchone()
+            paid_at = now_ms()
+            await db.execute(
+                "UPDATE payments SET status = ?, payment_amount = ?, paid_at = ? WHERE id = ?",
+                (status, payment_amount, paid_at, payment_id)
+            )
+            if previous is None:
+                return
+            # Дневные итоги правятся в той же транзакции, что и сама заявка
+            if previous['status'] == 'paid':
+                await self._add_to_rollup(
+                    db, _as_epoch_ms(previous['paid_at']), previous['employee_id'],
+                    previous['employee_username'], -1, -(previous['payment_amount'] or 0)
+                )
+            if status == 'paid':
+                await self._add_to_rollup(
+                    db, paid_at, previous['employee_id'],
+                    previous['employee_username'], 1, payment_amount or 0
+                )
+        
+        try:
+            await self._write(op)
+            logger.info(f"Updated payment #{payment_id} to status '{status}' with amount {payment_amount}")
         except Exception as e:
             logger.error(f"Failed to update payment #{payment_id} status: {e}")
             raise
     
-    async def update_payment_replied(self, payment_id: int) -> None:
+    async def settle_payment(self, payment_id: int, amount: int, notify: Sequence[str] = ()) -> Optional[Payment]:
+        """
+        Оплатить заявку, если она ещё ожидает оплаты.
+        
+        Проверка статуса и запись — один оператор UPDATE ... RETURNING, поэтому
+        два одновременных нажатия не могут оплатить заявку дважды. Возвращает
+        оплаченную заявку или None, если заявки нет или она уже оплачена.
+        
+        События notify попадают в outbox в той же транзакции: уведомления
+        об оплате не теряются, даже если процесс упадёт сразу после записи.
+        """
+        async def op(db: aiosqlite.Connection) -> Optional[Payment]:
+            paid_at = now_ms()
+            cursor = await db.execute(
+                f"""UPDATE payments SET status = 'paid', payment_amount = ?, paid_at = ?
+                    WHERE id = ? AND status = 'pending'
+                    RETURNING {PAYMENT_COLUMNS}""",
+                (amount, paid_at, payment_id)
+            )
+            rows = await cursor.fetchall()
+            if not rows:
+                return None
+            payment = PaymentMapper.for_cursor(cursor)(rows[0])
+            await self._add_to_rollup(db, paid_at, payment.employee_id, payment.employee_username, 1, amount or 0)
+            if notify:
+                await db.executemany(
+                    "INSERT INTO outbox (event, payment_id, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                    [(event, payment_id, paid_at, paid_at) for event in notify]
+                )
+            return payment
+        
+        try:
+            payment = await self._write(op)
+        except Exception as e:
+            logger.error(f"Failed to settle payment #{payment_id}: {e}")
+            raise
+        if payment is None:
+            logger.info(f"Payment #{payment_id} was not settled: not found or not pending")
+        else:
+            logger.info(f"Settled payment #{payment_id} with amount {amount}")
+        return payment
+    
+    @staticmethod
+    async def _add_to_rollup(
+        db: aiosqlite.Connection,
+        paid_at: Optional[int],
+        employee_id: int,
+        employee_username: Optional[str],
+        count: int,
+        amount: int
+    ) -> None:
+        if paid_at is None:
+            return
+        await db.execute("""
+            INSERT INTO payment_daily_rollup (day, employee_id, employee_username, paid_count, paid_amount)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(day, employee_id) DO UPDATE SET
+                paid_count = paid_count + excluded.paid_count,
+                paid_amount = paid_amount + excluded.paid_amount,
+                employee_username = COALESCE(excluded.employee_username, employee_username)
+        """, (_utc_day(paid_at), employee_id, employee_username, count, amount))
+    
+    # Очередь уведомлений (outbox)
+    
+    async def get_due_outbox(self, limit: int = 50) -> List[OutboxMessage]:
+        """Уведомления, которые пора отправить (старые первыми)"""
         try:
             async with self.get_connection() as db:
-                await db.execute(
-                    "UPDATE payments SET replied = 1 WHERE id = ?",
-                    (payment_id,)
+                cursor = await db.execute(
+                    """SELECT id, event, payment_id, attempts, last_error FROM outbox
+                       WHERE failed_at IS NULL AND next_attempt_at <= ?
+                       ORDER BY next_attempt_at LIMIT ?""",
+                    (now_ms(), limit)
                 )
-                await db.commit()
-                logger.info(f"Updated payment #{payment_id} replied status")
+                return [OutboxMessage(*row) for row in await cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Failed to read outbox: {e}")
+            return []
+    
+    async def complete_outbox(self, outbox_id: int) -> None:
+        """Уведомление доставлено: удалить из очереди"""
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+        
+        try:
+            await self._write(op)
+        except Exception as e:
+            logger.error(f"Failed to complete outbox entry #{outbox_id}: {e}")
+            raise
+    
+    async def retry_outbox(self, outbox_id: int, delay: float, error: str) -> None:
+        """Отложить уведомление на delay секунд после неудачной попытки"""
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (now_ms() + int(delay * 1000), error, outbox_id)
+            )
+        
+        try:
+            await self._write(op)
+        except Exception as e:
+            logger.error(f"Failed to reschedule outbox entry #{outbox_id}: {e}")
+            raise
+    
+    async def fail_outbox(self, outbox_id: int, error: str) -> None:
+        """Прекратить попытки: запись остаётся в таблице для разбора"""
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, failed_at = ?, last_error = ? WHERE id = ?",
+                (now_ms(), error, outbox_id)
+            )
+        
+        try:
+            await self._write(op)
+            logger.warning(f"Outbox entry #{outbox_id} abandoned: {error}")
+        except Exception as e:
+            logger.error(f"Failed to mark outbox entry #{outbox_id} as failed: {e}")
+            raise
+    
+    async def rebuild_payment_rollup(self) -> int:
+        """Пересчитать дневные итоги с нуля по заявкам и архиву; возвращает число строк итогов"""
+        try:
+            async with self.transaction() as db:
+                await db.execute("DELETE FROM payment_daily_rollup")
+                cursor = await db.execute(f"""
+                    INSERT INTO payment_daily_rollup (day, employee_id, employee_username, paid_count, paid_amount)
+                    SELECT {PAID_DAY_SQL}, employee_id, MAX(employee_username), COUNT(*), COALESCE(SUM(payment_amount), 0)
+                    FROM (
+                        SELECT paid_at, employee_id, employee_username, payment_amount
+                        FROM payments
+                        WHERE status = 'paid' AND paid_at IS NOT NULL
+                        UNION ALL
+                        SELECT paid_at, employee_id, employee_username, payment_amount
+                        FROM payments_archive
+                        WHERE status = 'paid' AND paid_at IS NOT NULL
+                    )
+                    GROUP BY {PAID_DAY_SQL}, employee_id
+                """)
+                rows = cursor.rowcount
+            logger.info(f"Rebuilt payment rollup: {rows} rows")
+            return rows
+        except Exception as e:
+            logger.error(f"Failed to rebuild payment rollup: {e}")
+            raise
+    
+    async def update_payment_replied(self, payment_id: int) -> None:
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute(
+                "UPDATE payments SET replied = 1 WHERE id = ?",
+                (payment_id,)
+            )
+        
+        try:
+            await self._write(op)
+            logger.info(f"Updated payment #{payment_id} replied status")
         except Exception as e:
             logger.error(f"Failed to update payment #{payment_id} replied status: {e}")
             raise
     
     async def update_employee_message_id(self, payment_id: int, message_id: int) -> None:
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute(
+                "UPDATE payments SET employee_message_id = ? WHERE id = ?",
+                (message_id, payment_id)
+            )
+        
         try:
-            async with self.get_connection() as db:
-                await db.execute(
-                    "UPDATE payments SET employee_message_id = ? WHERE id = ?",
-                    (message_id, payment_id)
-                )
-                await db.commit()
+            await self._write(op)
         except Exception as e:
             logger.error(f"Failed to update employee message ID for payment #{payment_id}: {e}")
             raise
     
     async def delete_payment(self, payment_id: int, employee_id: int) -> bool:
         try:
-            async with self.get_connection() as db:
+            async with self.transaction() as db:
                 cursor = await db.execute(
                     "DELETE FROM payments WHERE id = ? AND employee_id = ? AND status = 'pending'",
                     (payment_id, employee_id)
                 )
-                await db.commit()
                 success = cursor.rowcount > 0
                 if success:
+                    await db.execute("DELETE FROM payment_admin_messages WHERE payment_id = ?", (payment_id,))
                     logger.info(f"Deleted payment #{payment_id} for user {employee_id}")
                 return success
         except Exception as e:
             logger.error(f"Failed to delete payment #{payment_id}: {e}")
             return False
     
-    async def get_statistics(self, days: int = 30) -> dict:
+    async def add_admin_message(self, payment_id: int, chat_id: int, message_id: int) -> None:
+        """Запомнить копию карточки заявки, отправленную администратору"""
+        async def op(db: aiosqlite.Connection) -> None:
+            await db.execute(
+                """INSERT INTO payment_admin_messages (payment_id, chat_id, message_id) VALUES (?, ?, ?)
+                   ON CONFLICT (payment_id, chat_id) DO UPDATE SET message_id = excluded.message_id""",
+                (payment_id, chat_id, message_id)
+            )
+        
+        try:
+            await self._write(op)
+        except Exception as e:
+            logger.error(f"Failed to save admin message for payment #{payment_id}: {e}")
+            raise
+    
+    async def get_admin_messages(self, payment_id: int) -> List[Tuple[int, int]]:
+        """Все копии карточки заявки: (chat_id, message_id)"""
+        try:
+            async with self.get_connection() as db:
+                cursor = await db.execute(
+                    "SELECT chat_id, message_id FROM payment_admin_messages WHERE payment_id = ?",
+                    (payment_id,)
+                )
+                return [(chat_id, message_id) for chat_id, message_id in await cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Failed to get admin messages for payment #{payment_id}: {e}")
+            return []
+    
+    async def get_fsm_record(self, chat_id: int, user_id: int, scope: str) -> Optional[FSMRecord]:
+        """Состояние и данные FSM по ключу; None, если записи нет"""
         try:
             async with self.get_connection() as db:
                 cursor = await db.execute(
-                    """SELECT COUNT(*) as total, SUM(payment_amount) as total_amount
-                       FROM payments 
-                       WHERE status = 'paid' 
-                       AND paid_at >= datetime('now', '-' || ? || ' days')""",
-                    (days,)
+                    "SELECT state, data, updated_at FROM fsm_state WHERE chat_id = ? AND user_id = ? AND scope = ?",
+                    (chat_id, user_id, scope)
                 )
                 row = await cursor.fetchone()
-                
+                if row is None:
+                    return None
+                return FSMRecord(chat_id, user_id, scope, row[0], json.loads(row[1]), row[2])
+        except Exception as e:
+            logger.error(f"Failed to get FSM record for chat {chat_id}, user {user_id}: {e}")
+            return None
+    
+    async def save_fsm_records(self, records: Iterable[FSMRecord]) -> None:
+        """
+        Записать пачку состояний FSM одной транзакцией.
+        Запись без состояния и данных удаляется (state.clear()).
+        """
+        upserts = []
+        deletes = []
+        for record in records:
+            key = (record.chat_id, record.user_id, record.scope)
+            if record.state is None and not record.data:
+                deletes.append(key)
+            else:
+                upserts.append(key + (record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at))
+        
+        async def op(db: aiosqlite.Connection) -> None:
+            if upserts:
+                await db.executemany(
+                    """INSERT INTO fsm_state (chat_id, user_id, scope, state, data, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (chat_id, user_id, scope) DO UPDATE SET
+                           state = excluded.state, data = excluded.data, updated_at = excluded.updated_at""",
+                    upserts
+                )
+            if deletes:
+                await db.executemany(
+                    "DELETE FROM fsm_state WHERE chat_id = ? AND user_id = ? AND scope = ?",
+                    deletes
+                )
+        
+        try:
+            await self._write(op)
+        except Exception as e:
+            logger.error(f"Failed to save {len(upserts) + len(deletes)} FSM records: {e}")
+            raise
+    
+    async def purge_fsm_records(self, max_idle: float) -> int:
+        """Удалить диалоги FSM, не менявшиеся дольше max_idle секунд; возвращает число удалённых"""
+        async def op(db: aiosqlite.Connection) -> int:
+            cursor = await db.execute(
+                "DELETE FROM fsm_state WHERE updated_at < ?",
+                (now_ms() - int(max_idle * 1000),)
+            )
+            return cursor.rowcount
+        
+        try:
+            purged = await self._write(op)
+            if purged:
+                logger.info(f"Purged {purged} abandoned FSM records")
+            return purged
+        except Exception as e:
+            logger.error(f"Failed to purge FSM records: {e}")
+            raise
+    
+    async def get_fsm_state_counts(self, max_idle: Optional[float] = None) -> Dict[str, int]:
+        """Число диалогов в каждом состоянии (без брошенных дольше max_idle секунд)"""
+        since = now_ms() - int(max_idle * 1000) if max_idle else 0
+        try:
+            async with self.get_connection() as db:
+                cursor = await db.execute(
+                    """SELECT state, COUNT(*) FROM fsm_state
+                       WHERE state IS NOT NULL AND updated_at >= ?
+                       GROUP BY state""",
+                    (since,)
+                )
+                return {state: count for state, count in await cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Failed to count FSM states: {e}")
+            return {}
+    
+    async def archive_settled_payments(self, older_than_days: int, batch_size: int = 500) -> int:
+        """
+        Перенести оплаченные заявки старше older_than_days дней в payments_archive.
+        
+        Переносит пачками по batch_size, каждая пачка — отдельная короткая
+        транзакция, чтобы не задерживать нажатия администраторов.
+        Возвращает число перенесённых заявок.
+        """
+        cutoff = now_ms() - older_than_days * 86_400_000
+        moved = 0
+        try:
+            while True:
+                async with self.transaction() as db:
+                    cursor = await db.execute(
+                        """SELECT id FROM payments
+                           WHERE status = 'paid' AND paid_at < ?
+                           ORDER BY paid_at
+                           LIMIT ?""",
+                        (cutoff, batch_size)
+                    )
+                    ids = [row[0] for row in await cursor.fetchall()]
+                    if ids:
+                        placeholders = ", ".join("?" * len(ids))
+                        await db.execute(
+                            f"""INSERT INTO payments_archive ({PAYMENT_COLUMNS}, archived_at)
+                                SELECT {PAYMENT_COLUMNS}, ? FROM payments WHERE id IN ({placeholders})""",
+                            (now_ms(), *ids)
+                        )
+                        await db.execute(f"DELETE FROM payments WHERE id IN ({placeholders})", ids)
+                        # Карточки давно оплаченных заявок больше не правятся
+                        await db.execute(f"DELETE FROM payment_admin_messages WHERE payment_id IN ({placeholders})", ids)
+                moved += len(ids)
+                if len(ids) < batch_size:
+                    break
+                await asyncio.sleep(0)
+            if moved:
+                logger.info(f"Archived {moved} settled payments older than {older_than_days} days")
+            return moved
+        except Exception as e:
+            logger.error(f"Failed to archive payments (moved {moved} so far): {e}")
+            return moved
+    
+    async def incremental_vacuum(self, max_pages: int = 1000) -> int:
+        """Вернуть ОС до max_pages свободных страниц; возвращает число освобождённых"""
+        try:
+            conn = await self.connect()
+            async with self._get_write_lock():
+                cursor = await conn.execute("PRAGMA freelist_count")
+                before = (await cursor.fetchone())[0]
+                # executescript прокручивает прагму до конца; execute() освободил бы одну страницу
+                await conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+                cursor = await conn.execute("PRAGMA freelist_count")
+                after = (await cursor.fetchone())[0]
+            return before - after
+        except Exception as e:
+            logger.error(f"Incremental vacuum failed: {e}")
+            return 0
+    
+    async def vacuum_full(self) -> None:
+        """Полный VACUUM с переводом базы в режим auto_vacuum=INCREMENTAL (долго, блокирует запись)"""
+        conn = await self.connect()
+        async with self._get_write_lock():
+            await conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await conn.execute("VACUUM")
+        logger.info("Database vacuumed, auto_vacuum=INCREMENTAL")
+    
+    async def migrate_timestamps_to_epoch(self, batch_size: int = 500, pause: float = 0.0) -> int:
+        """
+        Переписать метки времени, сохранённые ISO-текстом, в миллисекунды UTC.
+        
+        Таблицы обходятся пачками по rowid; каждая пачка — короткая транзакция,
+        которая сохраняет и достигнутую позицию в maintenance_state, поэтому
+        бот продолжает работать, а после перезапуска перевод продолжается
+        с места остановки. В конце дневные итоги пересчитываются по дням UTC.
+        Возвращает число переписанных строк.
+        """
+        converted = 0
+        try:
+            if await self._get_state("epoch_ms") == "done":
+                return 0
+            for table, columns in TIMESTAMP_COLUMNS.items():
+                converted += await self._migrate_table_timestamps(table, columns, batch_size, pause)
+            await self.rebuild_payment_rollup()
+            async with self.transaction() as db:
+                await self._set_state(db, "epoch_ms", "done")
+            logger.info(f"Timestamps migrated to epoch milliseconds: {converted} rows rewritten")
+            return converted
+        except Exception as e:
+            logger.error(f"Timestamp migration interrupted after {converted} rows: {e}")
+            return converted
+    
+    async def _migrate_table_timestamps(
+        self,
+        table: str,
+        columns: Tuple[str, ...],
+        batch_size: int,
+        pause: float
+    ) -> int:
+        key = f"epoch_ms:{table}"
+        last_rowid = int(await self._get_state(key) or 0)
+        select = f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+        update = f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE rowid = ?"
+        
+        def convert(value: Any) -> Any:
+            try:
+                return _as_epoch_ms(value)
+            except ValueError:
+                # Неразборчивое значение оставляем как есть, чтобы не стопорить перевод
+                logger.warning(f"Unparseable timestamp in {table}: {value!r}")
+                return value
+        
+        converted = 0
+        while True:
+            async with self.transaction() as db:
+                cursor = await db.execute(select, (last_rowid, batch_size))
+                rows = await cursor.fetchall()
+                changed = [
+                    (*[convert(value) for value in row[1:]], row[0])
+                    for row in rows
+                    if any(isinstance(value, str) for value in row[1:])
+                ]
+                if changed:
+                    await db.executemany(update, changed)
+                if rows:
+                    last_rowid = rows[-1][0]
+                    await self._set_state(db, key, str(last_rowid))
+            converted += len(changed)
+            if len(rows) < batch_size:
+                return converted
+            await asyncio.sleep(pause)
+    
+    async def _get_state(self, key: str) -> Optional[str]:
+        async with self.get_connection() as db:
+            cursor = await db.execute("SELECT value FROM maintenance_state WHERE key = ?", (key,))
+            row = await cursor.fetchone()
+            return row[0] if row else None
+    
+    @staticmethod
+    async def _set_state(db: aiosqlite.Connection, key: str, value: str) -> None:
+        await db.execute(
+            "INSERT INTO maintenance_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+    
+    async def get_statistics(self, days: int = 30) -> dict:
+        """
+        Статистика за последние `days` дней.
+        
+        Считается по дневным итогам, поэтому стоимость не зависит от размера
+        истории заявок; граница окна округляется вниз до начала суток (UTC).
+        """
+        try:
+            since = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+            async with self.get_connection() as db:
                 stats = {
-                    'total_paid': row['total'] or 0,
-                    'total_amount': row['total_amount'] or 0,
+                    'total_paid': 0,
+                    'total_amount': 0,
                     'pending': 0,
                     'by_employee': {}
                 }
                 
                 cursor = await db.execute(
-                    "SELECT COUNT(*) as pending FROM payments WHERE status = 'pending'"
-                )
-                row = await cursor.fetchone()
-                stats['pending'] = row['pending'] or 0
-                
-                cursor = await db.execute(
-                    """SELECT employee_id, employee_username, 
-                              COUNT(*) as count, SUM(payment_amount) as amount
-                       FROM payments 
-                       WHERE status = 'paid' 
-                       AND paid_at >= datetime('now', '-' || ? || ' days')
+                    """SELECT employee_id, employee_username,
+                              SUM(paid_count) as count, SUM(paid_amount) as amount
+                       FROM payment_daily_rollup
+                       WHERE day >= ?
                        GROUP BY employee_id
+                       HAVING SUM(paid_count) > 0
                        ORDER BY amount DESC""",
-                    (days,)
+                    (since,)
                 )
                 rows = await cursor.fetchall()
                 for row in rows:
+                    stats['total_paid'] += row['count']
+                    stats['total_amount'] += row['amount'] or 0
                     stats['by_employee'][row['employee_id']] = {
                         'username': row['employee_username'],
                         'count': row['count'],
                         'amount': row['amount'] or 0
                     }
                 
+                cursor = await db.execute(
+                    "SELECT COUNT(*) as pending FROM payments WHERE status = 'pending'"
+                )
+                row = await cursor.fetchone()
+                stats['pending'] = row['pending'] or 0
+                
                 return stats
         except Exception as e:
             logger.error(f"Failed to get statistics: {e}")
@@ -286,8 +1216,17 @@ class Database:
             }
     
     async def close(self) -> None:
+        await self._stop_flusher()
+        if self._read_pool is not None:
+            await self._read_pool.close()
+        self._timed.clear()
         if self._connection:
-            await self._connection.close()
+            conn, self._connection = self._connection, None
+            try:
+                await conn.execute("PRAGMA optimize")
+            except Exception as e:
+                logger.warning(f"PRAGMA optimize failed on close: {e}")
+            await conn.close()
             logger.info("Database connection closed")
     
     # Методы для управления сотрудниками
@@ -295,33 +1234,80 @@ class Database:
     async def add_employee(self, user_id: int, username: str = None, first_name: str = None, added_by: int = 0) -> bool:
         """Добавить сотрудника в базу данных"""
         try:
-            async with self.get_connection() as db:
+            async with self.transaction() as db:
                 await db.execute("""
                     INSERT OR REPLACE INTO employees (user_id, username, first_name, added_at, added_by, is_active)
                     VALUES (?, ?, ?, ?, ?, 1)
-                """, (user_id, username, first_name, datetime.now(), added_by))
-                await db.commit()
-                logger.info(f"Added employee {user_id} (@{username}) by admin {added_by}")
-                return True
+                """, (user_id, username, first_name, now_ms(), added_by))
+            self.employees.put(user_id, first_name)
+            logger.info(f"Added employee {user_id} (@{username}) by admin {added_by}")
+            return True
         except Exception as e:
             logger.error(f"Failed to add employee {user_id}: {e}")
             return False
     
+    async def add_employees_many(
+        self,
+        employees: Iterable[EmployeeRow],
+        added_by: int = 0
+    ) -> Tuple[int, int]:
+        """
+        Добавить пачку сотрудников (user_id, username, first_name) одной транзакцией.
+        
+        Уже активные сотрудники пропускаются, удалённые — восстанавливаются.
+        Возвращает (добавлено, пропущено).
+        """
+        rows = list(employees)
+        if not rows:
+            return 0, 0
+        try:
+            added_at = now_ms()
+            async with self.transaction() as db:
+                cursor = await db.executemany("""
+                    INSERT INTO employees (user_id, username, first_name, added_at, added_by, is_active)
+                    VALUES (?, ?, ?, ?, ?, 1)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        username = COALESCE(excluded.username, username),
+                        first_name = COALESCE(excluded.first_name, first_name),
+                        added_at = excluded.added_at,
+                        added_by = excluded.added_by,
+                        is_active = 1
+                    WHERE is_active = 0
+                """, [(user_id, username, first_name, added_at, added_by) for user_id, username, first_name in rows])
+                inserted = cursor.rowcount
+            if inserted:
+                # Имена восстановленных сотрудников могли остаться в базе, поэтому каталог перечитывается
+                await self.reload_employee_directory()
+            logger.info(f"Bulk-added {inserted} employees by admin {added_by}, skipped {len(rows) - inserted}")
+            return inserted, len(rows) - inserted
+        except Exception as e:
+            logger.error(f"Failed to bulk-add {len(rows)} employees: {e}")
+            raise
+    
     async def remove_employee(self, user_id: int) -> bool:
         """Удалить сотрудника из базы данных"""
         try:
-            async with self.get_connection() as db:
+            async with self.transaction() as db:
                 await db.execute(
                     "UPDATE employees SET is_active = 0 WHERE user_id = ?",
                     (user_id,)
                 )
-                await db.commit()
-                logger.info(f"Removed employee {user_id}")
-                return True
+            self.employees.discard(user_id)
+            logger.info(f"Removed employee {user_id}")
+            return True
         except Exception as e:
             logger.error(f"Failed to remove employee {user_id}: {e}")
             return False
     
+    @staticmethod
+    def _employee_from_row(row) -> dict:
+        return {
+            'user_id': row['user_id'],
+            'username': row['username'],
+            'first_name': row['first_name'],
+            'added_at': _parse_timestamp(row['added_at'])
+        }
+    
     async def get_all_employees(self) -> List[dict]:
         """Получить список всех активных сотрудников"""
         try:
@@ -330,29 +1316,90 @@ class Database:
                     "SELECT * FROM employees WHERE is_active = 1 ORDER BY added_at DESC"
                 )
                 rows = await cursor.fetchall()
-                employees = []
-                for row in rows:
-                    employees.append({
-                        'user_id': row['user_id'],
-                        'username': row['username'],
-                        'first_name': row['first_name'],
-                        'added_at': datetime.fromisoformat(row['added_at']) if row['added_at'] else None
-                    })
-                return employees
+                return [self._employee_from_row(row) for row in rows]
         except Exception as e:
             logger.error(f"Failed to get employees: {e}")
             return []
     
-    async def is_employee(self, user_id: int) -> bool:
-        """Проверить, является ли пользователь сотрудником"""
+    async def get_employees_page(self, limit: int = 25, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Страница активных сотрудников (новые первыми) и токен следующей страницы"""
         try:
+            params: List[Any] = []
+            after = ""
+            if cursor:
+                after = "AND (added_at, user_id) < (?, ?)"
+                params.extend(decode_cursor(cursor))
+            params.append(limit + 1)
+            
             async with self.get_connection() as db:
-                cursor = await db.execute(
-                    "SELECT user_id FROM employees WHERE user_id = ? AND is_active = 1",
-                    (user_id,)
+                result = await db.execute(
+                    f"""SELECT * FROM employees
+                        WHERE is_active = 1 {after}
+                        ORDER BY added_at DESC, user_id DESC
+                        LIMIT ?""",
+                    params
                 )
-                row = await cursor.fetchone()
-                return row is not None
+                rows = await result.fetchall()
+            
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                last = rows[-1]
+                next_cursor = encode_cursor(last['added_at'], last['user_id'])
+            return [self._employee_from_row(row) for row in rows], next_cursor
+        except Exception as e:
+            logger.error(f"Failed to get employees page: {e}")
+            return [], None
+    
+    async def iter_employees(self, batch_size: int = 100) -> AsyncIterator[dict]:
+        """Потоково перебрать активных сотрудников пачками по batch_size строк"""
+        async with self.get_connection(stream=True) as db:
+            result = await db.execute(
+                "SELECT * FROM employees WHERE is_active = 1 ORDER BY added_at DESC, user_id DESC"
+            )
+            try:
+                while True:
+                    rows = await result.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield self._employee_from_row(row)
+            finally:
+                await result.close()
+    
+    async def reload_employee_directory(self) -> None:
+        """Перечитать каталог сотрудников из БД"""
+        if self._directory_lock is None:
+            self._directory_lock = asyncio.Lock()
+        
+        async with self._directory_lock:
+            self.employees.begin_load()
+            try:
+                async with self.get_connection() as db:
+                    cursor = await db.execute(
+                        "SELECT user_id, first_name FROM employees WHERE is_active = 1"
+                    )
+                    rows = await cursor.fetchall()
+            except BaseException:
+                self.employees.abort_load()
+                raise
+            self.employees.finish_load((row[0], row[1]) for row in rows)
+    
+    async def _employee_directory(self) -> EmployeeDirectory:
+        if not self.employees.is_fresh:
+            try:
+                await self.reload_employee_directory()
+            except Exception as e:
+                if not self.employees.is_loaded:
+                    raise
+                # Лучше ответить по слегка устаревшему каталогу, чем отказать в доступе
+                logger.error(f"Failed to reload employee directory, serving cached copy: {e}")
+        return self.employees
+    
+    async def is_employee(self, user_id: int) -> bool:
+        """Проверить, является ли пользователь сотрудником"""
+        try:
+            return user_id in await self._employee_directory()
         except Exception as e:
             logger.error(f"Failed to check employee {user_id}: {e}")
             return False
@@ -360,12 +1407,7 @@ class Database:
     async def get_employee_count(self) -> int:
         """Получить количество активных сотрудников"""
         try:
-            async with self.get_connection() as db:
-                cursor = await db.execute(
-                    "SELECT COUNT(*) as count FROM employees WHERE is_active = 1"
-                )
-                row = await cursor.fetchone()
-                return row['count'] if row else 0
+            return len(await self._employee_directory())
         except Exception as e:
             logger.error(f"Failed to get employee count: {e}")
             return 0
@@ -373,14 +1415,7 @@ class Database:
     async def get_employee_name(self, user_id: int) -> Optional[str]:
         """Получить имя сотрудника"""
         try:
-            async with self.get_connection() as db:
-                cursor = await db.execute(
-                    "SELECT first_name FROM employees WHERE user_id = ? AND is_active = 1",
-                    (user_id,)
-                )
-                row = await cursor.fetchone()
-                return row['first_name'] if row else None
+            return (await self._employee_directory()).name(user_id)
         except Exception as e:
             logger.error(f"Failed to get employee name for {user_id}: {e}")
             return None
-
@@ -0,0 +1,193 @@
+"""
+Хранилище FSM aiogram в SQLite.
+
+Состояния диалогов (PaymentStates, CustomPaymentStates, EmployeeStates)
+лежат в таблице fsm_state той же базы, что и заявки, поэтому
+незаконченная заявка переживает перезапуск бота и видна другим процессам.
+
+- Чтение: LRU-кэш в памяти процесса на cache_size ключей; промах — один
+  SELECT по первичному ключу. cache_ttl ограничивает возраст записи
+  в кэше, когда с базой работают несколько процессов.
+- Запись: set_state / set_data / update_data меняют запись в памяти сразу,
+  а в базу изменения уходят пачкой раз в flush_interval: несколько шагов
+  одного диалога за это время дают одну запись строки. При остановке
+  (close) несохранённое дописывается.
+- Брошенные диалоги: запись, не менявшаяся дольше state_ttl, читается
+  как пустая, а purge_loop периодически удаляет такие строки.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from database import Database, now_ms
+from models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[int, int, str]
+
+
+def _key(key: StorageKey) -> Key:
+    # chat и user — основная часть ключа, остальное почти всегда одинаково
+    scope = f"{key.bot_id}:{key.thread_id or 0}:{key.business_connection_id or ''}:{key.destiny}"
+    return key.chat_id, key.user_id, scope
+
+
+class SQLiteStorage(BaseStorage):
+    """BaseStorage на таблице fsm_state с кэшем чтения и групповой записью"""
+    
+    def __init__(
+        self,
+        db: Database,
+        cache_size: int = 1000,
+        cache_ttl: Optional[float] = None,
+        state_ttl: Optional[float] = 86400,
+        flush_interval: float = 0.05
+    ):
+        self.db = db
+        self.cache_size = max(1, cache_size)
+        self.cache_ttl = cache_ttl
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        # ключ -> (запись, time.monotonic() загрузки)
+        self._cache: "OrderedDict[Key, Tuple[FSMRecord, float]]" = OrderedDict()
+        # Изменения, ещё не записанные в базу; не вытесняются из памяти до записи
+        self._dirty: Dict[Key, FSMRecord] = {}
+        self._flushing: Dict[Key, FSMRecord] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+    
+    def _expired(self, record: FSMRecord) -> bool:
+        return bool(self.state_ttl) and record.updated_at < now_ms() - self.state_ttl * 1000
+    
+    def _peek(self, key: Key) -> Optional[FSMRecord]:
+        """Запись из памяти без обращения к базе"""
+        record = self._dirty.get(key) or self._flushing.get(key)
+        if record is not None:
+            return record
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        record, loaded_at = cached
+        if self.cache_ttl and time.monotonic() - loaded_at > self.cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return record
+    
+    def _remember(self, key: Key, record: FSMRecord) -> None:
+        self._cache[key] = (record, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    async def _get(self, key: Key) -> FSMRecord:
+        record = self._peek(key)
+        if record is None:
+            loaded = await self.db.get_fsm_record(*key) or FSMRecord(*key)
+            # Пока шёл запрос, ключ мог быть изменён: более свежая запись важнее
+            record = self._peek(key)
+            if record is None:
+                record = loaded
+                self._remember(key, record)
+        if self._expired(record):
+            return FSMRecord(*key)
+        return record
+    
+    def _put(self, key: Key, record: FSMRecord) -> None:
+        record.updated_at = now_ms()
+        self._remember(key, record)
+        self._dirty[key] = record
+        self._schedule_flush(self.flush_interval)
+    
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later(delay))
+    
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # Изменения, сделанные во время записи, запланируют следующую
+        self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"FSM flush failed, {len(self._dirty)} records will be retried: {e}")
+            self._schedule_flush(max(self.flush_interval, 1.0))
+    
+    def _get_flush_lock(self) -> asyncio.Lock:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        return self._flush_lock
+    
+    async def flush(self) -> None:
+        """Записать накопленные изменения в базу"""
+        async with self._get_flush_lock():
+            if not self._dirty:
+                return
+            self._flushing, self._dirty = self._dirty, {}
+            try:
+                await self.db.save_fsm_records(list(self._flushing.values()))
+            except Exception:
+                # Более новые изменения тех же ключей уже в _dirty и не перезаписываются
+                for key, record in self._flushing.items():
+                    self._dirty.setdefault(key, record)
+                raise
+            finally:
+                self._flushing = {}
+    
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = _key(key)
+        record = await self._get(storage_key)
+        state = state.state if isinstance(state, State) else state
+        self._put(storage_key, replace(record, state=state))
+    
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(_key(key))).state
+    
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        storage_key = _key(key)
+        record = await self._get(storage_key)
+        self._put(storage_key, replace(record, data=data.copy()))
+    
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get(_key(key))).data.copy()
+    
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        storage_key = _key(key)
+        record = await self._get(storage_key)
+        updated = {**record.data, **data}
+        self._put(storage_key, replace(record, data=updated))
+        return updated.copy()
+    
+    async def state_counts(self) -> Dict[str, int]:
+        """Число активных диалогов в каждом состоянии (для /metrics)"""
+        await self.flush()
+        return await self.db.get_fsm_state_counts(self.state_ttl)
+    
+    async def purge_loop(self, interval: float = 3600) -> None:
+        """Периодически удалять брошенные диалоги, пока задачу не отменят"""
+        if not self.state_ttl:
+            return
+        while True:
+            try:
+                await self.db.purge_fsm_records(self.state_ttl)
+            except Exception as e:
+                logger.error(f"FSM purge failed: {e}")
+            await asyncio.sleep(interval)
+    
+    async def close(self) -> None:
+        """Дописать несохранённые изменения; хранилищем можно пользоваться и дальше"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
@@ -4,14 +4,18 @@ from aiogram.types import CallbackQuery, Message
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.methods import SendMessage
 
+from admin_cards import edit_admin_cards
 from config import Config
-from database import Database
+from captions import admin_card, admin_card_markup, employee_card, employee_name, sent_captions
+from notifications import PAYMENT_PAID_EVENTS, OutboxWorker
+from outbound import OutboundScheduler, Priority
+from storage import Storage
 from utils import format_user_link
 from keyboards import get_admin_menu_keyboard
 
 router = Router()
-db = Database()
 logger = logging.getLogger(__name__)
 
 
@@ -20,7 +24,7 @@ class CustomPaymentStates(StatesGroup):
 
 
 @router.message(F.text == "📊 Статистика")
-async def show_statistics(message: Message) -> None:
+async def show_statistics(message: Message, db: Storage) -> None:
     user_id = message.from_user.id
     
     if not Config.is_admin(user_id):
@@ -88,7 +92,7 @@ async def back_to_admin_menu(callback: CallbackQuery) -> None:
 
 
 @router.callback_query(F.data.startswith("custom_pay_"))
-async def custom_payment_start(callback: CallbackQuery, state: FSMContext) -> None:
+async def custom_payment_start(callback: CallbackQuery, state: FSMContext, db: Storage) -> None:
     user_id = callback.from_user.id
     
     if not Config.is_admin(user_id):
@@ -120,7 +124,7 @@ async def custom_payment_start(callback: CallbackQuery, state: FSMContext) -> No
 
 
 @router.message(CustomPaymentStates.waiting_for_amount, F.text)
-async def custom_payment_process(message: Message, state: FSMContext, bot) -> None:
+async def custom_payment_process(message: Message, state: FSMContext, outbound: OutboundScheduler, outbox: OutboxWorker, db: Storage) -> None:
     if message.text == "/cancel":
         await state.clear()
         await message.answer("❌ Отменено.")
@@ -136,7 +140,7 @@ async def custom_payment_process(message: Message, state: FSMContext, bot) -> No
         if payment_amount > 10000:
             await message.answer("❌ Сумма слишком велика. Попробуйте снова:")
             return
-        
+    
     except ValueError:
         await message.answer("❌ Неверный формат. Введите число (например: 30):")
         return
@@ -144,51 +148,22 @@ async def custom_payment_process(message: Message, state: FSMContext, bot) -> No
     data = await state.get_data()
     payment_id = data['payment_id']
     
-    payment = await db.get_payment_by_id(payment_id)
-    
-    if not payment:
-        await message.answer("❌ Заявка не найдена!")
-        await state.clear()
-        return
-    
-    if payment.status == "paid":
-        await message.answer("❌ Заявка уже оплачена!")
-        await state.clear()
-        return
-    
     try:
-        await db.update_payment_status(payment_id, "paid", payment_amount)
+        # Проверка статуса, оплата и запись уведомлений в outbox — одна транзакция
+        payment = await db.settle_payment(payment_id, payment_amount, notify=PAYMENT_PAID_EVENTS)
         
-        employee_link = format_user_link(payment.employee_id, payment.employee_username)
-        employee_name = payment.employee_first_name or await db.get_employee_name(payment.employee_id) or payment.employee_username or "Не указано"
-        await bot.send_photo(
-            chat_id=Config.GROUP_CHAT_ID,
-            photo=payment.screenshot_file_id,
-            caption=(
-                "✅ <b>Оплачено</b>\n\n"
-                f"🔑 <b>Юзернейм:</b> {payment.username_field}\n"
-                f"💵 <b>Оплата:</b> {payment_amount}\n"
-                f"👤 <b>Сотрудник:</b> {employee_link}\n"
-                f"👨 <b>Имя:</b> {employee_name}"
-            ),
-            parse_mode="HTML"
-        )
+        if not payment:
+            await message.answer("❌ Заявка не найдена или уже оплачена!")
+            await state.clear()
+            return
+        
+        # Объявление в группу и уведомление сотрудника отправит воркер outbox
+        outbox.wake()
         
-        try:
-            employee_name = payment.employee_first_name or await db.get_employee_name(payment.employee_id) or payment.employee_username or "Не указано"
-            await bot.send_message(
-                chat_id=payment.employee_id,
-                text=(
-                    f"✅ <b>Ваша заявка #{payment_id} оплачена!</b>\n\n"
-                    f"👨 <b>Имя:</b> {employee_name}\n"
-                    f"💵 <b>Сумма:</b> {payment_amount}\n"
-                    f"🔑 <b>Юзернейм:</b> {payment.username_field}\n\n"
-                    "Спасибо за работу! 🎉"
-                ),
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify employee: {e}")
+        # Карточка у всех администраторов, включая ту, с которой начали ввод суммы
+        admin_cards = await db.get_admin_messages(payment_id)
+        admin_cards.append((message.chat.id, data['payment_message_id']))
+        edit_admin_cards(outbound, admin_cards, admin_card(payment, await employee_name(db, payment)))
         
         await message.answer(
             f"✅ <b>Заявка #{payment_id} оплачена на сумму {payment_amount}!</b>",
@@ -196,7 +171,7 @@ async def custom_payment_process(message: Message, state: FSMContext, bot) -> No
         )
         
         await state.clear()
-        
+    
     except Exception as e:
         logger.error(f"Error processing custom payment: {e}")
         await message.answer("❌ Ошибка при обработке оплаты.")
@@ -204,7 +179,7 @@ async def custom_payment_process(message: Message, state: FSMContext, bot) -> No
 
 
 @router.callback_query(F.data.startswith("replied_"))
-async def process_replied(callback: CallbackQuery, bot) -> None:
+async def process_replied(callback: CallbackQuery, outbound: OutboundScheduler, db: Storage) -> None:
     user_id = callback.from_user.id
     
     if not Config.is_admin(user_id):
@@ -228,44 +203,22 @@ async def process_replied(callback: CallbackQuery, bot) -> None:
         return
     
     await db.update_payment_replied(payment_id)
+    payment.replied = True
     
-    employee_link = format_user_link(payment.employee_id, payment.employee_username)
-    employee_name = payment.employee_first_name or await db.get_employee_name(payment.employee_id) or payment.employee_username or "Не указано"
-    await callback.message.edit_caption(
-        caption=(
-            f"📋 <b>Новая заявка #{payment_id}</b>\n\n"
-            f"👤 <b>Сотрудник:</b> {employee_link}\n"
-            f"👨 <b>Имя:</b> {employee_name}\n"
-            f"💰 <b>Баланс:</b> {payment.balance}\n"
-            f"🔑 <b>Юзернейм:</b> {payment.username_field}\n\n"
-            f"✍️ <b>Отписал</b>"
-        ),
-        parse_mode="HTML",
-        reply_markup=callback.message.reply_markup
-    )
+    # Отметка появляется у всех администраторов, а не только у нажавшего
+    admin_cards = await db.get_admin_messages(payment_id)
+    admin_cards.append((callback.message.chat.id, callback.message.message_id))
+    edit_admin_cards(outbound, admin_cards, admin_card(payment, await employee_name(db, payment)), admin_card_markup(payment))
     
     if payment.employee_message_id:
-        try:
-            await bot.edit_message_caption(
-                chat_id=payment.employee_id,
-                message_id=payment.employee_message_id,
-                caption=(
-                    f"✅ <b>Заявка #{payment_id} успешно создана!</b>\n\n"
-                    f"💰 <b>Баланс:</b> {payment.balance}\n"
-                    f"🔑 <b>Юзернейм:</b> {payment.username_field}\n\n"
-                    f"Ожидайте обработки администратором.\n\n"
-                    f"✍️ <b>Отписал</b>"
-                ),
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при редактировании сообщения сотрудника: {e}")
+        for method in sent_captions.edits([(payment.employee_id, payment.employee_message_id)], employee_card(payment)):
+            sent_captions.watch(method, outbound.send_nowait(method, Priority.LOW))
     
     await callback.answer("✅ Отмечено как 'Отписал'")
 
 
 @router.callback_query(F.data.startswith("pay_"))
-async def process_payment(callback: CallbackQuery, bot) -> None:
+async def process_payment(callback: CallbackQuery, outbound: OutboundScheduler, outbox: OutboxWorker, db: Storage) -> None:
     user_id = callback.from_user.id
     
     if not Config.is_admin(user_id):
@@ -276,77 +229,25 @@ async def process_payment(callback: CallbackQuery, bot) -> None:
     payment_amount = int(parts[1])
     payment_id = int(parts[2])
     
-    payment = await db.get_payment_by_id(payment_id)
+    # Повторное нажатие или второй администратор получат None: оплатить дважды нельзя.
+    # Уведомления записываются в outbox в той же транзакции и не теряются
+    payment = await db.settle_payment(payment_id, payment_amount, notify=PAYMENT_PAID_EVENTS)
     
     if not payment:
-        await callback.answer("❌ Заявка не найдена!", show_alert=True)
+        await callback.answer("❌ Заявка не найдена или уже оплачена!", show_alert=True)
         return
+    outbox.wake()
     
-    if payment.status == "paid":
-        await callback.answer("❌ Заявка уже оплачена!", show_alert=True)
-        return
-    
-    await db.update_payment_status(payment_id, "paid", payment_amount)
-    
-    employee_link = format_user_link(payment.employee_id, payment.employee_username)
-    employee_name = payment.employee_first_name or await db.get_employee_name(payment.employee_id) or payment.employee_username or "Не указано"
-    replied_text = "\n✍️ <b>Отписал</b>" if payment.replied else ""
-    await callback.message.edit_caption(
-        caption=(
-            f"✅ <b>Заявка #{payment_id} ОПЛАЧЕНА</b>\n\n"
-            f"👤 <b>Сотрудник:</b> {employee_link}\n"
-            f"👨 <b>Имя:</b> {employee_name}\n"
-            f"💰 <b>Баланс:</b> {payment.balance}\n"
-            f"🔑 <b>Юзернейм:</b> {payment.username_field}\n"
-            f"💵 <b>Сумма оплаты:</b> {payment_amount}"
-            f"{replied_text}"
-        ),
-        parse_mode="HTML"
-    )
-    
-    try:
-        employee_link = format_user_link(payment.employee_id, payment.employee_username)
-        employee_name = payment.employee_first_name or await db.get_employee_name(payment.employee_id) or payment.employee_username or "Не указано"
-        await bot.send_photo(
-            chat_id=Config.GROUP_CHAT_ID,
-            photo=payment.screenshot_file_id,
-            caption=(
-                "✅ <b>Оплачено</b>\n\n"
-                f"🔑 <b>Юзернейм:</b> {payment.username_field}\n"
-                f"💵 <b>Оплата:</b> {payment_amount}\n"
-                f"👤 <b>Сотрудник:</b> {employee_link}\n"
-                f"👨 <b>Имя:</b> {employee_name}"
-            ),
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        await callback.answer(
-            f"⚠️ Заявка оплачена, но не удалось отправить в групповой чат: {str(e)}",
-            show_alert=True
-        )
-        return
-    
-    try:
-        employee_name = payment.employee_first_name or await db.get_employee_name(payment.employee_id) or payment.employee_username or "Не указано"
-        await bot.send_message(
-            chat_id=payment.employee_id,
-            text=(
-                f"✅ <b>Ваша заявка #{payment_id} оплачена!</b>\n\n"
-                f"👨 <b>Имя:</b> {employee_name}\n"
-                f"💵 <b>Сумма:</b> {payment_amount}\n"
-                f"🔑 <b>Юзернейм:</b> {payment.username_field}\n\n"
-                "Спасибо за работу! 🎉"
-            ),
-            parse_mode="HTML"
-        )
-    except Exception:
-        pass
+    # Кнопки оплаты пропадают у всех администраторов: второй не нажмёт по уже оплаченной
+    admin_cards = await db.get_admin_messages(payment_id)
+    admin_cards.append((callback.message.chat.id, callback.message.message_id))
+    edit_admin_cards(outbound, admin_cards, admin_card(payment, await employee_name(db, payment)))
     
     await callback.answer(f"✅ Заявка оплачена на сумму {payment_amount}!")
 
 
 @router.callback_query(F.data.startswith("notify_trader_"))
-async def notify_trader(callback: CallbackQuery, bot) -> None:
+async def notify_trader(callback: CallbackQuery, outbound: OutboundScheduler, db: Storage) -> None:
     user_id = callback.from_user.id
     
     if not Config.is_admin(user_id):
@@ -366,7 +267,7 @@ async def notify_trader(callback: CallbackQuery, bot) -> None:
         return
     
     try:
-        await bot.send_message(
+        await outbound.send(SendMessage(
             chat_id=payment.employee_id,
             text=(
                 f"📨 <b>Уведомление по заявке #{payment_id}</b>\n\n"
@@ -375,7 +276,7 @@ async def notify_trader(callback: CallbackQuery, bot) -> None:
                 "Свяжитесь с клиентом как можно скорее!"
             ),
             parse_mode="HTML"
-        )
+        ), Priority.NORMAL)
         await callback.answer("✅ Уведомление отправлено трейдеру!")
     except Exception as e:
         logger.error(f"Failed to notify trader: {e}")
@@ -1,27 +1,53 @@
 import logging
+from typing import List, Optional
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery, InputMediaPhoto
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.methods import SendPhoto
 
+from admin_cards import edit_admin_cards, track_admin_cards
+from captions import (
+    admin_card,
+    admin_card_deleted,
+    admin_card_markup,
+    employee_card,
+    employee_card_deleted,
+    employee_name,
+    my_payment_card,
+    my_payments_summary,
+    sent_captions
+)
 from config import Config
-from database import Database
+from outbound import OutboundScheduler, Priority, fan_out
+from storage import Storage
 from models import Payment
-from utils import Validator, RateLimiter, format_user_link
+from utils import Validator, RateLimiter
 from keyboards import (
     get_main_menu_keyboard,
     get_cancel_keyboard,
     get_confirm_keyboard,
-    get_payment_actions_keyboard,
-    get_admin_payment_keyboard
+    get_my_payments_keyboard,
+    without_button
 )
 
 router = Router()
-db = Database()
 rate_limiter = RateLimiter()
 logger = logging.getLogger(__name__)
 
+# Заявок на странице «Мои заявки»; скриншоты уходят альбомами по MEDIA_GROUP_SIZE
+MY_PAYMENTS_PAGE_SIZE = 10
+MEDIA_GROUP_SIZE = 10
+
+NO_PAYMENTS_TEXT = (
+    "📋 <b>Ваши заявки</b>\n\n"
+    "У вас нет активных заявок.\n\n"
+    "Создайте новую заявку через меню."
+)
+
 
 class PaymentStates(StatesGroup):
     waiting_for_screenshot = State()
@@ -31,7 +57,7 @@ class PaymentStates(StatesGroup):
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message) -> None:
+async def cmd_start(message: Message, db: Storage) -> None:
     user_id = message.from_user.id
     
     # Проверяем, является ли пользователь администратором
@@ -70,7 +96,7 @@ async def cmd_start(message: Message) -> None:
 
 
 @router.message(F.text == "📝 Создать заявку")
-async def start_payment_creation(message: Message, state: FSMContext) -> None:
+async def start_payment_creation(message: Message, state: FSMContext, db: Storage) -> None:
     user_id = message.from_user.id
     
     is_employee = await db.is_employee(user_id)
@@ -196,7 +222,7 @@ async def process_username(message: Message, state: FSMContext) -> None:
 
 
 @router.callback_query(F.data == "confirm_payment", StateFilter(PaymentStates.confirming))
-async def confirm_payment(callback: CallbackQuery, state: FSMContext, bot) -> None:
+async def confirm_payment(callback: CallbackQuery, state: FSMContext, outbound: OutboundScheduler, db: Storage) -> None:
     data = await state.get_data()
     user_id = callback.from_user.id
     username = callback.from_user.username
@@ -213,45 +239,31 @@ async def confirm_payment(callback: CallbackQuery, state: FSMContext, bot) -> No
         )
         
         payment_id = await db.create_payment(payment)
+        payment.id = payment_id
         
-        employee_link = format_user_link(user_id, username)
-        employee_name = await db.get_employee_name(user_id) or first_name or username or "Не указано"
-        admin_success = False
-        for admin_id in Config.ADMIN_IDS:
-            try:
-                await bot.send_photo(
-                    chat_id=admin_id,
-                    photo=data['screenshot_file_id'],
-                    caption=(
-                        f"📋 <b>Новая заявка #{payment_id}</b>\n\n"
-                        f"👤 <b>Сотрудник:</b> {employee_link}\n"
-                        f"👨 <b>Имя:</b> {employee_name or 'Не указано'}\n"
-                        f"💰 <b>Баланс:</b> {data['balance']}\n"
-                        f"🔑 <b>Юзернейм:</b> {data['username_field']}\n"
-                    ),
-                    parse_mode="HTML",
-                    reply_markup=get_admin_payment_keyboard(payment_id)
-                )
-                admin_success = True
-            except Exception as e:
-                logger.error(f"Error sending notification to admin {admin_id}: {e}")
+        caption = admin_card(payment, await employee_name(db, payment))
+        reply_markup = admin_card_markup(payment)
+        # Администраторам рассылается параллельно; сотруднику хватает первой доставки
+        delivery = fan_out(outbound, Config.ADMIN_IDS, lambda admin_id: SendPhoto(
+            chat_id=admin_id,
+            photo=payment.screenshot_file_id,
+            caption=caption,
+            parse_mode="HTML",
+            reply_markup=reply_markup
+        ), Priority.HIGH)
+        # Копии карточки запоминаются, чтобы потом править их у всех администраторов
+        track_admin_cards(outbound, db, payment_id, delivery, caption, reply_markup)
         
-        if not admin_success:
+        if not await delivery.any_delivered():
             await callback.answer(
                 "⚠️ Не удалось отправить уведомление администраторам. Обратитесь к администратору.",
                 show_alert=True
             )
             return
         
-        edited_message = await callback.message.edit_caption(
-            caption=(
-                f"✅ <b>Заявка #{payment_id} успешно создана!</b>\n\n"
-                f"💰 <b>Баланс:</b> {data['balance']}\n"
-                f"🔑 <b>Юзернейм:</b> {data['username_field']}\n\n"
-                "Ожидайте обработки администратором."
-            ),
-            parse_mode="HTML"
-        )
+        employee_caption = employee_card(payment)
+        edited_message = await callback.message.edit_caption(caption=employee_caption, parse_mode="HTML")
+        sent_captions.remember(edited_message.chat.id, edited_message.message_id, employee_caption)
         
         await db.update_employee_message_id(payment_id, edited_message.message_id)
         
@@ -296,7 +308,7 @@ async def cancel_operation(message: Message, state: FSMContext) -> None:
 
 
 @router.message(F.text == "📋 Мои заявки")
-async def show_my_payments(message: Message) -> None:
+async def show_my_payments(message: Message, db: Storage) -> None:
     user_id = message.from_user.id
     
     is_employee = await db.is_employee(user_id)
@@ -304,54 +316,109 @@ async def show_my_payments(message: Message) -> None:
         await message.answer("❌ У вас нет доступа к этой функции.")
         return
     
-    payments = await db.get_user_pending_payments(user_id)
+    payments, older_cursor, _ = await db.get_user_pending_payments_page(user_id, MY_PAYMENTS_PAGE_SIZE)
     
     if not payments:
         await message.answer(
-            "📋 <b>Ваши заявки</b>\n\n"
-            "У вас нет активных заявок.\n\n"
-            "Создайте новую заявку через меню.",
+            NO_PAYMENTS_TEXT,
             parse_mode="HTML",
             reply_markup=get_main_menu_keyboard()
         )
         return
     
-    await message.answer(
-        f"📋 <b>Ваши активные заявки ({len(payments)}):</b>\n\n"
-        "Нажмите на кнопку под заявкой для действий.",
-        parse_mode="HTML"
+    await _send_my_payments_page(message, payments, None, older_cursor)
+
+
+@router.callback_query(F.data.startswith("my_pg:"))
+async def my_payments_page(callback: CallbackQuery, db: Storage) -> None:
+    """Соседняя страница «Мои заявки»: новый альбом и новая сводка вместо старых"""
+    user_id = callback.from_user.id
+    
+    if not await db.is_employee(user_id):
+        await callback.answer("❌ У вас нет доступа к этой функции.", show_alert=True)
+        return
+    
+    _, direction, album_start, album_size, cursor = callback.data.split(":", 4)
+    newer = direction == "n"
+    payments, older_cursor, newer_cursor = await db.get_user_pending_payments_page(
+        user_id, MY_PAYMENTS_PAGE_SIZE, cursor, newer=newer
     )
+    if newer and newer_cursor is None:
+        # Первая страница читается заново: после удалений она могла стать неполной
+        payments = []
+    if not payments:
+        payments, older_cursor, newer_cursor = await db.get_user_pending_payments_page(user_id, MY_PAYMENTS_PAGE_SIZE)
     
-    for payment in payments:
-        created_at = payment.created_at.strftime("%d.%m.%Y %H:%M")
-        replied_text = "\n✍️ <b>Отписал</b>" if payment.replied else ""
-        await message.answer_photo(
-            photo=payment.screenshot_file_id,
-            caption=(
-                f"📋 <b>Заявка #{payment.id}</b>\n"
-                f"📅 <b>Создана:</b> {created_at}\n\n"
-                f"💰 <b>Баланс:</b> {payment.balance}\n"
-                f"🔑 <b>Юзернейм:</b> {payment.username_field}\n"
-                f"📊 <b>Статус:</b> ⏳ Ожидает обработки"
-                f"{replied_text}"
-            ),
-            parse_mode="HTML",
-            reply_markup=get_payment_actions_keyboard(payment.id)
-        )
+    # Прежняя страница (скриншоты и сводка) удаляется одним вызовом
+    start = int(album_start)
+    stale = [*range(start, start + int(album_size)), callback.message.message_id]
+    try:
+        await callback.bot.delete_messages(chat_id=callback.message.chat.id, message_ids=stale)
+    except TelegramBadRequest:
+        # Сообщения старше 48 часов удалить нельзя; остаются в чате
+        pass
+    
+    if payments:
+        await _send_my_payments_page(callback.message, payments, newer_cursor, older_cursor)
+    else:
+        await callback.message.answer(NO_PAYMENTS_TEXT, parse_mode="HTML", reply_markup=get_main_menu_keyboard())
+    await callback.answer()
+
+
+async def _send_my_payments_page(
+    message: Message,
+    payments: List[Payment],
+    newer_cursor: Optional[str],
+    older_cursor: Optional[str]
+) -> None:
+    """Скриншоты страницы альбомами, затем одна сводка с кнопками удаления и навигации"""
+    sent: List[Message] = []
+    for start in range(0, len(payments), MEDIA_GROUP_SIZE):
+        album = payments[start:start + MEDIA_GROUP_SIZE]
+        if len(album) == 1:
+            # sendMediaGroup принимает от 2 до 10 элементов
+            sent.append(await message.answer_photo(
+                photo=album[0].screenshot_file_id,
+                caption=my_payment_card(album[0]),
+                parse_mode="HTML"
+            ))
+            continue
+        sent.extend(await message.answer_media_group(media=[
+            InputMediaPhoto(media=payment.screenshot_file_id, caption=my_payment_card(payment), parse_mode="HTML")
+            for payment in album
+        ]))
+    
+    # В сводку попадает диапазон id скриншотов, чтобы при переходе удалить их;
+    # если между ними оказалось чужое сообщение, скриншоты не удаляются
+    ids = [m.message_id for m in sent]
+    album = (ids[0], len(ids)) if ids == list(range(ids[0], ids[0] + len(ids))) else (0, 0)
+    await message.answer(
+        my_payments_summary(payments),
+        parse_mode="HTML",
+        reply_markup=get_my_payments_keyboard([payment.id for payment in payments], newer_cursor, older_cursor, album)
+    )
 
 
 @router.callback_query(F.data.startswith("delete_"))
-async def delete_payment(callback: CallbackQuery) -> None:
+async def delete_payment(callback: CallbackQuery, outbound: OutboundScheduler, db: Storage) -> None:
     payment_id = int(callback.data.split("_")[1])
     user_id = callback.from_user.id
     
+    # Копии карточки удаляются вместе с заявкой, поэтому читаются заранее
+    admin_cards = await db.get_admin_messages(payment_id)
     success = await db.delete_payment(payment_id, user_id)
     
     if success:
-        await callback.message.edit_caption(
-            caption=f"🗑 <b>Заявка #{payment_id} удалена</b>",
-            parse_mode="HTML"
-        )
+        if callback.message.photo:
+            await callback.message.edit_caption(caption=employee_card_deleted(payment_id), parse_mode="HTML")
+        else:
+            # Сводка «Мои заявки»: отметка об удалении и без кнопки этой заявки
+            await callback.message.edit_text(
+                f"{callback.message.html_text}\n\n{employee_card_deleted(payment_id)}",
+                parse_mode="HTML",
+                reply_markup=without_button(callback.message.reply_markup, callback.data)
+            )
+        edit_admin_cards(outbound, admin_cards, admin_card_deleted(payment_id))
         await callback.answer("✅ Заявка удалена")
     else:
         await callback.answer(
@@ -4,16 +4,21 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.methods import SendMessage
 
 from config import Config
-from database import Database
+from outbound import OutboundScheduler, Priority
+from storage import Storage
 from utils import format_user_link
 from keyboards import get_employee_management_keyboard, get_cancel_keyboard, get_admin_menu_keyboard
 
 router = Router()
-db = Database()
 logger = logging.getLogger(__name__)
 
+# Сотрудников на одной странице списка (лимит текста сообщения — 4096 символов)
+EMPLOYEES_PAGE_SIZE = 25
+REMOVAL_LIST_SIZE = 40
+
 
 class EmployeeStates(StatesGroup):
     waiting_for_user_id = State()
@@ -38,8 +43,9 @@ async def employee_management_menu(message: Message) -> None:
 
 
 @router.callback_query(F.data == "list_employees")
-async def list_employees(callback: CallbackQuery) -> None:
-    """Показать список всех сотрудников"""
+@router.callback_query(F.data.startswith("emp_pg:"))
+async def list_employees(callback: CallbackQuery, db: Storage) -> None:
+    """Показать список сотрудников постранично"""
     user_id = callback.from_user.id
     
     if not Config.is_admin(user_id):
@@ -47,8 +53,9 @@ async def list_employees(callback: CallbackQuery) -> None:
         return
     
     try:
-        employees = await db.get_all_employees()
-        count = len(employees)
+        cursor = callback.data.split(":", 1)[1] if callback.data.startswith("emp_pg:") else None
+        employees, next_cursor = await db.get_employees_page(EMPLOYEES_PAGE_SIZE, cursor)
+        count = await db.get_employee_count()
         
         if not employees:
             await callback.message.edit_text(
@@ -71,7 +78,7 @@ async def list_employees(callback: CallbackQuery) -> None:
         await callback.message.edit_text(
             text,
             parse_mode="HTML",
-            reply_markup=get_employee_management_keyboard()
+            reply_markup=get_employee_management_keyboard(next_cursor)
         )
         await callback.answer()
         
@@ -106,7 +113,7 @@ async def add_employee_start(callback: CallbackQuery, state: FSMContext) -> None
 
 
 @router.message(EmployeeStates.waiting_for_user_id, F.text)
-async def add_employee_process(message: Message, state: FSMContext) -> None:
+async def add_employee_process(message: Message, state: FSMContext, outbound: OutboundScheduler, db: Storage) -> None:
     """Обработать добавление сотрудника"""
     if message.text == "/cancel":
         await state.clear()
@@ -161,20 +168,17 @@ async def add_employee_process(message: Message, state: FSMContext) -> None:
             reply_markup=get_admin_menu_keyboard()
         )
         
-        # Уведомляем нового сотрудника (если возможно)
-        try:
-            from main import bot_instance
-            if bot_instance:
-                await bot_instance.send_message(
-                    target_user_id,
-                    "🎉 <b>Поздравляем!</b>\n\n"
-                    "Вы были добавлены в качестве сотрудника.\n"
-                    "Теперь вы можете создавать заявки на оплату.\n\n"
-                    "Используйте команду /start для начала работы.",
-                    parse_mode="HTML"
-                )
-        except Exception as e:
-            logger.warning(f"Could not notify new employee {target_user_id}: {e}")
+        # Уведомляем нового сотрудника (если возможно: бот не может писать первым)
+        outbound.send_nowait(SendMessage(
+            chat_id=target_user_id,
+            text=(
+                "🎉 <b>Поздравляем!</b>\n\n"
+                "Вы были добавлены в качестве сотрудника.\n"
+                "Теперь вы можете создавать заявки на оплату.\n\n"
+                "Используйте команду /start для начала работы."
+            ),
+            parse_mode="HTML"
+        ), Priority.LOW)
     else:
         await message.answer(
             "❌ Не удалось добавить сотрудника. Попробуйте позже.",
@@ -186,7 +190,7 @@ async def add_employee_process(message: Message, state: FSMContext) -> None:
 
 
 @router.callback_query(F.data == "remove_employee")
-async def remove_employee_start(callback: CallbackQuery, state: FSMContext) -> None:
+async def remove_employee_start(callback: CallbackQuery, state: FSMContext, db: Storage) -> None:
     """Начать процесс удаления сотрудника"""
     user_id = callback.from_user.id
     
@@ -194,7 +198,7 @@ async def remove_employee_start(callback: CallbackQuery, state: FSMContext) -> N
         await callback.answer("❌ У вас нет прав для этого действия!", show_alert=True)
         return
     
-    employees = await db.get_all_employees()
+    employees, next_cursor = await db.get_employees_page(REMOVAL_LIST_SIZE)
     
     if not employees:
         await callback.answer("Нечего удалять - список пуст", show_alert=True)
@@ -206,6 +210,10 @@ async def remove_employee_start(callback: CallbackQuery, state: FSMContext) -> N
         user_link = format_user_link(emp['user_id'], emp['username'], emp['first_name'])
         text += f"• {user_link} - ID: <code>{emp['user_id']}</code>\n"
     
+    if next_cursor:
+        rest = await db.get_employee_count() - len(employees)
+        text += f"<i>…и ещё {rest}. Полный список — в «📋 Список сотрудников».</i>\n"
+    
     text += "\nОтправьте ID сотрудника, которого хотите удалить.\n\n"
     text += "Для отмены нажмите кнопку ниже."
     
@@ -215,7 +223,7 @@ async def remove_employee_start(callback: CallbackQuery, state: FSMContext) -> N
 
 
 @router.message(EmployeeStates.waiting_for_removal, F.text)
-async def remove_employee_process(message: Message, state: FSMContext) -> None:
+async def remove_employee_process(message: Message, state: FSMContext, outbound: OutboundScheduler, db: Storage) -> None:
     """Обработать удаление сотрудника"""
     if message.text == "/cancel":
         await state.clear()
@@ -255,18 +263,15 @@ async def remove_employee_process(message: Message, state: FSMContext) -> None:
         )
         
         # Уведомляем бывшего сотрудника (если возможно)
-        try:
-            from main import bot_instance
-            if bot_instance:
-                await bot_instance.send_message(
-                    target_user_id,
-                    "ℹ️ <b>Уведомление</b>\n\n"
-                    "Ваш доступ к созданию заявок на оплату был отозван.\n"
-                    "Если у вас есть вопросы, обратитесь к администратору.",
-                    parse_mode="HTML"
-                )
-        except Exception as e:
-            logger.warning(f"Could not notify removed employee {target_user_id}: {e}")
+        outbound.send_nowait(SendMessage(
+            chat_id=target_user_id,
+            text=(
+                "ℹ️ <b>Уведомление</b>\n\n"
+                "Ваш доступ к созданию заявок на оплату был отозван.\n"
+                "Если у вас есть вопросы, обратитесь к администратору."
+            ),
+            parse_mode="HTML"
+        ), Priority.LOW)
     else:
         await message.answer(
             "❌ Не удалось удалить сотрудника. Попробуйте позже.",
@@ -1,3 +1,5 @@
+from typing import Iterable, Optional, Tuple
+
 from aiogram.types import (
     ReplyKeyboardMarkup, 
     KeyboardButton,
@@ -5,6 +7,9 @@ from aiogram.types import (
     InlineKeyboardButton
 )
 
+# Кнопок удаления в одном ряду сводки «Мои заявки»
+DELETE_BUTTONS_PER_ROW = 5
+
 
 def get_main_menu_keyboard() -> ReplyKeyboardMarkup:
     """Главное меню для сотрудников"""
@@ -32,9 +37,12 @@ def get_admin_menu_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
-def get_employee_management_keyboard() -> InlineKeyboardMarkup:
-    """Меню управления сотрудниками"""
-    keyboard = [
+def get_employee_management_keyboard(next_cursor: str = None) -> InlineKeyboardMarkup:
+    """Меню управления сотрудниками (с кнопкой следующей страницы списка, если она есть)"""
+    keyboard = []
+    if next_cursor:
+        keyboard.append([InlineKeyboardButton(text="➡️ Далее", callback_data=f"emp_pg:{next_cursor}")])
+    keyboard += [
         [InlineKeyboardButton(text="📋 Список сотрудников", callback_data="list_employees")],
         [InlineKeyboardButton(text="➕ Добавить сотрудника", callback_data="add_employee")],
         [InlineKeyboardButton(text="➖ Удалить сотрудника", callback_data="remove_employee")],
@@ -81,16 +89,43 @@ def get_admin_payment_keyboard(payment_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_payment_actions_keyboard(payment_id: int) -> InlineKeyboardMarkup:
-    """Кнопки действий сотрудника для заявки"""
-    keyboard = [
-        [
-            InlineKeyboardButton(text="🗑 Удалить заявку", callback_data=f"delete_{payment_id}")
-        ]
-    ]
+def get_my_payments_keyboard(
+    payment_ids: Iterable[int],
+    newer_cursor: Optional[str] = None,
+    older_cursor: Optional[str] = None,
+    album: Tuple[int, int] = (0, 0)
+) -> InlineKeyboardMarkup:
+    """
+    Сводка «Мои заявки»: удаление каждой заявки страницы и переход между страницами.
+    
+    album — (id первого сообщения, число сообщений) со скриншотами страницы:
+    при переходе они удаляются вместе со сводкой.
+    """
+    page = f"{album[0]}:{album[1]}"
+    buttons = [InlineKeyboardButton(text=f"🗑 #{payment_id}", callback_data=f"delete_{payment_id}") for payment_id in payment_ids]
+    keyboard = [buttons[i:i + DELETE_BUTTONS_PER_ROW] for i in range(0, len(buttons), DELETE_BUTTONS_PER_ROW)]
+    navigation = []
+    if newer_cursor:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"my_pg:n:{page}:{newer_cursor}"))
+    if older_cursor:
+        navigation.append(InlineKeyboardButton(text="➡️ Далее", callback_data=f"my_pg:o:{page}:{older_cursor}"))
+    if navigation:
+        keyboard.append(navigation)
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+def without_button(markup: Optional[InlineKeyboardMarkup], callback_data: str) -> Optional[InlineKeyboardMarkup]:
+    """Та же клавиатура без кнопки с callback_data (None, если кнопок не осталось)"""
+    if markup is None:
+        return None
+    rows = [
+        [button for button in row if button.callback_data != callback_data]
+        for row in markup.inline_keyboard
+    ]
+    rows = [row for row in rows if row]
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
+
 def get_back_keyboard() -> InlineKeyboardMarkup:
     """Кнопка назад"""
     keyboard = [
@@ -4,9 +4,18 @@ import signal
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.methods import SendMessage
 
+import admin_cards
 from config import Config
 from database import Database
+from fsm_storage import SQLiteStorage
+from memory_storage import MemoryStorage
+from maintenance import maintenance_loop
+from monitoring import install_metrics, start_metrics_server
+from notifications import OutboxWorker
+from outbound import OutboundScheduler, Priority, fan_out
+from webhook import WebhookServer, start_webhook_server
 from handlers import employee, admin, employee_management
 
 logging.basicConfig(
@@ -19,14 +28,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+slow_query_handler = logging.FileHandler('slow_queries.log', encoding='utf-8')
+slow_query_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+logging.getLogger('database.slow').addHandler(slow_query_handler)
+
 bot_instance = None
 db_instance = None
+fsm_storage = None
+outbound_instance = None
+metrics_runner = None
+webhook_server = None
+webhook_runner = None
+background_tasks = []
 
 
 async def shutdown(signal_type: str = None) -> None:
     if signal_type:
         logger.info(f"Получен сигнал {signal_type}, выполняется остановка...")
     
+    if webhook_server:
+        # Сначала дообработать принятые апдейты: им ещё нужны база и очередь отправки
+        try:
+            await webhook_server.close()
+            await webhook_runner.cleanup()
+            logger.info("✅ Webhook endpoint stopped")
+        except Exception as e:
+            logger.error(f"Error stopping webhook endpoint: {e}")
+    
+    for task in background_tasks:
+        task.cancel()
+    if background_tasks:
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        background_tasks.clear()
+    
+    if outbound_instance:
+        try:
+            await outbound_instance.close()
+            logger.info("✅ Outbound queue drained")
+        except Exception as e:
+            logger.error(f"Error closing outbound queue: {e}")
+    
+    # Копии карточек, доставленные перед остановкой, дописываются до закрытия базы
+    try:
+        await admin_cards.drain()
+    except Exception as e:
+        logger.error(f"Error saving admin card copies: {e}")
+    
+    if metrics_runner:
+        try:
+            await metrics_runner.cleanup()
+            logger.info("✅ Metrics endpoint stopped")
+        except Exception as e:
+            logger.error(f"Error stopping metrics endpoint: {e}")
+    
     if bot_instance:
         try:
             await bot_instance.session.close()
@@ -34,6 +88,16 @@ async def shutdown(signal_type: str = None) -> None:
         except Exception as e:
             logger.error(f"Error closing bot session: {e}")
     
+    # Обычно хранилище FSM уже закрыто в dp.emit_shutdown (aiogram вызывает dp.fsm.close);
+    # здесь остаётся случай, когда запуск упал до polling или вебхука. Повторный close()
+    # безопасен: дописывается только то, что ещё не сохранено
+    if fsm_storage:
+        try:
+            await fsm_storage.close()
+            logger.info("✅ FSM states saved")
+        except Exception as e:
+            logger.error(f"Error saving FSM states: {e}")
+    
     if db_instance:
         try:
             await db_instance.close()
@@ -42,8 +106,47 @@ async def shutdown(signal_type: str = None) -> None:
             logger.error(f"Error closing database: {e}")
 
 
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Принимать апдейты по вебхуку до SIGINT/SIGTERM"""
+    global webhook_server, webhook_runner
+    
+    webhook_server = WebhookServer(
+        dp,
+        bot,
+        secret_token=Config.WEBHOOK_SECRET,
+        path=Config.WEBHOOK_PATH,
+        workers=Config.WEBHOOK_WORKERS,
+        queue_size=Config.WEBHOOK_QUEUE_SIZE
+    )
+    webhook_runner = await start_webhook_server(webhook_server, Config.WEBHOOK_HOST, Config.WEBHOOK_PORT)
+    await bot.set_webhook(
+        url=Config.WEBHOOK_URL + Config.WEBHOOK_PATH,
+        secret_token=Config.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logger.info(f"Webhook set to {Config.WEBHOOK_URL}{Config.WEBHOOK_PATH}")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остановка по Ctrl+C через KeyboardInterrupt
+            pass
+    
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    try:
+        await stop.wait()
+    finally:
+        # Принятые апдейты дообрабатываются до закрытия хранилища FSM (dp.fsm.close в shutdown)
+        await webhook_server.close()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+
+
 async def main() -> None:
-    global bot_instance, db_instance
+    global bot_instance, db_instance, fsm_storage, outbound_instance, metrics_runner
     
     try:
         Config.validate()
@@ -52,7 +155,19 @@ async def main() -> None:
         logger.error(f"❌ Ошибка конфигурации: {e}")
         return
     
-    db_instance = Database()
+    if Config.STORAGE_BACKEND == "memory":
+        logger.warning("⚠️ Хранилище в памяти: данные пропадут при перезапуске")
+        db_instance = MemoryStorage()
+    else:
+        db_instance = Database(
+            write_behind=Config.DB_WRITE_BEHIND,
+            flush_interval=Config.DB_FLUSH_INTERVAL_MS / 1000,
+            flush_max_batch=Config.DB_FLUSH_MAX_BATCH,
+            employee_cache_ttl=Config.EMPLOYEE_CACHE_TTL or None,
+            read_pool_size=Config.DB_READ_POOL_SIZE,
+            read_timeout=Config.DB_READ_TIMEOUT_MS / 1000 or None,
+            slow_query_threshold=Config.DB_SLOW_QUERY_MS / 1000 or None
+        )
     try:
         await db_instance.init_db()
         logger.info("✅ База данных инициализирована")
@@ -60,31 +175,76 @@ async def main() -> None:
         logger.error(f"❌ Ошибка инициализации БД: {e}")
         return
     
+    if isinstance(db_instance, Database):
+        # Перевод старых ISO-меток времени в миллисекунды идёт в фоне, не мешая работе бота
+        background_tasks.append(asyncio.create_task(
+            db_instance.migrate_timestamps_to_epoch(pause=0.05)
+        ))
+        
+        # Незаконченные диалоги переживают перезапуск; при хранилище в памяти — MemoryStorage aiogram
+        fsm_storage = SQLiteStorage(
+            db_instance,
+            cache_size=Config.FSM_CACHE_SIZE,
+            cache_ttl=Config.FSM_CACHE_TTL or None,
+            state_ttl=Config.FSM_STATE_TTL_HOURS * 3600 or None,
+            flush_interval=Config.FSM_FLUSH_INTERVAL_MS / 1000
+        )
+        background_tasks.append(asyncio.create_task(fsm_storage.purge_loop()))
+        
+        if Config.ARCHIVE_AFTER_DAYS > 0:
+            background_tasks.append(asyncio.create_task(maintenance_loop(
+                db_instance,
+                older_than_days=Config.ARCHIVE_AFTER_DAYS,
+                batch_size=Config.ARCHIVE_BATCH_SIZE,
+                interval=Config.ARCHIVE_INTERVAL_MINUTES * 60
+            )))
+    
     try:
         bot_instance = Bot(
             token=Config.BOT_TOKEN,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
-        dp = Dispatcher()
+        dp = Dispatcher(storage=fsm_storage)
+        # Единственный экземпляр БД на процесс: хендлеры получают его как аргумент `db`
+        dp["db"] = db_instance
+        # Все исходящие сообщения идут через одну очередь с лимитами Telegram
+        outbound_instance = OutboundScheduler(
+            bot_instance,
+            global_rate=Config.OUTBOUND_GLOBAL_RATE,
+            private_rate=Config.OUTBOUND_PRIVATE_RATE,
+            group_rate_per_minute=Config.OUTBOUND_GROUP_RATE_PER_MINUTE
+        )
+        dp["outbound"] = outbound_instance
+        # Уведомления об оплате лежат в outbox до доставки; после перезапуска отправка продолжается
+        outbox_worker = OutboxWorker(db_instance, outbound_instance)
+        dp["outbox"] = outbox_worker
+        background_tasks.append(asyncio.create_task(outbox_worker.run()))
         
         dp.include_router(employee.router)
         dp.include_router(admin.router)
         dp.include_router(employee_management.router)
         
-        logger.info("🤖 Бот запущен и готов к работе!")
+        if Config.METRICS_PORT:
+            metrics = install_metrics(dp, bot_instance, db_instance)
+            metrics_runner = await start_metrics_server(metrics, Config.METRICS_HOST, Config.METRICS_PORT)
+            background_tasks.append(asyncio.create_task(metrics.watch_event_loop()))
         
-        for admin_id in Config.ADMIN_IDS:
-            try:
-                await bot_instance.send_message(
-                    chat_id=admin_id,
-                    text="🤖 <b>Бот запущен и готов к работе!</b>",
-                    parse_mode=ParseMode.HTML
-                )
-            except Exception as e:
-                logger.warning(f"Не удалось отправить уведомление администратору {admin_id}: {e}")
+        logger.info("🤖 Бот запущен и готов к работе!")
         
-        await dp.start_polling(bot_instance, allowed_updates=dp.resolve_used_update_types())
+        # Уведомление администраторам уходит параллельно и не задерживает запуск опроса
+        fan_out(outbound_instance, Config.ADMIN_IDS, lambda admin_id: SendMessage(
+            chat_id=admin_id,
+            text="🤖 <b>Бот запущен и готов к работе!</b>",
+            parse_mode=ParseMode.HTML
+        ), Priority.HIGH)
         
+        if Config.WEBHOOK_URL:
+            await run_webhook(dp, bot_instance)
+        else:
+            # Polling не работает, пока установлен вебхук (например, после смены режима)
+            await bot_instance.delete_webhook()
+            await dp.start_polling(bot_instance, allowed_updates=dp.resolve_used_update_types())
+    
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}")
         raise
@@ -0,0 +1,67 @@
+"""
+Фоновое обслуживание базы: перенос старых рассчитанных заявок в архив
+и возврат освободившегося места (incremental vacuum).
+Ручной запуск заодно доводит до конца перевод меток времени в миллисекунды.
+
+Внутри бота работает как периодическая задача (см. main.py).
+Запуск вручную при остановленном боте — разовый проход плюс полный VACUUM,
+который переводит старую базу в режим auto_vacuum=INCREMENTAL:
+
+    python maintenance.py
+"""
+import asyncio
+import logging
+
+from config import Config
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+
+async def run_maintenance(db: Database, older_than_days: int, batch_size: int, vacuum_pages: int) -> int:
+    """Один проход обслуживания; возвращает число перенесённых в архив заявок"""
+    moved = await db.archive_settled_payments(older_than_days, batch_size)
+    if moved:
+        freed = await db.incremental_vacuum(vacuum_pages)
+        logger.info(f"Maintenance: archived {moved} payments, freed {freed} pages")
+    return moved
+
+
+async def maintenance_loop(
+    db: Database,
+    older_than_days: int,
+    batch_size: int = 500,
+    interval: float = 3600,
+    vacuum_pages: int = 1000
+) -> None:
+    """Периодически архивировать заявки, пока задачу не отменят"""
+    while True:
+        try:
+            await run_maintenance(db, older_than_days, batch_size, vacuum_pages)
+        except Exception as e:
+            logger.error(f"Maintenance pass failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def main():
+    db = Database()
+    await db.init_db()
+    
+    print("🕒 Переводим метки времени в миллисекунды UTC...")
+    converted = await db.migrate_timestamps_to_epoch()
+    print(f"  ✏️ Переписано строк: {converted}")
+    
+    print(f"🔄 Переносим в архив заявки, оплаченные более {Config.ARCHIVE_AFTER_DAYS} дн. назад...")
+    moved = await db.archive_settled_payments(Config.ARCHIVE_AFTER_DAYS, Config.ARCHIVE_BATCH_SIZE)
+    print(f"  📦 Перенесено: {moved}")
+    
+    print("🧹 Полный VACUUM (может занять время)...")
+    await db.vacuum_full()
+    
+    await db.close()
+
+
+if __name__ == "__main__":
+    print("🚀 Обслуживание базы данных\n")
+    asyncio.run(main())
+    print("\n✅ Готово!")
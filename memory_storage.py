@@ -0,0 +1,339 @@
+"""
+Хранилище в памяти процесса на индексированных словарях.
+
+Реализует тот же протокол Storage, что и database.Database, без какого-либо
+I/O: годится для быстрых тестов, бенчмарков пропускной способности
+хендлеров и прототипов. Данные живут до перезапуска процесса.
+"""
+import logging
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from models import OutboxMessage, Payment
+from storage import EmployeeRow, decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    # Та же точность, что у SQLite-хранилища (миллисекунды)
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _sort_ms(value: datetime) -> int:
+    return round(value.timestamp() * 1000)
+
+
+class MemoryStorage:
+    """
+    Заявки и сотрудники в словарях с индексами под запросы бота.
+    
+    Индексы: заявки по id, ожидающие заявки по сотруднику, дневные итоги
+    выплат по (день UTC, сотрудник) — как payment_daily_rollup в SQLite.
+    Наружу отдаются копии заявок, так что вызывающий код не может
+    изменить хранилище в обход методов.
+    """
+    
+    def __init__(self):
+        self._payments: Dict[int, Payment] = {}
+        self._pending_by_employee: Dict[int, Dict[int, Payment]] = {}
+        self._rollup: Dict[Tuple[str, int], List] = {}
+        self._employees: Dict[int, dict] = {}
+        # id записи outbox -> (запись, когда пытаться, когда брошена)
+        self._outbox: Dict[int, List] = {}
+        # payment_id -> {chat_id: message_id}
+        self._admin_messages: Dict[int, Dict[int, int]] = {}
+        self._next_id = 1
+        self._next_outbox_id = 1
+    
+    async def init_db(self) -> None:
+        logger.info("In-memory storage initialized")
+    
+    async def close(self) -> None:
+        pass
+    
+    # Заявки
+    
+    def _index(self, payment: Payment) -> None:
+        pending = self._pending_by_employee.setdefault(payment.employee_id, {})
+        if payment.status == "pending":
+            pending[payment.id] = payment
+        else:
+            pending.pop(payment.id, None)
+    
+    def _add_to_rollup(self, payment: Payment, sign: int) -> None:
+        if payment.status != "paid" or payment.paid_at is None:
+            return
+        day = payment.paid_at.astimezone(timezone.utc).date().isoformat()
+        entry = self._rollup.setdefault((day, payment.employee_id), [None, 0, 0])
+        entry[0] = payment.employee_username or entry[0]
+        entry[1] += sign
+        entry[2] += sign * (payment.payment_amount or 0)
+    
+    async def create_payment(self, payment: Payment) -> int:
+        created_at = payment.created_at or _now()
+        stored = replace(
+            payment,
+            id=self._next_id,
+            payment_amount=None,
+            replied=False,
+            employee_message_id=None,
+            created_at=created_at.replace(microsecond=created_at.microsecond // 1000 * 1000),
+            paid_at=None
+        )
+        self._next_id += 1
+        self._payments[stored.id] = stored
+        self._index(stored)
+        logger.info(f"Created payment request #{stored.id} for user {stored.employee_id}")
+        return stored.id
+    
+    async def create_payments_many(self, payments: Iterable[Payment]) -> int:
+        created = 0
+        for payment in payments:
+            await self.create_payment(payment)
+            created += 1
+        return created
+    
+    async def get_payment_by_id(self, payment_id: int) -> Optional[Payment]:
+        payment = self._payments.get(payment_id)
+        return replace(payment) if payment else None
+    
+    def _sorted_pending(self, employee_id: int) -> List[Payment]:
+        pending = self._pending_by_employee.get(employee_id, {})
+        return sorted(pending.values(), key=lambda p: (p.created_at, p.id), reverse=True)
+    
+    async def get_user_pending_payments(self, employee_id: int) -> List[Payment]:
+        return [replace(p) for p in self._sorted_pending(employee_id)]
+    
+    async def get_user_pending_payments_page(
+        self,
+        employee_id: int,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        newer: bool = False
+    ) -> Tuple[List[Payment], Optional[str], Optional[str]]:
+        try:
+            payments = self._sorted_pending(employee_id)
+            if cursor:
+                position = decode_cursor(cursor)
+                if newer:
+                    payments = [p for p in payments if (_sort_ms(p.created_at), p.id) > position]
+                else:
+                    payments = [p for p in payments if (_sort_ms(p.created_at), p.id) < position]
+        except Exception as e:
+            logger.error(f"Failed to get pending payments page for user {employee_id}: {e}")
+            return [], None, None
+        
+        more = len(payments) > limit
+        # Ближайшие к курсору заявки новее него — в конце списка (новые первыми)
+        page = payments[-limit:] if newer else payments[:limit]
+        older_cursor = newer_cursor = None
+        if page and (newer or more):
+            older_cursor = encode_cursor(_sort_ms(page[-1].created_at), page[-1].id)
+        if page and (more if newer else cursor):
+            newer_cursor = encode_cursor(_sort_ms(page[0].created_at), page[0].id)
+        return [replace(p) for p in page], older_cursor, newer_cursor
+    
+    async def iter_user_pending_payments(self, employee_id: int, batch_size: int = 100) -> AsyncIterator[Payment]:
+        for payment in self._sorted_pending(employee_id):
+            yield replace(payment)
+    
+    async def settle_payment(self, payment_id: int, amount: int, notify: Sequence[str] = ()) -> Optional[Payment]:
+        payment = self._payments.get(payment_id)
+        if payment is None or payment.status != "pending":
+            return None
+        payment.status = "paid"
+        payment.payment_amount = amount
+        payment.paid_at = _now()
+        self._index(payment)
+        self._add_to_rollup(payment, 1)
+        for event in notify:
+            self._outbox[self._next_outbox_id] = [OutboxMessage(self._next_outbox_id, event, payment_id), payment.paid_at, None]
+            self._next_outbox_id += 1
+        logger.info(f"Settled payment #{payment_id} with amount {amount}")
+        return replace(payment)
+    
+    async def update_payment_status(self, payment_id: int, status: str, payment_amount: int) -> None:
+        payment = self._payments.get(payment_id)
+        if payment is None:
+            return
+        self._add_to_rollup(payment, -1)
+        payment.status = status
+        payment.payment_amount = payment_amount
+        payment.paid_at = _now()
+        self._index(payment)
+        self._add_to_rollup(payment, 1)
+        logger.info(f"Updated payment #{payment_id} to status '{status}' with amount {payment_amount}")
+    
+    async def update_payment_replied(self, payment_id: int) -> None:
+        payment = self._payments.get(payment_id)
+        if payment is not None:
+            payment.replied = True
+    
+    async def update_employee_message_id(self, payment_id: int, message_id: int) -> None:
+        payment = self._payments.get(payment_id)
+        if payment is not None:
+            payment.employee_message_id = message_id
+    
+    async def delete_payment(self, payment_id: int, employee_id: int) -> bool:
+        payment = self._payments.get(payment_id)
+        if payment is None or payment.employee_id != employee_id or payment.status != "pending":
+            return False
+        del self._payments[payment_id]
+        self._pending_by_employee[employee_id].pop(payment_id, None)
+        self._admin_messages.pop(payment_id, None)
+        logger.info(f"Deleted payment #{payment_id} for user {employee_id}")
+        return True
+    
+    async def get_statistics(self, days: int = 30) -> dict:
+        since = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+        totals: Dict[int, List] = {}
+        for (day, employee_id), (username, count, amount) in self._rollup.items():
+            if day < since:
+                continue
+            entry = totals.setdefault(employee_id, [None, 0, 0])
+            entry[0] = username or entry[0]
+            entry[1] += count
+            entry[2] += amount
+        
+        stats = {
+            'total_paid': 0,
+            'total_amount': 0,
+            'pending': sum(len(pending) for pending in self._pending_by_employee.values()),
+            'by_employee': {}
+        }
+        for employee_id, (username, count, amount) in sorted(totals.items(), key=lambda item: -item[1][2]):
+            if count <= 0:
+                continue
+            stats['total_paid'] += count
+            stats['total_amount'] += amount
+            stats['by_employee'][employee_id] = {'username': username, 'count': count, 'amount': amount}
+        return stats
+    
+    # Копии карточек у администраторов
+    
+    async def add_admin_message(self, payment_id: int, chat_id: int, message_id: int) -> None:
+        self._admin_messages.setdefault(payment_id, {})[chat_id] = message_id
+    
+    async def get_admin_messages(self, payment_id: int) -> List[Tuple[int, int]]:
+        return list(self._admin_messages.get(payment_id, {}).items())
+    
+    # Очередь уведомлений
+    
+    async def get_due_outbox(self, limit: int = 50) -> List[OutboxMessage]:
+        now = datetime.now()
+        due = [entry for entry in self._outbox.values() if entry[2] is None and entry[1] <= now]
+        due.sort(key=lambda entry: (entry[1], entry[0].id))
+        return [replace(entry[0]) for entry in due[:limit]]
+    
+    async def complete_outbox(self, outbox_id: int) -> None:
+        self._outbox.pop(outbox_id, None)
+    
+    async def retry_outbox(self, outbox_id: int, delay: float, error: str) -> None:
+        entry = self._outbox.get(outbox_id)
+        if entry is not None:
+            entry[0].attempts += 1
+            entry[0].last_error = error
+            entry[1] = datetime.now() + timedelta(seconds=delay)
+    
+    async def fail_outbox(self, outbox_id: int, error: str) -> None:
+        entry = self._outbox.get(outbox_id)
+        if entry is not None:
+            entry[0].attempts += 1
+            entry[0].last_error = error
+            entry[2] = datetime.now()
+            logger.warning(f"Outbox entry #{outbox_id} abandoned: {error}")
+    
+    # Сотрудники
+    
+    async def add_employee(self, user_id: int, username: str = None, first_name: str = None, added_by: int = 0) -> bool:
+        """Добавить сотрудника"""
+        self._employees[user_id] = {
+            'user_id': user_id,
+            'username': username,
+            'first_name': first_name,
+            'added_at': _now(),
+            'added_by': added_by,
+            'is_active': True
+        }
+        logger.info(f"Added employee {user_id} (@{username}) by admin {added_by}")
+        return True
+    
+    async def add_employees_many(self, employees: Iterable[EmployeeRow], added_by: int = 0) -> Tuple[int, int]:
+        """Добавить пачку сотрудников; уже активные пропускаются, удалённые восстанавливаются"""
+        inserted = skipped = 0
+        added_at = _now()
+        for user_id, username, first_name in employees:
+            record = self._employees.get(user_id)
+            if record is not None and record['is_active']:
+                skipped += 1
+                continue
+            if record is None:
+                record = self._employees[user_id] = {'user_id': user_id, 'username': None, 'first_name': None}
+            record.update(
+                username=username or record['username'],
+                first_name=first_name or record['first_name'],
+                added_at=added_at,
+                added_by=added_by,
+                is_active=True
+            )
+            inserted += 1
+        return inserted, skipped
+    
+    async def remove_employee(self, user_id: int) -> bool:
+        """Удалить сотрудника"""
+        record = self._employees.get(user_id)
+        if record is not None:
+            record['is_active'] = False
+        logger.info(f"Removed employee {user_id}")
+        return True
+    
+    @staticmethod
+    def _public(record: dict) -> dict:
+        return {key: record[key] for key in ('user_id', 'username', 'first_name', 'added_at')}
+    
+    def _sorted_employees(self) -> List[dict]:
+        active = (record for record in self._employees.values() if record['is_active'])
+        return sorted(active, key=lambda r: (r['added_at'], r['user_id']), reverse=True)
+    
+    async def get_all_employees(self) -> List[dict]:
+        """Получить список всех активных сотрудников"""
+        return [self._public(record) for record in self._sorted_employees()]
+    
+    async def get_employees_page(self, limit: int = 25, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Страница активных сотрудников (новые первыми) и токен следующей страницы"""
+        try:
+            employees = self._sorted_employees()
+            if cursor:
+                after = decode_cursor(cursor)
+                employees = [r for r in employees if (_sort_ms(r['added_at']), r['user_id']) < after]
+        except Exception as e:
+            logger.error(f"Failed to get employees page: {e}")
+            return [], None
+        
+        page = employees[:limit]
+        next_cursor = None
+        if len(employees) > limit:
+            next_cursor = encode_cursor(_sort_ms(page[-1]['added_at']), page[-1]['user_id'])
+        return [self._public(record) for record in page], next_cursor
+    
+    async def iter_employees(self, batch_size: int = 100) -> AsyncIterator[dict]:
+        """Перебрать активных сотрудников"""
+        for record in self._sorted_employees():
+            yield self._public(record)
+    
+    async def is_employee(self, user_id: int) -> bool:
+        """Проверить, является ли пользователь сотрудником"""
+        record = self._employees.get(user_id)
+        return record is not None and record['is_active']
+    
+    async def get_employee_count(self) -> int:
+        """Получить количество активных сотрудников"""
+        return sum(1 for record in self._employees.values() if record['is_active'])
+    
+    async def get_employee_name(self, user_id: int) -> Optional[str]:
+        """Получить имя сотрудника"""
+        record = self._employees.get(user_id)
+        return record['first_name'] if record is not None and record['is_active'] else None
@@ -0,0 +1,306 @@
+"""
+Замеры времени запросов к базе.
+
+Каждый публичный метод Database оборачивается декоратором instrument():
+на метод копятся гистограмма длительности, число вызовов, ошибок и
+прочитанных строк. Соединения отдаются через TimedConnection, который
+замеряет каждый оператор; оператор дольше порога пишется в журнал
+медленных запросов (логгер "database.slow") вместе с EXPLAIN QUERY PLAN,
+а значения параметров заменяются их типами.
+
+Снимок метрик доступен в процессе через QueryMetrics.snapshot().
+"""
+import functools
+import inspect
+import logging
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+slow_logger = logging.getLogger("database.slow")
+
+# Границы корзин гистограммы, секунды
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (накопительные счётчики, как в Prometheus)"""
+    
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+    
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Пары (верхняя граница, число наблюдений не больше неё); последняя граница — inf"""
+        result, total = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MethodStats:
+    
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+
+class _Call:
+    """Состояние одного вызова метода: строки и ошибки его операторов"""
+    
+    __slots__ = ("method", "rows", "failed")
+    
+    def __init__(self, method: str):
+        self.method = method
+        self.rows = 0
+        self.failed = False
+
+
+_current_call: ContextVar[Optional[_Call]] = ContextVar("current_db_call", default=None)
+
+
+def detach_call() -> None:
+    """Не приписывать операторы текущей задачи вызвавшему её методу (фоновые задачи)"""
+    _current_call.set(None)
+
+
+class QueryMetrics:
+    """Метрики одного экземпляра Database"""
+    
+    def __init__(self, slow_query_threshold: Optional[float] = 0.2):
+        self.slow_query_threshold = slow_query_threshold
+        self.methods: Dict[str, MethodStats] = {}
+        self.slow_queries = 0
+    
+    def record(self, method: str, duration: float, rows: int, failed: bool) -> None:
+        stats = self.methods.get(method)
+        if stats is None:
+            stats = self.methods[method] = MethodStats()
+        stats.latency.observe(duration)
+        stats.rows += rows
+        if failed:
+            stats.errors += 1
+    
+    def snapshot(self) -> Dict[str, dict]:
+        """Копия метрик по методам: calls, errors, rows, seconds, buckets"""
+        return {
+            method: {
+                'calls': stats.latency.count,
+                'errors': stats.errors,
+                'rows': stats.rows,
+                'seconds': stats.latency.sum,
+                'buckets': stats.latency.cumulative(),
+            }
+            for method, stats in self.methods.items()
+        }
+
+
+def redact_params(params: Any) -> Any:
+    """Заменить значения параметров их типами: в журнал не попадают имена и суммы"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact_params(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [None if value is None else f"<{type(value).__name__}>" for value in params]
+    return f"<{type(params).__name__}>"
+
+
+def instrument(exclude: Iterable[str] = ()):
+    """Декоратор класса: обернуть замером времени все публичные async-методы, кроме exclude"""
+    def decorator(cls):
+        for name, member in list(vars(cls).items()):
+            if name.startswith("_") or name in exclude:
+                continue
+            if inspect.iscoroutinefunction(member) or inspect.isasyncgenfunction(member):
+                setattr(cls, name, _timed(name, member))
+        return cls
+    return decorator
+
+
+def _timed(name: str, func):
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def gen_wrapper(self, *args, **kwargs):
+            # Для потоковых методов время включает и перебор строк потребителем
+            call = _Call(name)
+            started = time.perf_counter()
+            inner = func(self, *args, **kwargs)
+            try:
+                while True:
+                    # Операторы генератора приписываются вызову только на время его шага
+                    token = _current_call.set(call)
+                    try:
+                        item = await inner.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        _current_call.reset(token)
+                    yield item
+            except GeneratorExit:
+                raise
+            except BaseException:
+                call.failed = True
+                raise
+            finally:
+                await inner.aclose()
+                self.metrics.record(name, time.perf_counter() - started, call.rows, call.failed)
+        return gen_wrapper
+    
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        call = _Call(name)
+        token = _current_call.set(call)
+        started = time.perf_counter()
+        try:
+            return await func(self, *args, **kwargs)
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            _current_call.reset(token)
+            self.metrics.record(name, time.perf_counter() - started, call.rows, call.failed)
+    return wrapper
+
+
+class TimedCursor:
+    """Курсор, который считает прочитанные строки и время оператора"""
+    
+    def __init__(self, owner: "TimedConnection", cursor: aiosqlite.Cursor, sql: str, params: Any, elapsed: float):
+        self._owner = owner
+        self._cursor = cursor
+        self._sql = sql
+        self._params = params
+        self._elapsed = elapsed
+        self._done = False
+        if cursor.description is None:
+            # Оператор без результата (INSERT/UPDATE/DELETE) уже выполнен целиком
+            self._done = True
+    
+    async def _finish_if_slow(self) -> None:
+        await self._owner._check_slow(self._sql, self._params, self._elapsed)
+    
+    async def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return await fetch(*args)
+        except BaseException:
+            self._owner._mark_failed()
+            raise
+        finally:
+            self._elapsed += time.perf_counter() - started
+    
+    async def fetchone(self):
+        row = await self._timed_fetch(self._cursor.fetchone)
+        self._owner._count_rows(0 if row is None else 1)
+        await self._finish()
+        return row
+    
+    async def fetchall(self):
+        rows = await self._timed_fetch(self._cursor.fetchall)
+        self._owner._count_rows(len(rows))
+        await self._finish()
+        return rows
+    
+    async def fetchmany(self, size: Optional[int] = None):
+        rows = await self._timed_fetch(self._cursor.fetchmany, *(() if size is None else (size,)))
+        self._owner._count_rows(len(rows))
+        if not rows or (size is not None and len(rows) < size):
+            await self._finish()
+        return rows
+    
+    async def close(self) -> None:
+        await self._finish()
+        await self._cursor.close()
+    
+    async def _finish(self) -> None:
+        if not self._done:
+            self._done = True
+            await self._finish_if_slow()
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+
+class TimedConnection:
+    """Обёртка над aiosqlite.Connection с замером каждого оператора"""
+    
+    def __init__(self, connection: aiosqlite.Connection, metrics: QueryMetrics):
+        self.connection = connection
+        self._metrics = metrics
+    
+    @staticmethod
+    def _count_rows(rows: int) -> None:
+        call = _current_call.get()
+        if call is not None:
+            call.rows += rows
+    
+    @staticmethod
+    def _mark_failed() -> None:
+        call = _current_call.get()
+        if call is not None:
+            call.failed = True
+    
+    async def execute(self, sql: str, parameters: Any = None) -> TimedCursor:
+        started = time.perf_counter()
+        try:
+            cursor = await self.connection.execute(sql, parameters)
+        except BaseException:
+            self._mark_failed()
+            raise
+        cursor = TimedCursor(self, cursor, sql, parameters, time.perf_counter() - started)
+        if cursor._done:
+            await cursor._finish_if_slow()
+        return cursor
+    
+    async def executemany(self, sql: str, parameters: Iterable[Any]) -> aiosqlite.Cursor:
+        started = time.perf_counter()
+        try:
+            cursor = await self.connection.executemany(sql, parameters)
+        except BaseException:
+            self._mark_failed()
+            raise
+        await self._check_slow(sql, None, time.perf_counter() - started, explain=False)
+        return cursor
+    
+    async def _check_slow(self, sql: str, params: Any, elapsed: float, explain: bool = True) -> None:
+        threshold = self._metrics.slow_query_threshold
+        if threshold is None or elapsed < threshold:
+            return
+        self._metrics.slow_queries += 1
+        call = _current_call.get()
+        plan = ""
+        if explain and _EXPLAINABLE.match(sql):
+            try:
+                cursor = await self.connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plan = "\n".join(f"  {row[3]}" for row in await cursor.fetchall())
+            except Exception as e:
+                plan = f"  (план недоступен: {e})"
+        slow_logger.warning(
+            f"Slow query {elapsed * 1000:.1f} ms in {call.method if call else '?'}: "
+            f"{' '.join(sql.split())} params={redact_params(params)}"
+            + (f"\n{plan}" if plan else "")
+        )
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.connection, name)
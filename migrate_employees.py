@@ -1,85 +1,135 @@
 """
-Скрипт миграции сотрудников из .env в базу данных
-Запустите этот скрипт один раз для переноса существующих сотрудников
+Скрипт импорта сотрудников в базу данных
+
+Без аргументов переносит сотрудников из EMPLOYEE_IDS в .env (разовая миграция).
+С путём к CSV импортирует сотрудников из файла: колонки user_id, username,
+first_name (две последние необязательны, строка заголовка пропускается).
+Файл читается потоково и записывается пачками, по одной транзакции на пачку:
+
+    python migrate_employees.py
+    python migrate_employees.py employees.csv
 """
 import asyncio
+import csv
 import os
+import sys
+from typing import Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 from database import Database
 
 load_dotenv()
 
+# Сотрудников в одной транзакции
+CHUNK_SIZE = 1000
+
+EmployeeRow = Tuple[int, Optional[str], Optional[str]]
+
+
+def iter_env_employees(employee_ids_str: str) -> Iterator[EmployeeRow]:
+    """Сотрудники из строки EMPLOYEE_IDS ("id1,id2,...")"""
+    for id_ in employee_ids_str.split(","):
+        if id_.strip():
+            yield int(id_.strip()), None, None
+
+
+def iter_csv_employees(path: str, invalid: List[str]) -> Iterator[EmployeeRow]:
+    """Сотрудники из CSV-файла; строки с нечисловым ID попадают в invalid"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.reader(f), start=1):
+            if not row or not row[0].strip():
+                continue
+            try:
+                user_id = int(row[0].strip())
+            except ValueError:
+                if line_no > 1:  # первая строка может быть заголовком
+                    invalid.append(f"строка {line_no}: {row[0]!r}")
+                continue
+            username = (row[1].strip().lstrip("@") or None) if len(row) > 1 else None
+            first_name = (row[2].strip() or None) if len(row) > 2 else None
+            yield user_id, username, first_name
+
+
+def chunked(rows: Iterable[EmployeeRow], size: int) -> Iterator[List[EmployeeRow]]:
+    chunk: List[EmployeeRow] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def first_admin_id() -> int:
+    """ID первого администратора для записи в added_by"""
+    admin_ids_str = os.getenv("ADMIN_ID", "")
+    admin_ids = [int(id_.strip()) for id_ in admin_ids_str.split(",") if id_.strip()]
+    return admin_ids[0] if admin_ids else 0
+
 
-async def migrate_employees():
-    """Перенести сотрудников из EMPLOYEE_IDS в базу данных"""
+async def import_employees(db: Database, rows: Iterable[EmployeeRow], added_by: int) -> Tuple[int, int]:
+    """Записать сотрудников пачками по CHUNK_SIZE; возвращает (добавлено, пропущено)"""
+    inserted = skipped = 0
+    for chunk in chunked(rows, CHUNK_SIZE):
+        chunk_inserted, chunk_skipped = await db.add_employees_many(chunk, added_by=added_by)
+        inserted += chunk_inserted
+        skipped += chunk_skipped
+        print(f"  … обработано {inserted + skipped}")
+    return inserted, skipped
+
+
+async def migrate_employees(csv_path: Optional[str] = None):
+    """Импортировать сотрудников из CSV или из EMPLOYEE_IDS в базу данных"""
+    invalid: List[str] = []
+    if csv_path:
+        if not os.path.exists(csv_path):
+            print(f"❌ Файл {csv_path} не найден")
+            return
+        rows = iter_csv_employees(csv_path, invalid)
+        print(f"📋 Импорт сотрудников из {csv_path}")
+    else:
+        # Получаем список ID из .env
+        employee_ids_str = os.getenv("EMPLOYEE_IDS", "")
+        if not employee_ids_str:
+            print("❌ EMPLOYEE_IDS не найден в .env файле")
+            return
+        rows = iter_env_employees(employee_ids_str)
+        print("📋 Импорт сотрудников из EMPLOYEE_IDS")
+    
+    print(f"🔄 Начинаем миграцию...\n")
     
     db = Database()
     await db.init_db()
+    try:
+        inserted, skipped = await import_employees(db, rows, first_admin_id())
+    finally:
+        await db.close()
     
-    # Получаем список ID из .env
-    employee_ids_str = os.getenv("EMPLOYEE_IDS", "")
-    if not employee_ids_str:
-        print("❌ EMPLOYEE_IDS не найден в .env файле")
-        return
-    
-    employee_ids = [
-        int(id_.strip()) 
-        for id_ in employee_ids_str.split(",") 
-        if id_.strip()
-    ]
-    
-    if not employee_ids:
+    if inserted + skipped == 0 and not invalid:
         print("❌ Список сотрудников пуст")
         return
     
-    print(f"📋 Найдено сотрудников в .env: {len(employee_ids)}")
-    print(f"🔄 Начинаем миграцию...\n")
-    
-    # Получаем ID первого администратора для записи в added_by
-    admin_ids_str = os.getenv("ADMIN_ID", "")
-    first_admin = 0
-    if admin_ids_str:
-        admin_ids = [int(id_.strip()) for id_ in admin_ids_str.split(",") if id_.strip()]
-        if admin_ids:
-            first_admin = admin_ids[0]
-    
-    success_count = 0
-    skip_count = 0
-    
-    for emp_id in employee_ids:
-        # Проверяем, не добавлен ли уже
-        is_exists = await db.is_employee(emp_id)
-        if is_exists:
-            print(f"⏭️  ID {emp_id} - уже существует в базе, пропускаем")
-            skip_count += 1
-            continue
-        
-        # Добавляем в базу
-        success = await db.add_employee(
-            user_id=emp_id,
-            username=None,  # Не знаем username из .env
-            first_name=None,  # Не знаем имя из .env
-            added_by=first_admin
-        )
-        
-        if success:
-            print(f"✅ ID {emp_id} - успешно добавлен")
-            success_count += 1
-        else:
-            print(f"❌ ID {emp_id} - ошибка добавления")
-    
     print(f"\n📊 Результаты миграции:")
-    print(f"  ✅ Добавлено: {success_count}")
-    print(f"  ⏭️  Пропущено (уже существует): {skip_count}")
-    print(f"  📝 Всего обработано: {len(employee_ids)}")
+    print(f"  ✅ Добавлено: {inserted}")
+    print(f"  ⏭️  Пропущено (уже существует): {skipped}")
+    if invalid:
+        print(f"  ⚠️  Некорректные строки: {len(invalid)}")
+        for line in invalid[:10]:
+            print(f"     {line}")
+    print(f"  📝 Всего обработано: {inserted + skipped}")
     
-    print("\n💡 Теперь вы можете удалить строку EMPLOYEE_IDS из .env файла")
-    print("   или оставить её для совместимости (она больше не используется)")
+    cache_ttl = float(os.getenv("EMPLOYEE_CACHE_TTL", "60"))
+    if inserted and cache_ttl:
+        print(f"\n⏱ Запущенный бот увидит новых сотрудников в течение {cache_ttl:g} сек.")
+    elif inserted:
+        print("\n⚠️ EMPLOYEE_CACHE_TTL=0: перезапустите бота, чтобы новые сотрудники получили доступ")
     
-    await db.close()
+    if not csv_path:
+        print("\n💡 Теперь вы можете удалить строку EMPLOYEE_IDS из .env файла")
+        print("   или оставить её для совместимости (она больше не используется)")
 
 
 if __name__ == "__main__":
     print("🚀 Миграция сотрудников в базу данных\n")
-    asyncio.run(migrate_employees())
+    asyncio.run(migrate_employees(sys.argv[1] if len(sys.argv) > 1 else None))
     print("\n✅ Миграция завершена!")
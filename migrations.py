@@ -0,0 +1,271 @@
+"""
+Версионированные миграции схемы.
+
+Текущая версия схемы хранится в PRAGMA user_version. Каждая миграция
+выполняется ровно один раз, в собственной транзакции вместе с записью
+нового номера версии, поэтому прерванный запуск не оставляет схему
+в промежуточном состоянии. Для актуальной базы запуск сводится
+к одному чтению user_version.
+
+Новые миграции добавляются только в конец реестра с номером
+на единицу больше предыдущего; уже выпущенные миграции не меняются.
+"""
+import logging
+from typing import Awaitable, Callable, List, NamedTuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[aiosqlite.Connection], Awaitable[None]]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Зарегистрировать миграцию схемы с указанным номером версии"""
+    def decorator(func):
+        expected = len(MIGRATIONS) + 1
+        if version != expected:
+            raise ValueError(f"Migration {version} registered out of order, expected {expected}")
+        MIGRATIONS.append(Migration(version, description, func))
+        return func
+    return decorator
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+async def get_schema_version(conn: aiosqlite.Connection) -> int:
+    cursor = await conn.execute("PRAGMA user_version")
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def _column_exists(conn: aiosqlite.Connection, table: str, column: str) -> bool:
+    cursor = await conn.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in await cursor.fetchall())
+
+
+async def _add_column_if_missing(conn: aiosqlite.Connection, table: str, column: str, definition: str) -> None:
+    if not await _column_exists(conn, table, column):
+        await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def apply_migrations(conn: aiosqlite.Connection) -> int:
+    """
+    Применить все миграции новее текущей версии схемы.
+    
+    Вызывающий отвечает за то, чтобы параллельно не шли другие записи
+    через это соединение. Возвращает итоговую версию схемы.
+    """
+    current = await get_schema_version(conn)
+    target = latest_version()
+    if current >= target:
+        return current
+    
+    for step in MIGRATIONS:
+        if step.version <= current:
+            continue
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            await step.apply(conn)
+            await conn.execute(f"PRAGMA user_version = {step.version}")
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            logger.error(f"Migration {step.version} ({step.description}) failed, rolled back")
+            raise
+        logger.info(f"Applied migration {step.version}: {step.description}")
+    
+    return target
+
+
+@migration(1, "Базовая схема: сотрудники и заявки")
+async def _initial_schema(conn: aiosqlite.Connection) -> None:
+    # Базы, созданные до появления версий, уже содержат эти таблицы
+    # (user_version = 0), поэтому всё здесь идемпотентно.
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS employees (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            added_at TIMESTAMP NOT NULL,
+            added_by INTEGER NOT NULL,
+            is_active INTEGER DEFAULT 1
+        )
+    """)
+    
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            employee_username TEXT,
+            balance TEXT NOT NULL,
+            username_field TEXT NOT NULL,
+            screenshot_file_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            payment_amount INTEGER,
+            replied INTEGER DEFAULT 0,
+            employee_message_id INTEGER,
+            created_at TIMESTAMP NOT NULL,
+            paid_at TIMESTAMP
+        )
+    """)
+    
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_employee_status 
+        ON payments(employee_id, status)
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_status 
+        ON payments(status)
+    """)
+    
+    await _add_column_if_missing(conn, "payments", "replied", "INTEGER DEFAULT 0")
+    await _add_column_if_missing(conn, "payments", "employee_message_id", "INTEGER")
+    await _add_column_if_missing(conn, "payments", "employee_first_name", "TEXT")
+
+
+@migration(2, "Дневные итоги выплат для статистики")
+async def _payment_daily_rollup(conn: aiosqlite.Connection) -> None:
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS payment_daily_rollup (
+            day TEXT NOT NULL,
+            employee_id INTEGER NOT NULL,
+            employee_username TEXT,
+            paid_count INTEGER NOT NULL DEFAULT 0,
+            paid_amount INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, employee_id)
+        ) WITHOUT ROWID
+    """)
+    
+    # Разовое заполнение по уже оплаченным заявкам
+    await conn.execute("""
+        INSERT INTO payment_daily_rollup (day, employee_id, employee_username, paid_count, paid_amount)
+        SELECT date(paid_at), employee_id, MAX(employee_username), COUNT(*), COALESCE(SUM(payment_amount), 0)
+        FROM payments
+        WHERE status = 'paid' AND paid_at IS NOT NULL
+        GROUP BY date(paid_at), employee_id
+    """)
+
+
+@migration(3, "Покрывающие индексы для окон по времени и очередей заявок")
+async def _covering_indexes(conn: aiosqlite.Connection) -> None:
+    # Оплаченные заявки в окне по времени: диапазон по paid_at без обращения к таблице
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_payments_status_paid_at
+        ON payments(status, paid_at, employee_id, payment_amount)
+    """)
+    # Очередь заявок сотрудника, уже отсортированная по created_at
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_payments_employee_status_created
+        ON payments(employee_id, status, created_at)
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_employees_active_added
+        ON employees(is_active, added_at)
+    """)
+    # Старые индексы — префиксы новых
+    await conn.execute("DROP INDEX IF EXISTS idx_employee_status")
+    await conn.execute("DROP INDEX IF EXISTS idx_status")
+
+
+@migration(4, "Архив рассчитанных заявок")
+async def _payments_archive(conn: aiosqlite.Connection) -> None:
+    # Та же структура, что у payments, но id переносится как есть
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS payments_archive (
+            id INTEGER PRIMARY KEY,
+            employee_id INTEGER NOT NULL,
+            employee_username TEXT,
+            employee_first_name TEXT,
+            balance TEXT NOT NULL,
+            username_field TEXT NOT NULL,
+            screenshot_file_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            payment_amount INTEGER,
+            replied INTEGER DEFAULT 0,
+            employee_message_id INTEGER,
+            created_at TIMESTAMP NOT NULL,
+            paid_at TIMESTAMP,
+            archived_at TIMESTAMP NOT NULL
+        )
+    """)
+    # Нужен пересчёту дневных итогов, который читает и архив
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_payments_archive_status_paid_at
+        ON payments_archive(status, paid_at, employee_id, payment_amount)
+    """)
+
+
+@migration(5, "Состояние фоновых задач обслуживания")
+async def _maintenance_state(conn: aiosqlite.Connection) -> None:
+    # Позиции возобновляемых фоновых задач (например, перевода меток времени)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID
+    """)
+
+
+@migration(6, "Очередь уведомлений (outbox)")
+async def _outbox(conn: aiosqlite.Connection) -> None:
+    # Уведомления пишутся в одной транзакции с изменением заявки и отправляются фоновым воркером
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT NOT NULL,
+            payment_id INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            last_error TEXT,
+            failed_at INTEGER
+        )
+    """)
+    # Воркер читает только живые записи, срок которых подошёл
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_due
+        ON outbox(next_attempt_at) WHERE failed_at IS NULL
+    """)
+
+
+@migration(7, "Состояния FSM")
+async def _fsm_state(conn: aiosqlite.Connection) -> None:
+    # scope — остальные части ключа aiogram (бот, тема, бизнес-подключение, destiny)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_state (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            scope TEXT NOT NULL,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, user_id, scope)
+        ) WITHOUT ROWID
+    """)
+    # Удаление брошенных диалогов и подсчёт по состояниям для метрик
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state(updated_at)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_state ON fsm_state(state, updated_at)")
+
+
+@migration(8, "Копии карточек заявок у администраторов")
+async def _payment_admin_messages(conn: aiosqlite.Connection) -> None:
+    # Каждому администратору карточка новой заявки уходит отдельным сообщением;
+    # при смене статуса правятся все копии
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS payment_admin_messages (
+            payment_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            PRIMARY KEY (payment_id, chat_id)
+        ) WITHOUT ROWID
+    """)
@@ -1,9 +1,13 @@
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 
+# slots=True доступен с Python 3.10; на 3.9 модель остаётся обычным dataclass
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+
+@dataclass(**_DATACLASS_OPTIONS)
 class Payment:
     id: Optional[int] = None
     employee_id: int = 0
@@ -23,3 +27,23 @@ class Payment:
         if self.created_at is None:
             self.created_at = datetime.now()
 
+
+@dataclass(**_DATACLASS_OPTIONS)
+class OutboxMessage:
+    """Неотправленное уведомление: событие по заявке и число попыток"""
+    id: int
+    event: str
+    payment_id: int
+    attempts: int = 0
+    last_error: Optional[str] = None
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class FSMRecord:
+    """Состояние и данные диалога FSM для ключа (chat, user, scope)"""
+    chat_id: int
+    user_id: int
+    scope: str
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    updated_at: int = 0
@@ -0,0 +1,305 @@
+"""
+Метрики бота в текстовом формате Prometheus.
+
+Необязательный HTTP-эндпоинт (METRICS_PORT) отдаёт на /metrics:
+- число апдейтов по типам и длительность каждого хендлера (гистограмма, ошибки);
+- задержку и ошибки исходящих вызовов Bot API по методам;
+- время запросов к базе (Database.metrics, см. metrics.py);
+- число пользователей в каждом состоянии FSM;
+- задержку цикла событий (насколько позже срока просыпается таймер).
+
+Хендлеры замеряются middleware диспетчера, вызовы API — middleware
+сессии бота; install_metrics() подключает оба.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage as MemoryFSMStorage
+from aiogram.methods import Response, TelegramMethod
+from aiohttp import web
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "telepay"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_KEY = web.AppKey("metrics", "BotMetrics")
+
+# Задержка цикла событий обычно меньше миллисекунды, поэтому корзины мельче
+LOOP_LAG_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _Series:
+    """Гистограмма длительности и счётчик ошибок одного ряда"""
+    
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+
+
+class BotMetrics:
+    """Счётчики одного процесса бота и их вывод в формате Prometheus"""
+    
+    def __init__(self, db: Any = None, fsm_storage: Optional[BaseStorage] = None):
+        self.db = db
+        self.fsm_storage = fsm_storage
+        self.updates: Dict[str, int] = {}
+        self.handlers: Dict[Tuple[str, str], _Series] = {}
+        self.api_calls: Dict[str, _Series] = {}
+        self.api_errors: Dict[Tuple[str, str], int] = {}
+        self.loop_lag = Histogram(LOOP_LAG_BUCKETS)
+        self.loop_lag_last = 0.0
+    
+    def observe_update(self, event_type: str) -> None:
+        self.updates[event_type] = self.updates.get(event_type, 0) + 1
+    
+    def observe_handler(self, event_type: str, handler: str, duration: float, failed: bool) -> None:
+        series = self.handlers.get((event_type, handler))
+        if series is None:
+            series = self.handlers[(event_type, handler)] = _Series()
+        series.latency.observe(duration)
+        if failed:
+            series.errors += 1
+    
+    def observe_api_call(self, method: str, duration: float, error: Optional[str] = None) -> None:
+        series = self.api_calls.get(method)
+        if series is None:
+            series = self.api_calls[method] = _Series()
+        series.latency.observe(duration)
+        if error is not None:
+            series.errors += 1
+            self.api_errors[(method, error)] = self.api_errors.get((method, error), 0) + 1
+    
+    async def watch_event_loop(self, interval: float = 0.5) -> None:
+        """Фоновая задача: мерить, насколько позже срока просыпается asyncio.sleep"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - started - interval)
+            self.loop_lag_last = lag
+            self.loop_lag.observe(lag)
+    
+    async def fsm_state_counts(self) -> Dict[str, int]:
+        """Число ключей FSM в каждом состоянии (если хранилище умеет их перечислять)"""
+        storage = self.fsm_storage
+        if storage is None:
+            return {}
+        if hasattr(storage, "state_counts"):
+            return await storage.state_counts()
+        if isinstance(storage, MemoryFSMStorage):
+            counts: Dict[str, int] = {}
+            for record in storage.storage.values():
+                if record.state is not None:
+                    counts[record.state] = counts.get(record.state, 0) + 1
+            return counts
+        return {}
+    
+    async def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        out = _Exposition()
+        
+        out.family("updates_total", "counter", "Updates received, by update type")
+        for event_type, count in sorted(self.updates.items()):
+            out.sample("updates_total", {'type': event_type}, count)
+        
+        out.family("handler_duration_seconds", "histogram", "Handler run time, including middlewares")
+        for (event_type, handler), series in sorted(self.handlers.items()):
+            out.histogram("handler_duration_seconds", {'event_type': event_type, 'handler': handler}, series.latency)
+        out.family("handler_errors_total", "counter", "Handler calls that raised")
+        for (event_type, handler), series in sorted(self.handlers.items()):
+            out.sample("handler_errors_total", {'event_type': event_type, 'handler': handler}, series.errors)
+        
+        out.family("bot_api_duration_seconds", "histogram", "Bot API request latency, by method")
+        for method, series in sorted(self.api_calls.items()):
+            out.histogram("bot_api_duration_seconds", {'method': method}, series.latency)
+        out.family("bot_api_errors_total", "counter", "Failed Bot API requests, by method and error")
+        for (method, error), count in sorted(self.api_errors.items()):
+            out.sample("bot_api_errors_total", {'method': method, 'error': error}, count)
+        
+        db_metrics = getattr(self.db, "metrics", None)
+        if db_metrics is not None:
+            snapshot = db_metrics.snapshot()
+            out.family("db_query_duration_seconds", "histogram", "Database method run time")
+            for method, stats in sorted(snapshot.items()):
+                out.buckets("db_query_duration_seconds", {'method': method}, stats['buckets'], stats['seconds'])
+            out.family("db_query_errors_total", "counter", "Database method calls that raised")
+            for method, stats in sorted(snapshot.items()):
+                out.sample("db_query_errors_total", {'method': method}, stats['errors'])
+            out.family("db_rows_total", "counter", "Rows read by database methods")
+            for method, stats in sorted(snapshot.items()):
+                out.sample("db_rows_total", {'method': method}, stats['rows'])
+            out.family("db_slow_queries_total", "counter", "Statements over the slow-query threshold")
+            out.sample("db_slow_queries_total", {}, db_metrics.slow_queries)
+        
+        try:
+            states = await self.fsm_state_counts()
+        except Exception as e:
+            logger.error(f"Failed to count FSM states: {e}")
+            states = {}
+        out.family("fsm_states", "gauge", "Chats currently in each FSM state")
+        for state, count in sorted(states.items()):
+            out.sample("fsm_states", {'state': state}, count)
+        
+        out.family("event_loop_lag_seconds", "histogram", "How late asyncio timers fire")
+        out.histogram("event_loop_lag_seconds", {}, self.loop_lag)
+        out.family("event_loop_lag_last_seconds", "gauge", "Most recent event loop lag measurement")
+        out.sample("event_loop_lag_last_seconds", {}, self.loop_lag_last)
+        return out.text()
+
+
+class _Exposition:
+    """Построчная сборка текстового формата Prometheus"""
+    
+    def __init__(self):
+        self.lines: List[str] = []
+    
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        self.lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+    
+    def sample(self, name: str, labels: Dict[str, str], value: float) -> None:
+        self.lines.append(f"{PREFIX}_{name}{_format_labels(labels)} {_format_value(value)}")
+    
+    def histogram(self, name: str, labels: Dict[str, str], histogram: Histogram) -> None:
+        self.buckets(name, labels, histogram.cumulative(), histogram.sum)
+    
+    def buckets(self, name: str, labels: Dict[str, str], cumulative: List[Tuple[float, int]], total: float) -> None:
+        for bound, count in cumulative:
+            self.sample(f"{name}_bucket", {**labels, 'le': _format_value(bound)}, count)
+        self.sample(f"{name}_sum", labels, total)
+        self.sample(f"{name}_count", labels, cumulative[-1][1] if cumulative else 0)
+    
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _handler_name(handler: Any) -> str:
+    callback = getattr(handler, "callback", None)
+    if callback is None:
+        return "unknown"
+    return f"{callback.__module__}.{getattr(callback, '__qualname__', type(callback).__name__)}"
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer middleware на update: считает все входящие апдейты, в том числе необработанные"""
+    
+    def __init__(self, metrics: BotMetrics):
+        self.metrics = metrics
+    
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        self.metrics.observe_update(getattr(event, "event_type", "unknown"))
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: время и ошибки выбранного хендлера"""
+    
+    def __init__(self, metrics: BotMetrics, event_type: str):
+        self.metrics = metrics
+        self.event_type = event_type
+    
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = _handler_name(data.get("handler"))
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except SkipHandler:
+            # Хендлер отказался от апдейта, его обработает следующий
+            started = None
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            if started is not None:
+                self.metrics.observe_handler(self.event_type, name, time.perf_counter() - started, failed)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: задержка и ошибки каждого вызова Bot API"""
+    
+    def __init__(self, metrics: BotMetrics):
+        self.metrics = metrics
+    
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod
+    ) -> Response:
+        started = time.perf_counter()
+        error = None
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.metrics.observe_api_call(method.__api_method__, time.perf_counter() - started, error)
+
+
+def install_metrics(dp: Dispatcher, bot: Bot, db: Any = None) -> BotMetrics:
+    """Подключить middleware замеров к диспетчеру и сессии бота"""
+    metrics = BotMetrics(db=db, fsm_storage=dp.storage)
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    for event_type, observer in dp.observers.items():
+        if event_type in ("update", "error"):
+            continue
+        # Middleware диспетчера действует и на все вложенные роутеры
+        observer.middleware(HandlerMetricsMiddleware(metrics, event_type))
+    bot.session.middleware(RequestMetricsMiddleware(metrics))
+    return metrics
+
+
+async def _metrics_view(request: web.Request) -> web.Response:
+    body = await request.app[METRICS_KEY].render()
+    return web.Response(body=body.encode(), headers={'Content-Type': CONTENT_TYPE})
+
+
+async def start_metrics_server(metrics: BotMetrics, host: str, port: int) -> web.AppRunner:
+    """Запустить HTTP-сервер с /metrics; остановка — runner.cleanup()"""
+    app = web.Application()
+    app[METRICS_KEY] = metrics
+    app.router.add_get("/metrics", _metrics_view)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
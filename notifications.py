@@ -0,0 +1,156 @@
+"""
+Доставка уведомлений из outbox.
+
+Изменение заявки и запись события в таблицу outbox происходят в одной
+транзакции (Storage.settle_payment(..., notify=...)), а OutboxWorker в фоне
+превращает события в сообщения и отправляет их через OutboundScheduler.
+Хендлер отвечает администратору сразу после коммита; уведомление не
+теряется ни при ошибке сети, ни при перезапуске бота — незавершённые
+записи подхватываются при следующем старте.
+
+Повторы: TelegramRetryAfter откладывает запись ровно на retry_after,
+сетевые и серверные ошибки — с экспоненциальной задержкой, а ошибки,
+которые повтор не исправит (чат не найден, бот заблокирован), и
+исчерпание попыток помечают запись как брошенную (failed_at).
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage, SendPhoto, TelegramMethod
+
+from captions import employee_name, employee_paid_notice, group_paid_announcement
+from config import Config
+from models import OutboxMessage, Payment
+from outbound import OutboundScheduler, Priority
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_PAID_GROUP = "payment_paid_group"
+PAYMENT_PAID_EMPLOYEE = "payment_paid_employee"
+
+# События, которые пишутся при оплате заявки
+PAYMENT_PAID_EVENTS = (PAYMENT_PAID_GROUP, PAYMENT_PAID_EMPLOYEE)
+
+
+async def _render_paid_group(db: Storage, payment: Payment) -> TelegramMethod:
+    return SendPhoto(
+        chat_id=Config.GROUP_CHAT_ID,
+        photo=payment.screenshot_file_id,
+        caption=group_paid_announcement(payment, await employee_name(db, payment)),
+        parse_mode="HTML"
+    )
+
+
+async def _render_paid_employee(db: Storage, payment: Payment) -> TelegramMethod:
+    return SendMessage(
+        chat_id=payment.employee_id,
+        text=employee_paid_notice(payment, await employee_name(db, payment)),
+        parse_mode="HTML"
+    )
+
+
+Renderer = Callable[[Storage, Payment], Awaitable[TelegramMethod]]
+
+# Событие -> (приоритет в очереди отправки, построение сообщения)
+RENDERERS: Dict[str, Tuple[Priority, Renderer]] = {
+    PAYMENT_PAID_GROUP: (Priority.NORMAL, _render_paid_group),
+    PAYMENT_PAID_EMPLOYEE: (Priority.LOW, _render_paid_employee),
+}
+
+
+class OutboxWorker:
+    """Фоновая отправка записей outbox с повторами"""
+    
+    def __init__(
+        self,
+        db: Storage,
+        outbound: OutboundScheduler,
+        poll_interval: float = 5.0,
+        batch_size: int = 50,
+        max_attempts: int = 8,
+        base_delay: float = 2.0,
+        max_delay: float = 600.0
+    ):
+        self.db = db
+        self.outbound = outbound
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._wakeup = asyncio.Event()
+        self._in_flight: Dict[int, asyncio.Task] = {}
+    
+    def wake(self) -> None:
+        """Проверить очередь сейчас, не дожидаясь poll_interval (вызывать после коммита)"""
+        self._wakeup.set()
+    
+    def backoff(self, attempts: int) -> float:
+        """Задержка перед следующей попыткой после attempts неудачных"""
+        return min(self.max_delay, self.base_delay * 2 ** attempts)
+    
+    async def run(self) -> None:
+        """Цикл воркера; при отмене незавершённые записи остаются в outbox до следующего запуска"""
+        try:
+            while True:
+                self._wakeup.clear()
+                if len(self._in_flight) < self.batch_size:
+                    for entry in await self.db.get_due_outbox(self.batch_size + len(self._in_flight)):
+                        if len(self._in_flight) >= self.batch_size:
+                            break
+                        if entry.id not in self._in_flight:
+                            self._in_flight[entry.id] = asyncio.create_task(self._deliver(entry))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in self._in_flight.values():
+                task.cancel()
+            await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+    
+    async def _deliver(self, entry: OutboxMessage) -> None:
+        try:
+            await self._attempt(entry)
+        except Exception as e:
+            # Ошибка записи результата: запись останется в очереди и будет отправлена ещё раз
+            logger.error(f"Outbox entry #{entry.id} bookkeeping failed: {e}")
+        finally:
+            self._in_flight.pop(entry.id, None)
+            if len(self._in_flight) == self.batch_size - 1:
+                # Пачка была заполнена: есть место для следующих записей
+                self._wakeup.set()
+    
+    async def _attempt(self, entry: OutboxMessage) -> None:
+        renderer = RENDERERS.get(entry.event)
+        if renderer is None:
+            await self.db.fail_outbox(entry.id, f"unknown event {entry.event!r}")
+            return
+        payment = await self.db.get_payment_by_id(entry.payment_id)
+        if payment is None:
+            await self.db.fail_outbox(entry.id, f"payment #{entry.payment_id} not found")
+            return
+        
+        priority, render = renderer
+        try:
+            await self.outbound.send(await render(self.db, payment), priority)
+        except TelegramRetryAfter as e:
+            await self.db.retry_outbox(entry.id, e.retry_after, _describe(e))
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            await self.db.fail_outbox(entry.id, _describe(e))
+        except Exception as e:
+            if entry.attempts + 1 >= self.max_attempts:
+                await self.db.fail_outbox(entry.id, _describe(e))
+            else:
+                delay = self.backoff(entry.attempts)
+                logger.warning(f"Outbox entry #{entry.id} ({entry.event}) failed, retry in {delay:.0f}s: {_describe(e)}")
+                await self.db.retry_outbox(entry.id, delay, _describe(e))
+        else:
+            await self.db.complete_outbox(entry.id)
+
+
+def _describe(error: Exception) -> str:
+    return str(error) or type(error).__name__
@@ -0,0 +1,388 @@
+"""
+Исходящие сообщения с учётом лимитов Telegram.
+
+Telegram ограничивает рассылку примерно 30 сообщениями в секунду на бота,
+1 сообщением в секунду в личный чат и 20 сообщениями в минуту в группу;
+при превышении приходит 429 (TelegramRetryAfter). OutboundScheduler
+пропускает вызовы Bot API через общий token bucket и bucket каждого чата,
+а из готовых к отправке чатов первым обслуживает самый важный класс
+(Priority). Внутри одного чата и класса порядок сохраняется.
+
+    await outbound.send(method, Priority.HIGH)        # дождаться результата
+    outbound.send_nowait(method, Priority.LOW)        # не ждать, ошибки в лог
+    fan_out(outbound, chat_ids, build_method)         # один вызов многим получателям
+
+Если Telegram всё же ответил 429, чат ставится на паузу на retry_after
+секунд, а сообщение возвращается в начало своей очереди. Лимит групп
+(20 в минуту) свой у каждой группы, поэтому 429 из группы останавливает
+только её; 429 из личного чата означает общий лимит бота, и на паузу
+встаёт вся отправка.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Классы исходящих сообщений: меньше значение — раньше отправка"""
+    HIGH = 0     # алерты администраторам, правки карточек при оплате
+    NORMAL = 1   # объявления в групповой чат
+    LOW = 2      # уведомления сотрудникам
+
+
+def _is_group(chat_id: Any) -> bool:
+    # Отрицательные id и @username — группы и каналы, положительные — личные чаты
+    return not (isinstance(chat_id, int) and chat_id > 0)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+    
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+    
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до следующего токена (0 — можно сейчас)"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+    
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+    
+    def pause(self, now: float, seconds: float) -> None:
+        """Не выдавать токены seconds секунд (ответ 429); после паузы доступен один токен"""
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = min(self.capacity, 1)
+        self.updated = self.paused_until
+    
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "method", "future", "timeout", "attempts")
+    
+    def __init__(
+        self,
+        priority: int,
+        seq: int,
+        method: TelegramMethod,
+        future: asyncio.Future,
+        timeout: Optional[float] = None
+    ):
+        self.priority = priority
+        self.seq = seq
+        self.method = method
+        self.future = future
+        self.timeout = timeout
+        self.attempts = 0
+    
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundScheduler:
+    """
+    Очередь исходящих вызовов Bot API с лимитами и приоритетами.
+    
+    Один фоновый цикл выбирает следующее сообщение: из чатов, чей bucket
+    готов, берётся голова с наименьшим (приоритет, порядковый номер), и
+    только если есть токен в общем bucket. Сам запрос выполняется отдельной
+    задачей, так что медленный ответ API не тормозит остальные чаты.
+    """
+    
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = 30.0,
+        private_rate: float = 1.0,
+        group_rate_per_minute: float = 20.0,
+        max_retries: int = 3,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.bot = bot
+        self.private_rate = private_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max_retries
+        self._clock = clock
+        # Запас в один токен: сообщения идут равномерно, без всплеска в начале секунды
+        self._global = TokenBucket(global_rate, 1, clock())
+        self._buckets: Dict[Any, TokenBucket] = {}
+        self._queues: Dict[Any, List[_Job]] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._closed = False
+    
+    def _bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if _is_group(chat_id) else self.private_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, 1, self._clock())
+        return bucket
+    
+    @property
+    def closed(self) -> bool:
+        """Очередь закрыта: новые вызовы не принимаются"""
+        return self._closed
+    
+    def pending(self) -> int:
+        """Сообщений в очереди (без уже отправляемых)"""
+        return sum(len(queue) for queue in self._queues.values())
+    
+    def send_nowait(self, method: TelegramMethod, priority: Priority = Priority.NORMAL) -> asyncio.Future:
+        """Поставить вызов в очередь и сразу вернуться; ошибка доставки пишется в лог"""
+        future = self._enqueue(method, priority)
+        future.add_done_callback(lambda f, name=method.__api_method__: _log_failure(f, name))
+        return future
+    
+    async def send(
+        self,
+        method: TelegramMethod,
+        priority: Priority = Priority.NORMAL,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Поставить вызов в очередь и дождаться ответа Bot API; отмена ожидания снимает его с очереди.
+        
+        timeout ограничивает сам запрос к API (каждую попытку), а не время
+        в очереди: по истечении вызов завершается asyncio.TimeoutError.
+        """
+        future = self._enqueue(method, priority, timeout)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Уже начатый запрос доедет, ещё не начатый — не будет отправлен
+            future.cancel()
+            raise
+    
+    def _enqueue(self, method: TelegramMethod, priority: Priority, timeout: Optional[float] = None) -> asyncio.Future:
+        if self._closed:
+            raise RuntimeError("Outbound scheduler is closed")
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(int(priority), next(self._seq), method, future, timeout)
+        chat_id = getattr(method, "chat_id", None)
+        heapq.heappush(self._queues.setdefault(chat_id, []), job)
+        self._bucket(chat_id)
+        self._wakeup.set()
+        return future
+    
+    def _next_job(self, now: float) -> Tuple[Optional[_Job], float]:
+        """Следующее готовое к отправке сообщение или сколько ждать до него"""
+        best_chat, wait = None, None
+        for chat_id in list(self._queues):
+            queue = self._queues[chat_id]
+            bucket = self._buckets[chat_id]
+            # Отменённые вызовы не тратят лимит
+            while queue and queue[0].future.cancelled():
+                heapq.heappop(queue)
+            if not queue:
+                del self._queues[chat_id]
+                continue
+            delay = bucket.delay(now)
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+            elif best_chat is None or queue[0] < self._queues[best_chat][0]:
+                best_chat = chat_id
+        
+        if best_chat is None:
+            return None, wait
+        global_delay = self._global.delay(now)
+        if global_delay > 0:
+            return None, global_delay
+        job = heapq.heappop(self._queues[best_chat])
+        self._buckets[best_chat].take(now)
+        self._global.take(now)
+        return job, 0.0
+    
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            job, wait = self._next_job(self._clock())
+            if job is not None:
+                self._in_flight.add(asyncio.create_task(self._deliver(job)))
+                continue
+            if self._closed and not self._queues and not self._in_flight:
+                return
+            self._forget_idle_chats()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _forget_idle_chats(self) -> None:
+        now = self._clock()
+        for chat_id in [c for c, bucket in self._buckets.items() if c not in self._queues and bucket.idle(now)]:
+            del self._buckets[chat_id]
+    
+    async def _deliver(self, job: _Job) -> None:
+        job.attempts += 1
+        try:
+            result = await asyncio.wait_for(self.bot(job.method), job.timeout)
+        except TelegramRetryAfter as e:
+            chat_id = getattr(job.method, "chat_id", None)
+            logger.warning(
+                f"Flood control for chat {chat_id}: retry after {e.retry_after}s "
+                f"({job.method.__api_method__}, attempt {job.attempts})"
+            )
+            if job.attempts > self.max_retries:
+                _resolve(job.future, exception=e)
+            else:
+                now = self._clock()
+                self._bucket(chat_id).pause(now, e.retry_after)
+                if chat_id is None or not _is_group(chat_id):
+                    self._global.pause(now, e.retry_after)
+                heapq.heappush(self._queues.setdefault(chat_id, []), job)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            _resolve(job.future, exception=e)
+        else:
+            _resolve(job.future, result=result)
+        finally:
+            self._in_flight.discard(asyncio.current_task())
+            self._wakeup.set()
+    
+    async def close(self, timeout: float = 5.0) -> None:
+        """Дождаться отправки очереди (не дольше timeout) и остановить цикл"""
+        self._closed = True
+        if self._worker is None:
+            return
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._worker), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Outbound queue not drained on shutdown: {self.pending()} messages dropped")
+            self._worker.cancel()
+            for task in list(self._in_flight):
+                task.cancel()
+            for queue in self._queues.values():
+                for job in queue:
+                    job.future.cancel()
+            self._queues.clear()
+            await asyncio.gather(self._worker, *self._in_flight, return_exceptions=True)
+
+
+class FanOut:
+    """Идущая рассылка одного сообщения нескольким получателям"""
+    
+    def __init__(self, tasks: Dict[Any, asyncio.Task]):
+        self.tasks = tasks
+    
+    async def any_delivered(self) -> bool:
+        """Дождаться первой успешной доставки (True) или провала всех (False); остальные продолжают идти"""
+        for finished in asyncio.as_completed(list(self.tasks.values())):
+            try:
+                await finished
+                return True
+            except Exception:
+                continue
+        return False
+    
+    async def delivered(self) -> AsyncIterator[Tuple[Any, Any]]:
+        """Успешные доставки по мере завершения: (получатель, ответ API)"""
+        pending = {task: recipient for recipient, task in self.tasks.items()}
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                recipient = pending.pop(task)
+                if not task.cancelled() and task.exception() is None:
+                    yield recipient, task.result()
+    
+    async def wait(self) -> Dict[Any, Any]:
+        """Дождаться всех доставок: получатель -> ответ API или исключение"""
+        results = await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        return dict(zip(self.tasks, results))
+
+
+def fan_out(
+    outbound: OutboundScheduler,
+    recipients: Iterable[Any],
+    build: Callable[[Any], TelegramMethod],
+    priority: Priority = Priority.HIGH,
+    concurrency: int = 5,
+    timeout: float = 10.0
+) -> FanOut:
+    """
+    Отправить сообщение всем recipients параллельно, не больше concurrency сразу.
+    
+    build(chat_id) строит вызов для получателя. Запрос к API, не уложившийся
+    в timeout секунд, считается неудачной доставкой, чтобы один медленный
+    чат не задерживал остальных. Отсчёт идёт с момента, когда планировщик
+    взял сообщение из очереди: ожидание лимитов не в счёт, и стоящее
+    в очереди сообщение не теряется. Ошибки пишутся в лог.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def deliver(chat_id: Any) -> Any:
+        async with semaphore:
+            try:
+                return await outbound.send(build(chat_id), priority, timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Delivery to {chat_id} timed out after {timeout}s")
+                raise
+            except Exception as e:
+                logger.error(f"Delivery to {chat_id} failed: {e}")
+                raise
+    
+    tasks = {chat_id: asyncio.create_task(deliver(chat_id)) for chat_id in dict.fromkeys(recipients)}
+    for task in tasks.values():
+        # Держим ссылку, пока доставка идёт: вызывающий может не ждать всех получателей
+        _fan_out_tasks.add(task)
+        task.add_done_callback(_forget_fan_out_task)
+    return FanOut(tasks)
+
+
+_fan_out_tasks: Set[asyncio.Task] = set()
+
+
+def _forget_fan_out_task(task: asyncio.Task) -> None:
+    _fan_out_tasks.discard(task)
+    # Ошибка уже в логе; забираем её, даже если результат никто не ждёт
+    if not task.cancelled():
+        task.exception()
+
+
+def _resolve(future: asyncio.Future, result: Any = None, exception: Optional[BaseException] = None) -> None:
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+def _log_failure(future: asyncio.Future, method: str) -> None:
+    # Забираем исключение, чтобы неожидаемые future не давали "exception was never retrieved"
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Outbound {method} failed: {error}")
@@ -0,0 +1,123 @@
+"""
+Интерфейс хранилища заявок и сотрудников.
+
+Хендлеры работают с хранилищем только через протокол Storage, поэтому
+движок выбирается конфигурацией (STORAGE_BACKEND) без правки хендлеров:
+database.Database — SQLite, memory_storage.MemoryStorage — словари
+в памяти процесса (тесты, бенчмарки без I/O, прототипы).
+"""
+import base64
+from typing import Any, AsyncIterator, Iterable, List, Optional, Protocol, Sequence, Tuple, runtime_checkable
+
+from models import OutboxMessage, Payment
+
+EmployeeRow = Tuple[int, Optional[str], Optional[str]]
+
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """
+    Упаковать позицию (значение сортировки, id) в непрозрачный токен продолжения.
+    
+    sort_value=None — токен только с id: значение сортировки движок находит
+    по id сам. Так токен остаётся коротким, когда само значение длинное.
+    """
+    if sort_value is None:
+        kind, sort_value = "r", ""
+    else:
+        kind = "i" if isinstance(sort_value, int) else "s"
+    raw = f"{kind}{sort_value}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Any, int]:
+    """Позиция из токена; значение сортировки None, если в токене только id"""
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+    kind, body = raw[0], raw[1:]
+    sort_value, row_id = body.rsplit("|", 1)
+    if kind == "r":
+        return None, int(row_id)
+    return (int(sort_value) if kind == "i" else sort_value), int(row_id)
+
+
+@runtime_checkable
+class Storage(Protocol):
+    """
+    Операции с заявками и сотрудниками, которые нужны боту.
+    
+    Семантика общая для всех движков: чтения при ошибке возвращают пустой
+    результат, записи пробрасывают исключение; страницы отдаются вместе
+    с токеном продолжения (None — страниц больше нет). Сотрудники
+    возвращаются словарями с ключами user_id, username, first_name, added_at.
+    """
+    
+    async def init_db(self) -> None: ...
+    
+    async def close(self) -> None: ...
+    
+    # Заявки
+    
+    async def create_payment(self, payment: Payment) -> int: ...
+    
+    async def create_payments_many(self, payments: Iterable[Payment]) -> int: ...
+    
+    async def get_payment_by_id(self, payment_id: int) -> Optional[Payment]: ...
+    
+    async def get_user_pending_payments(self, employee_id: int) -> List[Payment]: ...
+    
+    async def get_user_pending_payments_page(
+        self,
+        employee_id: int,
+        limit: int = 10,
+        cursor: Optional[str] = None,
+        newer: bool = False
+    ) -> Tuple[List[Payment], Optional[str], Optional[str]]: ...
+    
+    def iter_user_pending_payments(self, employee_id: int, batch_size: int = 100) -> AsyncIterator[Payment]: ...
+    
+    async def settle_payment(self, payment_id: int, amount: int, notify: Sequence[str] = ()) -> Optional[Payment]: ...
+    
+    async def update_payment_status(self, payment_id: int, status: str, payment_amount: int) -> None: ...
+    
+    async def update_payment_replied(self, payment_id: int) -> None: ...
+    
+    async def update_employee_message_id(self, payment_id: int, message_id: int) -> None: ...
+    
+    async def delete_payment(self, payment_id: int, employee_id: int) -> bool: ...
+    
+    async def get_statistics(self, days: int = 30) -> dict: ...
+    
+    # Копии карточки заявки у администраторов: (chat_id, message_id)
+    
+    async def add_admin_message(self, payment_id: int, chat_id: int, message_id: int) -> None: ...
+    
+    async def get_admin_messages(self, payment_id: int) -> List[Tuple[int, int]]: ...
+    
+    # Очередь уведомлений
+    
+    async def get_due_outbox(self, limit: int = 50) -> List[OutboxMessage]: ...
+    
+    async def complete_outbox(self, outbox_id: int) -> None: ...
+    
+    async def retry_outbox(self, outbox_id: int, delay: float, error: str) -> None: ...
+    
+    async def fail_outbox(self, outbox_id: int, error: str) -> None: ...
+    
+    # Сотрудники
+    
+    async def add_employee(self, user_id: int, username: str = None, first_name: str = None, added_by: int = 0) -> bool: ...
+    
+    async def add_employees_many(self, employees: Iterable[EmployeeRow], added_by: int = 0) -> Tuple[int, int]: ...
+    
+    async def remove_employee(self, user_id: int) -> bool: ...
+    
+    async def get_all_employees(self) -> List[dict]: ...
+    
+    async def get_employees_page(self, limit: int = 25, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]: ...
+    
+    def iter_employees(self, batch_size: int = 100) -> AsyncIterator[dict]: ...
+    
+    async def is_employee(self, user_id: int) -> bool: ...
+    
+    async def get_employee_count(self) -> int: ...
+    
+    async def get_employee_name(self, user_id: int) -> Optional[str]: ...
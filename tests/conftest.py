@@ -0,0 +1,113 @@
+"""
+Shared test fixtures
+A temporary SQLite database per test and a recording Bot API stand-in.
+"""
+import pytest
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto
+from aiogram.types import Chat, Message
+
+from database import Database
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path of the test's database file inside its temporary directory"""
+    return str(tmp_path / "test.db")
+
+
+@pytest.fixture
+async def make_db(db_path):
+    """Factory for initialized databases at db_path; all of them are closed after the test"""
+    created = []
+    
+    async def make(**kwargs):
+        test_db = Database(db_path, **kwargs)
+        await test_db.init_db()
+        created.append(test_db)
+        return test_db
+    
+    yield make
+    for test_db in reversed(created):
+        await test_db.close()
+
+
+@pytest.fixture
+async def db(make_db):
+    """Initialized test database with default settings"""
+    return await make_db()
+
+
+class FakeBot:
+    """
+    Records Bot API calls instead of sending them.
+    
+    sent / sent_at — delivered methods and the loop time of each delivery.
+    errors — raised in order on the first calls, whatever the chat;
+    failures — chat_id -> errors raised on the first calls to that chat;
+    blocked — chats that always answer "chat not found";
+    gates — chat_id -> asyncio.Event the delivery waits for;
+    delays — chat_id -> latency in seconds (max_active tracks concurrency).
+    sendMessage answers with its text, sendPhoto with a Message whose id is
+    chat_id * 10, anything else with True.
+    """
+    
+    def __init__(self, errors=(), failures=None, blocked=(), gates=None, delays=None):
+        self.sent = []
+        self.sent_at = []
+        self.errors = list(errors)
+        self.failures = failures or {}
+        self.blocked = set(blocked)
+        self.gates = gates or {}
+        self.delays = delays or {}
+        self.active = 0
+        self.max_active = 0
+    
+    @property
+    def edits(self):
+        """Caption edits as (chat_id, message_id, caption, reply_markup)"""
+        return [
+            (m.chat_id, m.message_id, m.caption, m.reply_markup)
+            for m in self.sent if m.__api_method__ == "editMessageCaption"
+        ]
+    
+    async def __call__(self, method):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            return await self._deliver(method)
+        finally:
+            self.active -= 1
+    
+    async def _deliver(self, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id in self.gates:
+            await self.gates[chat_id].wait()
+        if chat_id in self.delays:
+            await asyncio.sleep(self.delays[chat_id])
+        if self.errors:
+            error = self.errors.pop(0)
+            error.method = method
+            raise error
+        if self.failures.get(chat_id):
+            raise self.failures[chat_id].pop(0)
+        if chat_id in self.blocked:
+            raise TelegramBadRequest(method=method, message="chat not found")
+        
+        self.sent.append(method)
+        self.sent_at.append(asyncio.get_running_loop().time())
+        if isinstance(method, SendPhoto):
+            return Message(
+                message_id=chat_id * 10,
+                date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                caption=method.caption
+            )
+        return getattr(method, "text", True)
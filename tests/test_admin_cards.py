@@ -0,0 +1,101 @@
+"""
+Admin card synchronization tests
+Tracking every admin's copy of a request card and editing all of them.
+Run with: pytest tests/
+"""
+import pytest
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram.methods import SendPhoto
+
+import admin_cards
+from admin_cards import edit_admin_cards, track_admin_cards
+from captions import admin_card, admin_card_markup
+from memory_storage import MemoryStorage
+from models import Payment
+from outbound import OutboundScheduler, fan_out
+from tests.conftest import FakeBot
+
+
+async def new_request(storage):
+    """Заявка в хранилище и её карточка для администраторов"""
+    payment_id = await storage.create_payment(Payment(
+        employee_id=100, employee_first_name="Иван", balance="100$",
+        username_field="@acc", screenshot_file_id="file"
+    ))
+    payment = await storage.get_payment_by_id(payment_id)
+    return payment_id, admin_card(payment, "Иван"), admin_card_markup(payment)
+
+
+class TestAdminCards:
+    """Test cases for cross-admin card synchronization"""
+    
+    @pytest.mark.asyncio
+    async def test_tracks_delivered_copies(self):
+        """Test that every delivered copy is stored and failed ones are skipped"""
+        storage = MemoryStorage()
+        outbound = OutboundScheduler(FakeBot(blocked={3}), global_rate=1000, private_rate=1000)
+        delivery = fan_out(outbound, [1, 2, 3], lambda chat_id: SendPhoto(chat_id=chat_id, photo="file", caption="card"))
+        
+        await track_admin_cards(outbound, storage, 7, delivery, "card")
+        await outbound.close()
+        
+        assert sorted(await storage.get_admin_messages(7)) == [(1, 10), (2, 20)]
+    
+    @pytest.mark.asyncio
+    async def test_edits_every_copy_once(self):
+        """Test that a status change is applied to all copies, including the clicked one"""
+        bot = FakeBot()
+        outbound = OutboundScheduler(bot, global_rate=1000, private_rate=1000)
+        
+        results = await edit_admin_cards(outbound, [(1, 10), (2, 20), (1, 10)], "✅ <b>Оплачено</b>").wait()
+        await outbound.close()
+        
+        assert results == {1: True, 2: True}
+        assert sorted(bot.edits) == [(1, 10, "✅ <b>Оплачено</b>", None), (2, 20, "✅ <b>Оплачено</b>", None)]
+    
+    @pytest.mark.asyncio
+    async def test_tracked_copies_skip_identical_edit(self):
+        """Test that copies already showing the caption are not edited again"""
+        storage = MemoryStorage()
+        payment_id, caption, markup = await new_request(storage)
+        bot = FakeBot()
+        outbound = OutboundScheduler(bot, global_rate=1000, private_rate=1000)
+        delivery = fan_out(outbound, [31, 32], lambda chat_id: SendPhoto(chat_id=chat_id, photo="file", caption=caption, reply_markup=markup))
+        await track_admin_cards(outbound, storage, payment_id, delivery, caption, markup)
+        
+        results = await edit_admin_cards(outbound, await storage.get_admin_messages(payment_id), caption, markup).wait()
+        await outbound.close()
+        
+        assert results == {}
+        assert bot.edits == []
+    
+    @pytest.mark.asyncio
+    async def test_copy_recorded_after_status_change_is_edited(self):
+        """Test that a copy delivered after an admin paid the request still gets the paid card"""
+        storage = MemoryStorage()
+        payment_id, caption, markup = await new_request(storage)
+        slow_admin = asyncio.Event()
+        bot = FakeBot(gates={42: slow_admin})
+        outbound = OutboundScheduler(bot, global_rate=1000, private_rate=1000)
+        delivery = fan_out(outbound, [41, 42], lambda chat_id: SendPhoto(chat_id=chat_id, photo="file", caption=caption, reply_markup=markup))
+        tracking = track_admin_cards(outbound, storage, payment_id, delivery, caption, markup)
+        
+        while not await storage.get_admin_messages(payment_id):
+            await asyncio.sleep(0.01)
+        paid = await storage.settle_payment(payment_id, 15)
+        paid_caption = admin_card(paid, "Иван")
+        await edit_admin_cards(outbound, await storage.get_admin_messages(payment_id), paid_caption).wait()
+        assert bot.edits == [(41, 410, paid_caption, None)]
+        
+        slow_admin.set()
+        await admin_cards.drain()
+        await outbound.close()
+        
+        assert tracking.done()
+        assert sorted(await storage.get_admin_messages(payment_id)) == [(41, 410), (42, 420)]
+        assert bot.edits == [(41, 410, paid_caption, None), (42, 420, paid_caption, None)]
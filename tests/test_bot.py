@@ -11,8 +11,10 @@ from datetime import datetime
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from database import Database
+from database import Database, PaymentMapper, to_epoch_ms
+from keyboards import get_my_payments_keyboard
 from models import Payment
+from migrations import latest_version
 from utils import Validator
 
 
@@ -86,17 +88,6 @@ class TestValidator:
 class TestDatabase:
     """Test cases for Database class"""
     
-    @pytest.fixture
-    async def db(self):
-        """Create a test database"""
-        test_db = Database("test_bot.db")
-        await test_db.init_db()
-        yield test_db
-        await test_db.close()
-        # Cleanup
-        if os.path.exists("test_bot.db"):
-            os.remove("test_bot.db")
-    
     @pytest.mark.asyncio
     async def test_create_payment(self, db):
         """Test creating a payment request"""
@@ -212,6 +203,712 @@ class TestDatabase:
         assert stats['total_paid'] == 3
         assert stats['total_amount'] > 0
         assert len(stats['by_employee']) == 3
+    
+    @pytest.mark.asyncio
+    async def test_settle_payment_only_once(self, db):
+        """Test that concurrent settlements pay a request exactly once"""
+        payment_id = await db.create_payment(Payment(
+            employee_id=12345, employee_username="test_user", balance="100$",
+            username_field="@test_account", screenshot_file_id="test_file_id"
+        ))
+        
+        results = await asyncio.gather(*(db.settle_payment(payment_id, 15 + i) for i in range(5)))
+        settled = [payment for payment in results if payment is not None]
+        
+        assert len(settled) == 1
+        assert settled[0].id == payment_id
+        assert settled[0].status == "paid"
+        assert settled[0].username_field == "@test_account"
+        assert settled[0].paid_at is not None
+        
+        stored = await db.get_payment_by_id(payment_id)
+        assert stored.payment_amount == settled[0].payment_amount
+        stats = await db.get_statistics()
+        assert stats['total_paid'] == 1
+        assert stats['total_amount'] == settled[0].payment_amount
+        
+        assert await db.settle_payment(payment_id, 25) is None
+        assert await db.settle_payment(999999, 25) is None
+    
+    @pytest.mark.asyncio
+    async def test_add_employees_many(self, db):
+        """Test bulk insert: active employees are skipped, removed ones come back"""
+        await db.add_employee(1, "active", "Активный", 100)
+        await db.add_employee(2, "removed", "Удалённый", 100)
+        await db.remove_employee(2)
+        
+        inserted, skipped = await db.add_employees_many(
+            [(1, None, None), (2, None, None), (3, "new", "Новый"), (3, None, None)],
+            added_by=100
+        )
+        
+        assert (inserted, skipped) == (2, 2)
+        assert await db.get_employee_count() == 3
+        assert await db.get_employee_name(1) == "Активный"
+        # Имя восстановленного сотрудника сохраняется
+        assert await db.get_employee_name(2) == "Удалённый"
+        assert await db.get_employee_name(3) == "Новый"
+        assert await db.add_employees_many([]) == (0, 0)
+    
+    @pytest.mark.asyncio
+    async def test_create_payments_many(self, db):
+        """Test bulk creation of payment requests in one transaction"""
+        created = await db.create_payments_many(
+            Payment(employee_id=7, balance="100$", username_field=f"@acc{i}", screenshot_file_id=f"file_{i}")
+            for i in range(50)
+        )
+        
+        assert created == 50
+        payments = await db.get_user_pending_payments(7)
+        assert len(payments) == 50
+        assert {p.username_field for p in payments} == {f"@acc{i}" for i in range(50)}
+    
+    @pytest.mark.asyncio
+    async def test_connection_is_reused(self, db):
+        """Test that all writes share one configured connection"""
+        first = await db.connect()
+        async with db.transaction() as second:
+            assert first is second
+        cursor = await first.execute("PRAGMA journal_mode")
+        row = await cursor.fetchone()
+        assert row[0] == "wal"
+        cursor = await first.execute("PRAGMA synchronous")
+        row = await cursor.fetchone()
+        assert row[0] == 1  # NORMAL
+    
+    @pytest.mark.asyncio
+    async def test_transaction_rollback(self, db):
+        """Test that a failed transaction leaves no partial writes"""
+        with pytest.raises(RuntimeError):
+            async with db.transaction() as conn:
+                await conn.execute(
+                    "INSERT INTO employees (user_id, added_at, added_by) VALUES (?, ?, ?)",
+                    (1, datetime.now(), 0)
+                )
+                raise RuntimeError("boom")
+        
+        assert await db.is_employee(1) is False
+    
+    @pytest.mark.asyncio
+    async def test_close_releases_connection(self, db):
+        """Test that close() really closes the shared connection"""
+        async with db.get_connection():
+            pass
+        assert db._connection is not None
+        await db.close()
+        assert db._connection is None
+        
+        # Соединение открывается заново по требованию
+        assert await db.get_employee_count() == 0
+
+
+class TestPaymentRollup:
+    """Test cases for the incrementally maintained daily rollup"""
+    
+    async def _rollup(self, db):
+        async with db.get_connection() as conn:
+            cursor = await conn.execute(
+                "SELECT day, employee_id, paid_count, paid_amount FROM payment_daily_rollup "
+                "WHERE paid_count != 0 ORDER BY day, employee_id"
+            )
+            return [tuple(row) for row in await cursor.fetchall()]
+    
+    @pytest.mark.asyncio
+    async def test_rollup_tracks_status_changes(self, db):
+        """Test that incremental updates match a full rebuild"""
+        ids = []
+        for i in range(4):
+            ids.append(await db.create_payment(Payment(
+                employee_id=10 + i % 2,
+                employee_username=f"user{i % 2}",
+                balance="100$",
+                username_field=f"@acc{i}",
+                screenshot_file_id=f"file_{i}"
+            )))
+        
+        await db.update_payment_status(ids[0], "paid", 15)
+        await db.update_payment_status(ids[1], "paid", 25)
+        await db.update_payment_status(ids[2], "paid", 15)
+        # Повторная оплата с другой суммой и откат статуса
+        await db.update_payment_status(ids[0], "paid", 30)
+        await db.update_payment_status(ids[2], "pending", None)
+        
+        incremental = await self._rollup(db)
+        await db.rebuild_payment_rollup()
+        assert await self._rollup(db) == incremental
+        
+        stats = await db.get_statistics(days=30)
+        assert stats['total_paid'] == 2
+        assert stats['total_amount'] == 55
+        assert stats['by_employee'][10]['amount'] == 30
+        assert stats['by_employee'][11]['amount'] == 25
+    
+    @pytest.mark.asyncio
+    async def test_statistics_window(self, db):
+        """Test that days outside the window are excluded"""
+        async with db.transaction() as conn:
+            await conn.execute(
+                "INSERT INTO payment_daily_rollup (day, employee_id, paid_count, paid_amount) VALUES (?, ?, ?, ?)",
+                ("2000-01-01", 1, 5, 500)
+            )
+        payment_id = await db.create_payment(Payment(
+            employee_id=2, balance="100$", username_field="@acc", screenshot_file_id="file"
+        ))
+        await db.update_payment_status(payment_id, "paid", 25)
+        
+        stats = await db.get_statistics(days=30)
+        assert stats['total_paid'] == 1
+        assert stats['total_amount'] == 25
+        assert 1 not in stats['by_employee']
+
+
+class TestPagination:
+    """Test cases for keyset pagination and streaming iterators"""
+    
+    @pytest.mark.asyncio
+    async def test_pending_payments_pages(self, db):
+        """Test walking all pages, including rows with identical created_at"""
+        same_time = datetime(2025, 1, 1, 12, 0, 0)
+        ids = []
+        for i in range(7):
+            ids.append(await db.create_payment(Payment(
+                employee_id=1,
+                balance="100$",
+                username_field=f"@acc{i}",
+                screenshot_file_id=f"file_{i}",
+                created_at=same_time if i < 4 else datetime(2025, 1, 2, i)
+            )))
+        await db.create_payment(Payment(
+            employee_id=2, balance="1$", username_field="@other", screenshot_file_id="x"
+        ))
+        
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            page, cursor, _ = await db.get_user_pending_payments_page(1, limit=3, cursor=cursor)
+            seen.extend(p.id for p in page)
+            pages += 1
+            if cursor is None:
+                break
+        
+        assert pages == 3
+        assert seen == [ids[6], ids[5], ids[4], ids[3], ids[2], ids[1], ids[0]]
+        
+        streamed = [p.id async for p in db.iter_user_pending_payments(1, batch_size=2)]
+        assert streamed == seen
+    
+    @pytest.mark.asyncio
+    async def test_legacy_rows_page_with_short_cursors(self, db):
+        """Test that rows with ISO-text created_at page both ways and their buttons fit 64 bytes"""
+        ids = []
+        for i in range(7):
+            payment_id = await db.create_payment(Payment(
+                employee_id=1, balance="100$", username_field=f"@acc{i}", screenshot_file_id=f"file_{i}"
+            ))
+            ids.append(payment_id + 100_000)
+            async with db.transaction() as conn:
+                # Метка в том виде, в каком её писали версии до перехода на миллисекунды
+                await conn.execute(
+                    "UPDATE payments SET id = ?, created_at = ? WHERE id = ?",
+                    (ids[-1], datetime(2025, 1, 1, 12, 0, 0, 123456 + i).isoformat(), payment_id)
+                )
+        
+        first, older, _ = await db.get_user_pending_payments_page(1, limit=3)
+        second, older, newer = await db.get_user_pending_payments_page(1, limit=3, cursor=older)
+        third, older, _ = await db.get_user_pending_payments_page(1, limit=3, cursor=older)
+        back, _, _ = await db.get_user_pending_payments_page(1, limit=3, cursor=newer, newer=True)
+        
+        assert [p.id for p in first + second + third] == ids[::-1]
+        assert older is None
+        assert back == first
+        
+        markup = get_my_payments_keyboard([p.id for p in second], newer, newer, album=(2_147_483_000, 10))
+        assert all(
+            len(button.callback_data.encode()) <= 64
+            for row in markup.inline_keyboard for button in row
+        )
+    
+    @pytest.mark.asyncio
+    async def test_employees_pages(self, db):
+        """Test paging through the employee roster"""
+        for user_id in range(1, 6):
+            await db.add_employee(user_id, f"user{user_id}", added_by=0)
+        
+        first, cursor = await db.get_employees_page(limit=2)
+        second, cursor = await db.get_employees_page(limit=2, cursor=cursor)
+        third, cursor = await db.get_employees_page(limit=2, cursor=cursor)
+        
+        assert cursor is None
+        paged = [e['user_id'] for e in first + second + third]
+        assert sorted(paged) == [1, 2, 3, 4, 5]
+        assert paged == [e['user_id'] async for e in db.iter_employees(batch_size=2)]
+    
+    @pytest.mark.asyncio
+    async def test_invalid_cursor(self, db):
+        """Test that a garbage token yields an empty page instead of an exception"""
+        page, cursor = await db.get_employees_page(limit=2, cursor="not-a-token")
+        assert page == []
+        assert cursor is None
+
+
+class TestArchive:
+    """Test cases for hot/cold archival of settled payments"""
+    
+    async def _count(self, db, table):
+        async with db.get_connection() as conn:
+            cursor = await conn.execute(f"SELECT COUNT(*) FROM {table}")
+            return (await cursor.fetchone())[0]
+    
+    @pytest.mark.asyncio
+    async def test_archive_moves_only_old_settled_payments(self, db):
+        """Test that old paid rows move in batches and stay reachable by id"""
+        old_ids = []
+        for i in range(5):
+            payment_id = await db.create_payment(Payment(
+                employee_id=1, balance="100$", username_field=f"@old{i}", screenshot_file_id=f"old_{i}"
+            ))
+            await db.update_payment_status(payment_id, "paid", 15)
+            old_ids.append(payment_id)
+        async with db.transaction() as conn:
+            await conn.execute("UPDATE payments SET paid_at = ? WHERE id IN (?, ?, ?, ?, ?)",
+                               (to_epoch_ms(datetime(2020, 1, 1)), *old_ids))
+        await db.rebuild_payment_rollup()
+        
+        recent_id = await db.create_payment(Payment(
+            employee_id=1, balance="100$", username_field="@recent", screenshot_file_id="recent"
+        ))
+        await db.update_payment_status(recent_id, "paid", 25)
+        pending_id = await db.create_payment(Payment(
+            employee_id=1, balance="100$", username_field="@pending", screenshot_file_id="pending"
+        ))
+        
+        moved = await db.archive_settled_payments(older_than_days=30, batch_size=2)
+        
+        assert moved == 5
+        assert await self._count(db, "payments") == 2
+        assert await self._count(db, "payments_archive") == 5
+        
+        archived = await db.get_payment_by_id(old_ids[0])
+        assert archived is not None
+        assert archived.status == "paid"
+        assert archived.payment_amount == 15
+        assert archived.username_field == "@old0"
+        assert (await db.get_payment_by_id(pending_id)).status == "pending"
+        
+        # Пересчёт дневных итогов учитывает и архивные выплаты
+        stats = await db.get_statistics(days=30)
+        assert stats['total_amount'] == 25
+        await db.rebuild_payment_rollup()
+        assert await db.get_statistics(days=30) == stats
+        async with db.get_connection() as conn:
+            cursor = await conn.execute("SELECT SUM(paid_count), SUM(paid_amount) FROM payment_daily_rollup")
+            assert tuple(await cursor.fetchone()) == (6, 100)
+    
+    @pytest.mark.asyncio
+    async def test_new_database_uses_incremental_vacuum(self, db):
+        """Test that freed pages can be returned without a full VACUUM"""
+        async with db.get_connection() as conn:
+            cursor = await conn.execute("PRAGMA auto_vacuum")
+            assert (await cursor.fetchone())[0] == 2  # INCREMENTAL
+        
+        for i in range(50):
+            await db.create_payment(Payment(
+                employee_id=1, balance="100$", username_field=f"@acc{i}", screenshot_file_id="x" * 2000
+            ))
+        async with db.transaction() as conn:
+            await conn.execute("DELETE FROM payments")
+        
+        assert await db.incremental_vacuum() > 0
+
+
+class TestEmployeeDirectory:
+    """Test cases for the in-memory employee directory"""
+    
+    @pytest.mark.asyncio
+    async def test_lookups_do_not_touch_database(self, db):
+        """Test that membership and name lookups are answered from memory"""
+        await db.add_employee(100, "worker", "Иван", added_by=1)
+        
+        statements = []
+        await db.set_trace_callback(statements.append)
+        try:
+            assert await db.is_employee(100) is True
+            assert await db.is_employee(200) is False
+            assert await db.get_employee_name(100) == "Иван"
+            assert await db.get_employee_count() == 1
+        finally:
+            await db.set_trace_callback(None)
+        
+        assert statements == []
+    
+    @pytest.mark.asyncio
+    async def test_write_through_on_add_and_remove(self, db):
+        """Test that add/remove keep the directory in sync"""
+        await db.add_employee(100, "worker", "Иван", added_by=1)
+        await db.remove_employee(100)
+        assert await db.is_employee(100) is False
+        assert await db.get_employee_name(100) is None
+        
+        await db.add_employee(100, "worker", "Пётр", added_by=1)
+        assert await db.get_employee_name(100) == "Пётр"
+    
+    @pytest.mark.asyncio
+    async def test_stale_directory_is_reloaded(self, db, db_path):
+        """Test that changes made by another process show up after max staleness"""
+        db.employees.max_staleness = 0.05
+        other = Database(db_path)
+        try:
+            await other.add_employee(300, "remote", "Анна", added_by=1)
+            assert await db.is_employee(300) is False
+            
+            await asyncio.sleep(0.06)
+            assert await db.is_employee(300) is True
+        finally:
+            await other.close()
+    
+    def test_changes_during_reload_are_not_lost(self):
+        """Test that writes racing with a reload survive the snapshot swap"""
+        from database import EmployeeDirectory
+        directory = EmployeeDirectory()
+        directory.begin_load()
+        directory.put(1, "new")
+        directory.discard(2)
+        directory.finish_load([(2, "removed"), (3, "kept")])
+        
+        assert 1 in directory
+        assert 2 not in directory
+        assert directory.name(3) == "kept"
+
+
+class TestReadPool:
+    """Test cases for the read-only connection pool"""
+    
+    @pytest.fixture
+    async def db(self, make_db):
+        return await make_db(read_pool_size=2, read_timeout=0.2)
+    
+    @pytest.mark.asyncio
+    async def test_reads_use_read_only_connections(self, db):
+        """Test that read connections are separate from the writer and cannot write"""
+        writer = await db.connect()
+        async with db.get_connection() as first, db.get_connection() as second:
+            assert first is not writer
+            assert second is not first
+            with pytest.raises(Exception):
+                await first.execute("DELETE FROM employees")
+        # Соединения возвращаются в пул и переиспользуются
+        async with db.get_connection() as again:
+            assert again in (first, second)
+    
+    @pytest.mark.asyncio
+    async def test_reads_do_not_wait_for_writer(self, db):
+        """Test that a long write transaction does not block readers"""
+        await db.add_employee(1, "worker", "Иван", added_by=1)
+        async with db.transaction() as conn:
+            await conn.execute("UPDATE employees SET username = 'pending' WHERE user_id = 1")
+            employees = await asyncio.wait_for(db.get_all_employees(), timeout=1)
+            stats = await asyncio.wait_for(db.get_statistics(), timeout=1)
+        
+        # Читатель видит последнее зафиксированное состояние
+        assert employees[0]['username'] == "worker"
+        assert stats['pending'] == 0
+    
+    @pytest.mark.asyncio
+    async def test_slow_query_is_interrupted(self, db):
+        """Test that the per-query timeout aborts a runaway read"""
+        slow = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 100000000) SELECT COUNT(*) FROM c"
+        with pytest.raises(Exception, match="interrupted"):
+            async with db.get_connection() as conn:
+                await conn.execute(slow)
+        
+        # Соединение остаётся рабочим
+        async with db.get_connection() as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM employees")
+            assert (await cursor.fetchone())[0] == 0
+    
+    @pytest.mark.asyncio
+    async def test_in_memory_database_reads_through_writer(self):
+        """Test that an in-memory database falls back to the single connection"""
+        db = Database(":memory:")
+        await db.init_db()
+        try:
+            writer = await db.connect()
+            async with db.get_connection() as conn:
+                assert conn is writer
+            await db.add_employee(1, "worker", "Иван", added_by=1)
+            assert len(await db.get_all_employees()) == 1
+        finally:
+            await db.close()
+
+
+class TestWriteBehind:
+    """Test cases for group-commit (write-behind) mode"""
+    
+    @pytest.fixture
+    async def db(self, make_db):
+        return await make_db(write_behind=True, flush_interval=0.05, flush_max_batch=8)
+    
+    @pytest.mark.asyncio
+    async def test_updates_are_grouped(self, db):
+        """Test that concurrent updates share one transaction per batch"""
+        ids = []
+        for i in range(10):
+            ids.append(await db.create_payment(Payment(
+                employee_id=1,
+                balance="100$",
+                username_field=f"@acc{i}",
+                screenshot_file_id=f"file_{i}"
+            )))
+        
+        batch_sizes = []
+        original = db._commit_batch
+        
+        async def recording_commit(batch):
+            batch_sizes.append(len(batch))
+            await original(batch)
+        
+        db._commit_batch = recording_commit
+        await asyncio.gather(*(db.update_payment_replied(pid) for pid in ids))
+        
+        assert sum(batch_sizes) == 10
+        assert batch_sizes == [8, 2]
+        for pid in ids:
+            assert (await db.get_payment_by_id(pid)).replied is True
+    
+    @pytest.mark.asyncio
+    async def test_failed_write_does_not_poison_batch(self, db):
+        """Test that one failing mutation is isolated from the rest of its batch"""
+        payment_id = await db.create_payment(Payment(
+            employee_id=1,
+            balance="100$",
+            username_field="@acc",
+            screenshot_file_id="file"
+        ))
+        
+        async def broken(conn):
+            await conn.execute("UPDATE no_such_table SET x = 1")
+        
+        results = await asyncio.gather(
+            db._write(broken),
+            db.update_payment_status(payment_id, "paid", 15),
+            return_exceptions=True
+        )
+        
+        assert isinstance(results[0], Exception)
+        assert results[1] is None
+        assert (await db.get_payment_by_id(payment_id)).status == "paid"
+    
+    @pytest.mark.asyncio
+    async def test_close_flushes_pending_writes(self, db):
+        """Test that close() drains the queue before closing the connection"""
+        payment_id = await db.create_payment(Payment(
+            employee_id=1,
+            balance="100$",
+            username_field="@acc",
+            screenshot_file_id="file"
+        ))
+        pending = asyncio.ensure_future(db.update_employee_message_id(payment_id, 777))
+        await asyncio.sleep(0)
+        await db.close()
+        await pending
+        
+        assert (await db.get_payment_by_id(payment_id)).employee_message_id == 777
+
+
+class TestQueryMetrics:
+    """Test cases for per-method latency metrics and the slow-query log"""
+    
+    @pytest.mark.asyncio
+    async def test_calls_rows_and_errors(self, db):
+        """Test that every public method is timed with its row count and failures"""
+        for i in range(3):
+            await db.add_employee(i + 1, f"user{i}", added_by=1)
+        await db.get_all_employees()
+        await db.get_all_employees()
+        streamed = [e async for e in db.iter_employees(batch_size=2)]
+        with pytest.raises(Exception):
+            await db.create_payment(Payment(employee_id=None, employee_username="x"))
+        
+        snapshot = db.metrics.snapshot()
+        assert snapshot['add_employee']['calls'] == 3
+        assert snapshot['get_all_employees']['calls'] == 2
+        assert snapshot['get_all_employees']['rows'] == 6
+        assert snapshot['iter_employees']['rows'] == len(streamed) == 3
+        assert snapshot['create_payment']['errors'] == 1
+        assert snapshot['get_all_employees']['errors'] == 0
+        
+        buckets = snapshot['get_all_employees']['buckets']
+        assert buckets[-1] == (float("inf"), 2)
+        assert [count for _, count in buckets] == sorted(count for _, count in buckets)
+        assert 'connect' not in snapshot
+    
+    @pytest.mark.asyncio
+    async def test_slow_query_log(self, db, caplog):
+        """Test that slow statements are logged with their plan and without parameter values"""
+        payment_id = await db.create_payment(Payment(
+            employee_id=4242,
+            employee_username="secret_name",
+            balance="100$",
+            username_field="@acc",
+            screenshot_file_id="file"
+        ))
+        db.metrics.slow_query_threshold = 0
+        
+        with caplog.at_level("WARNING", logger="database.slow"):
+            assert (await db.get_payment_by_id(payment_id)).employee_id == 4242
+        
+        assert db.metrics.slow_queries > 0
+        records = [r.getMessage() for r in caplog.records if r.name == "database.slow"]
+        message = next(m for m in records if "FROM payments WHERE id = ?" in m)
+        assert "in get_payment_by_id" in message
+        assert "SEARCH payments USING INTEGER PRIMARY KEY" in message
+        assert "params=['<int>']" in message
+        assert all("secret_name" not in m and "4242" not in m for m in records)
+    
+    @pytest.mark.asyncio
+    async def test_threshold_disabled(self, db, caplog):
+        """Test that a None threshold disables the slow-query log"""
+        db.metrics.slow_query_threshold = None
+        with caplog.at_level("WARNING", logger="database.slow"):
+            await db.add_employee(1, "worker", added_by=1)
+            await db.get_all_employees()
+        assert db.metrics.slow_queries == 0
+        assert not [r for r in caplog.records if r.name == "database.slow"]
+
+
+class TestMigrations:
+    """Test cases for versioned schema migrations"""
+    
+    async def _schema_version(self, db):
+        async with db.get_connection() as conn:
+            cursor = await conn.execute("PRAGMA user_version")
+            return (await cursor.fetchone())[0]
+    
+    @pytest.mark.asyncio
+    async def test_fresh_database_is_at_latest_version(self, db_path):
+        """Test that a new database is migrated to the latest version"""
+        db = Database(db_path)
+        await db.init_db()
+        assert await self._schema_version(db) == latest_version()
+        await db.close()
+    
+    @pytest.mark.asyncio
+    async def test_legacy_database_is_upgraded(self, db_path):
+        """Test upgrading a pre-versioning database that lacks newer columns"""
+        import sqlite3
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE payments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                employee_id INTEGER NOT NULL,
+                employee_username TEXT,
+                balance TEXT NOT NULL,
+                username_field TEXT NOT NULL,
+                screenshot_file_id TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                payment_amount INTEGER,
+                created_at TIMESTAMP NOT NULL,
+                paid_at TIMESTAMP
+            )
+        """)
+        conn.execute(
+            "INSERT INTO payments (employee_id, balance, username_field, screenshot_file_id, created_at) "
+            "VALUES (1, '100$', '@acc', 'file', '2025-01-01 10:00:00')"
+        )
+        conn.execute(
+            "INSERT INTO payments (employee_id, balance, username_field, screenshot_file_id, "
+            "status, payment_amount, created_at, paid_at) VALUES (2, '100$', '@acc', 'file', 'paid', 25, ?, ?)",
+            (datetime.now().isoformat(" "), datetime.now().isoformat(" "))
+        )
+        conn.commit()
+        conn.close()
+        
+        db = Database(db_path)
+        await db.init_db()
+        
+        assert await self._schema_version(db) == latest_version()
+        payment = await db.get_payment_by_id(1)
+        assert payment is not None
+        assert payment.replied is False
+        assert payment.employee_first_name is None
+        
+        # Дневные итоги заполнены по уже оплаченным заявкам
+        stats = await db.get_statistics(days=30)
+        assert stats['total_paid'] == 1
+        assert stats['total_amount'] == 25
+        await db.close()
+    
+    @pytest.mark.asyncio
+    async def test_up_to_date_database_runs_no_migrations(self, db_path):
+        """Test that restarting on a current schema is a single pragma read"""
+        db = Database(db_path)
+        await db.init_db()
+        await db.close()
+        
+        db = Database(db_path)
+        try:
+            conn = await db.connect()
+            statements = []
+            await conn.set_trace_callback(statements.append)
+            await db.init_db()
+            await conn.set_trace_callback(None)
+            
+            # Остаются только чтение версии и загрузка каталога сотрудников
+            schema_statements = [sql for sql in statements if not sql.startswith("SELECT")]
+            assert schema_statements == ["PRAGMA user_version"]
+        finally:
+            await db.close()
+    
+    @pytest.mark.asyncio
+    async def test_timestamps_migrate_to_epoch_ms(self, db_path):
+        """Test the resumable online rewrite of ISO text timestamps"""
+        db = Database(db_path)
+        await db.init_db()
+        try:
+            async with db.transaction() as conn:
+                for i in range(5):
+                    await conn.execute(
+                        "INSERT INTO payments (employee_id, balance, username_field, screenshot_file_id, "
+                        "status, payment_amount, created_at, paid_at) VALUES (1, '100$', '@acc', 'file', ?, ?, ?, ?)",
+                        ("paid", 15, f"2025-01-0{i + 1} 10:00:00", f"2025-01-0{i + 1} 11:30:00.250000")
+                    )
+                await conn.execute(
+                    "INSERT INTO employees (user_id, added_at, added_by) VALUES (7, '2024-12-31 23:00:00', 1)"
+                )
+            # Новая запись пишется уже миллисекундами, старые читаются как раньше
+            new_id = await db.create_payment(Payment(
+                employee_id=1, balance="100$", username_field="@new", screenshot_file_id="file"
+            ))
+            assert (await db.get_payment_by_id(1)).created_at == datetime(2025, 1, 1, 10, 0, 0)
+            
+            # Таблица заявок уже пройдена: позиция сохранена, повторный запуск её пропускает
+            await db._migrate_table_timestamps("payments", ("created_at", "paid_at"), 2, 0)
+            assert await db._get_state("epoch_ms:payments") == str(new_id)
+            converted = await db.migrate_timestamps_to_epoch(batch_size=2)
+            assert converted == 1  # остался только сотрудник
+            assert await db.migrate_timestamps_to_epoch() == 0
+            
+            async with db.get_connection() as conn:
+                cursor = await conn.execute(
+                    "SELECT DISTINCT typeof(created_at), typeof(paid_at) FROM payments WHERE status = 'paid'"
+                )
+                assert [tuple(row) for row in await cursor.fetchall()] == [("integer", "integer")]
+                cursor = await conn.execute("SELECT typeof(added_at) FROM employees")
+                assert (await cursor.fetchone())[0] == "integer"
+            
+            payment = await db.get_payment_by_id(1)
+            assert payment.created_at == datetime(2025, 1, 1, 10, 0, 0)
+            assert payment.paid_at == datetime(2025, 1, 1, 11, 30, 0, 250000)
+            employees = await db.get_all_employees()
+            assert employees[0]['added_at'] == datetime(2024, 12, 31, 23, 0, 0)
+            
+            # Дневные итоги пересчитаны по дням UTC
+            async with db.get_connection() as conn:
+                cursor = await conn.execute("SELECT SUM(paid_count), SUM(paid_amount) FROM payment_daily_rollup")
+                assert tuple(await cursor.fetchone()) == (5, 75)
+        finally:
+            await db.close()
 
 
 class TestModels:
@@ -239,6 +936,34 @@ class TestModels:
         assert payment.status == "pending"
         assert payment.replied is False
         assert payment.created_at is not None
+    
+    @pytest.mark.skipif(sys.version_info < (3, 10), reason="dataclass slots need Python 3.10+")
+    def test_payment_is_slotted(self):
+        """Test that Payment instances carry no per-instance __dict__"""
+        payment = Payment()
+        assert not hasattr(payment, "__dict__")
+        with pytest.raises(AttributeError):
+            payment.unknown_field = 1
+    
+    def test_payment_mapper_by_position(self):
+        """Test mapping rows by column position, including missing optional columns"""
+        columns = ("id", "employee_id", "employee_username", "balance", "username_field",
+                   "screenshot_file_id", "status", "payment_amount", "replied", "created_at", "paid_at")
+        row = (7, 42, "user", "100$", "@acc", "file", "paid", 25, 1,
+               "2025-01-02 03:04:05", "2025-01-02 04:00:00")
+        
+        mapper = PaymentMapper.for_columns(columns)
+        payment = mapper(row)
+        
+        assert PaymentMapper.for_columns(list(columns)) is mapper
+        assert payment.id == 7
+        assert payment.employee_id == 42
+        assert payment.employee_first_name is None
+        assert payment.employee_message_id is None
+        assert payment.replied is True
+        assert payment.payment_amount == 25
+        assert payment.created_at == datetime(2025, 1, 2, 3, 4, 5)
+        assert payment.paid_at == datetime(2025, 1, 2, 4, 0, 0)
 
 
 if __name__ == "__main__":
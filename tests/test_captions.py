@@ -0,0 +1,148 @@
+"""
+Caption rendering tests
+Card captions for every status, the "📋 Мои заявки" summary and
+skipping of edits that change nothing.
+Run with: pytest tests/
+"""
+import pytest
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
+from aiogram.methods import EditMessageCaption
+
+from captions import (
+    CaptionCache,
+    admin_card,
+    admin_card_markup,
+    employee_card,
+    employee_name,
+    my_payment_card,
+    my_payments_summary
+)
+from keyboards import get_admin_payment_keyboard, get_my_payments_keyboard, without_button
+from memory_storage import MemoryStorage
+from models import Payment
+from storage import encode_cursor
+
+
+def payment(**fields) -> Payment:
+    defaults = dict(id=5, employee_id=100, employee_username="ivan", balance="100$", username_field="@player")
+    return Payment(**{**defaults, **fields})
+
+
+class TestRenderers:
+    """Test cases for the card captions"""
+    
+    def test_admin_card_follows_status(self):
+        """Test that the admin card shows the replied mark, the amount and the keyboard only while pending"""
+        new = payment()
+        assert admin_card(new, "Иван").startswith("📋 <b>Новая заявка #5</b>")
+        assert "Отписал" not in admin_card(new, "Иван")
+        assert admin_card_markup(new) is not None
+        
+        replied = payment(replied=True)
+        assert admin_card(replied, "Иван").endswith("✍️ <b>Отписал</b>")
+        
+        paid = payment(status="paid", payment_amount=250, replied=True)
+        caption = admin_card(paid, "Иван")
+        assert caption.startswith("✅ <b>Заявка #5 ОПЛАЧЕНА</b>")
+        assert "💵 <b>Сумма оплаты:</b> 250" in caption
+        assert admin_card_markup(paid) is None
+    
+    def test_employee_views(self):
+        """Test that the employee card and the list entry carry the request details"""
+        replied = payment(replied=True)
+        assert "💰 <b>Баланс:</b> 100$" in employee_card(replied)
+        assert employee_card(replied).endswith("✍️ <b>Отписал</b>")
+        assert "⏳ Ожидает обработки" in my_payment_card(payment())
+    
+    @pytest.mark.asyncio
+    async def test_employee_name_order(self):
+        """Test that the name comes from the request, then the directory, then the username"""
+        storage = MemoryStorage()
+        await storage.add_employee(100, "ivan", "Иван из каталога")
+        assert await employee_name(storage, payment(employee_first_name="Иван")) == "Иван"
+        assert await employee_name(storage, payment()) == "Иван из каталога"
+        assert await employee_name(storage, payment(employee_id=200)) == "ivan"
+        assert await employee_name(storage, payment(employee_id=200, employee_username=None)) == "Не указано"
+
+
+class TestMyPayments:
+    """Test cases for the "📋 Мои заявки" summary message"""
+    
+    def test_summary_lists_page(self):
+        """Test that the summary has a line per request with the replied mark"""
+        summary = my_payments_summary([payment(id=1), payment(id=2, replied=True)])
+        assert "<b>#1</b> — 100$, @player\n" in summary
+        assert "<b>#2</b> — 100$, @player ✍️" in summary
+    
+    def test_keyboard_fits_callback_limit(self):
+        """Test that delete and navigation buttons stay within Telegram's 64-byte callback data"""
+        ids = [2_000_000_000 + i for i in range(10)]
+        cursor = encode_cursor(9_999_999_999_999, ids[-1])
+        markup = get_my_payments_keyboard(ids, cursor, cursor, album=(2_147_483_000, 10))
+        buttons = [button for row in markup.inline_keyboard for button in row]
+        assert len(buttons) == 12
+        assert all(len(button.callback_data.encode()) <= 64 for button in buttons)
+        assert [b.text for b in markup.inline_keyboard[-1]] == ["⬅️ Назад", "➡️ Далее"]
+        assert markup.inline_keyboard[-1][1].callback_data == f"my_pg:o:2147483000:10:{cursor}"
+        
+        first_page = get_my_payments_keyboard([1])
+        assert [[b.callback_data for b in row] for row in first_page.inline_keyboard] == [["delete_1"]]
+    
+    def test_deleted_request_button_is_removed(self):
+        """Test that deleting from the summary drops only that request's button"""
+        markup = get_my_payments_keyboard([1, 2])
+        assert [b.callback_data for b in without_button(markup, "delete_1").inline_keyboard[0]] == ["delete_2"]
+        assert without_button(get_my_payments_keyboard([1]), "delete_1") is None
+
+
+class TestCaptionCache:
+    """Test cases for skipping no-op caption edits"""
+    
+    def test_identical_edit_is_skipped(self):
+        """Test that only copies whose caption or keyboard changes are edited"""
+        cache = CaptionCache()
+        cache.remember(1, 10, "card", get_admin_payment_keyboard(5))
+        
+        assert list(cache.edits([(1, 10)], "card", get_admin_payment_keyboard(5))) == []
+        assert cache.skipped == 1
+        # Другая клавиатура — другое сообщение
+        assert [m.chat_id for m in cache.edits([(1, 10)], "card")] == [1]
+        # Неизвестная копия правится, повторная такая же правка — нет
+        assert [m.chat_id for m in cache.edits([(2, 20), (1, 10)], "card")] == [2]
+    
+    def test_size_is_bounded(self):
+        """Test that the oldest messages are evicted"""
+        cache = CaptionCache(max_size=2)
+        for message_id in (1, 2, 3):
+            cache.remember(1, message_id, "card")
+        assert [m.message_id for m in cache.edits([(1, 1)], "card")] == [1]
+    
+    @pytest.mark.asyncio
+    async def test_failed_edit_is_forgotten(self):
+        """Test that a failed edit is retried next time and "not modified" is not"""
+        cache = CaptionCache()
+        loop = asyncio.get_running_loop()
+        
+        for error, retried in (
+            (TelegramNetworkError(method=None, message="timeout"), True),
+            (TelegramBadRequest(method=None, message="Bad Request: message is not modified"), False),
+        ):
+            method, = cache.edits([(1, 10)], f"card {retried}")
+            future = loop.create_future()
+            cache.watch(method, future)
+            future.set_exception(error)
+            await asyncio.sleep(0)
+            assert len(list(cache.edits([(1, 10)], f"card {retried}"))) == int(retried)
+        
+        method, = cache.edits([(1, 10)], "cancelled")
+        future = loop.create_future()
+        cache.watch(method, future)
+        future.cancel()
+        await asyncio.sleep(0)
+        assert isinstance(next(cache.edits([(1, 10)], "cancelled")), EditMessageCaption)
@@ -0,0 +1,104 @@
+"""
+SQLite FSM storage tests
+Persistence across restarts, write coalescing, the read cache and expiry.
+Run with: pytest tests/
+"""
+import pytest
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram.fsm.storage.base import StorageKey
+
+from database import Database
+from fsm_storage import SQLiteStorage
+from handlers.employee import PaymentStates
+
+
+def key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+
+
+def calls(db: Database, method: str) -> int:
+    return db.metrics.snapshot().get(method, {}).get('calls', 0)
+
+
+class TestSQLiteStorage:
+    """Test cases for the persistent FSM storage"""
+    
+    @pytest.mark.asyncio
+    async def test_survives_restart(self, db):
+        """Test that a half-finished conversation is restored after a restart"""
+        storage = SQLiteStorage(db)
+        await storage.set_state(key(1), PaymentStates.waiting_for_balance)
+        await storage.update_data(key(1), {"screenshot_file_id": "file"})
+        await storage.update_data(key(1), {"balance": "100$"})
+        await storage.set_state(key(2), PaymentStates.waiting_for_screenshot)
+        await storage.set_state(key(2), None)
+        await storage.close()
+        
+        restarted = SQLiteStorage(db)
+        assert await restarted.get_state(key(1)) == PaymentStates.waiting_for_balance.state
+        assert await restarted.get_data(key(1)) == {"screenshot_file_id": "file", "balance": "100$"}
+        assert await restarted.get_state(key(2)) is None
+        # Пустая запись (state.clear()) не хранится
+        assert await db.get_fsm_record(2, 2, "42:0::default") is None
+        # Другой бот или тема — другой ключ
+        assert await restarted.get_state(StorageKey(bot_id=42, chat_id=1, user_id=1, thread_id=5)) is None
+    
+    @pytest.mark.asyncio
+    async def test_writes_are_coalesced(self, db):
+        """Test that consecutive steps of a conversation are written as one batch"""
+        storage = SQLiteStorage(db, flush_interval=0.05)
+        for user_id in (1, 2):
+            await storage.set_state(key(user_id), PaymentStates.waiting_for_screenshot)
+            await storage.update_data(key(user_id), {"screenshot_file_id": "file"})
+            await storage.set_state(key(user_id), PaymentStates.waiting_for_balance)
+        assert calls(db, "save_fsm_records") == 0
+        
+        await asyncio.sleep(0.1)
+        assert calls(db, "save_fsm_records") == 1
+        record = await db.get_fsm_record(1, 1, "42:0::default")
+        assert record.state == PaymentStates.waiting_for_balance.state
+        assert record.data == {"screenshot_file_id": "file"}
+        await storage.close()
+    
+    @pytest.mark.asyncio
+    async def test_read_cache(self, db):
+        """Test that reads are served from the LRU cache and pending writes survive eviction"""
+        storage = SQLiteStorage(db, cache_size=1, flush_interval=10)
+        await storage.set_data(key(1), {"payment_id": 1})
+        await storage.set_data(key(2), {"payment_id": 2})
+        
+        # Ключ 1 вытеснен из кэша, но ещё не записан: читается из памяти
+        assert await storage.get_data(key(1)) == {"payment_id": 1}
+        assert calls(db, "get_fsm_record") == 2
+        await storage.close()
+        
+        cold = SQLiteStorage(db, cache_size=1)
+        for _ in range(3):
+            assert await cold.get_data(key(2)) == {"payment_id": 2}
+        assert calls(db, "get_fsm_record") == 3
+        await cold.get_data(key(1))
+        await cold.get_data(key(2))
+        assert calls(db, "get_fsm_record") == 5
+    
+    @pytest.mark.asyncio
+    async def test_abandoned_conversations_expire(self, db):
+        """Test that stale states read as empty, are purged and are not counted"""
+        storage = SQLiteStorage(db, state_ttl=0.05)
+        await storage.set_state(key(1), PaymentStates.confirming)
+        await storage.update_data(key(1), {"balance": "100$"})
+        assert await storage.state_counts() == {PaymentStates.confirming.state: 1}
+        
+        await asyncio.sleep(0.1)
+        await storage.set_state(key(2), PaymentStates.waiting_for_balance)
+        assert await storage.get_state(key(1)) is None
+        assert await storage.get_data(key(1)) == {}
+        assert await storage.state_counts() == {PaymentStates.waiting_for_balance.state: 1}
+        
+        assert await db.purge_fsm_records(0.05) == 1
+        assert await db.get_fsm_record(1, 1, "42:0::default") is None
+        await storage.close()
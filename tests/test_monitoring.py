@@ -0,0 +1,154 @@
+"""
+Metrics endpoint tests
+Handler, Bot API, database, FSM and event loop metrics in Prometheus text format.
+Run with: pytest tests/
+"""
+import pytest
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message, Update, User
+from aiohttp import ClientSession
+
+from monitoring import BotMetrics, RequestMetricsMiddleware, install_metrics, start_metrics_server
+
+router = Router()
+
+
+@router.message()
+async def on_message(message: Message):
+    if message.text == "fail":
+        raise RuntimeError("handler failed")
+
+
+def make_update(update_id: int, text: str) -> Update:
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(),
+            chat=Chat(id=1, type="private"),
+            from_user=User(id=1, is_bot=False, first_name="Иван"),
+            text=text
+        )
+    )
+
+
+@pytest.fixture
+async def bot():
+    test_bot = Bot(token="42:TEST")
+    yield test_bot
+    await test_bot.session.close()
+
+
+class TestBotMetrics:
+    """Test cases for metric collection and exposition"""
+    
+    @pytest.mark.asyncio
+    async def test_handler_metrics(self, bot):
+        """Test update counts and per-handler latency and errors"""
+        dp = Dispatcher()
+        dp.include_router(router)
+        metrics = install_metrics(dp, bot)
+        
+        await dp.feed_update(bot, make_update(1, "hello"))
+        await dp.feed_update(bot, make_update(2, "hello"))
+        with pytest.raises(RuntimeError):
+            await dp.feed_update(bot, make_update(3, "fail"))
+        
+        text = await metrics.render()
+        labels = f'event_type="message",handler="{on_message.__module__}.on_message"'
+        assert 'telepay_updates_total{type="message"} 3' in text
+        assert f'telepay_handler_duration_seconds_count{{{labels}}} 3' in text
+        assert f'telepay_handler_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+        assert f'telepay_handler_errors_total{{{labels}}} 1' in text
+        assert "# TYPE telepay_handler_duration_seconds histogram" in text
+    
+    @pytest.mark.asyncio
+    async def test_bot_api_metrics(self, bot):
+        """Test Bot API latency and error counts by method"""
+        metrics = BotMetrics()
+        middleware = RequestMetricsMiddleware(metrics)
+        method = SendMessage(chat_id=1, text="hi")
+        
+        async def ok(bot, method):
+            return "sent"
+        
+        async def flood(bot, method):
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=3)
+        
+        assert await middleware(ok, bot, method) == "sent"
+        with pytest.raises(TelegramRetryAfter):
+            await middleware(flood, bot, method)
+        
+        text = await metrics.render()
+        assert 'telepay_bot_api_duration_seconds_count{method="sendMessage"} 2' in text
+        assert 'telepay_bot_api_errors_total{method="sendMessage",error="TelegramRetryAfter"} 1' in text
+    
+    @pytest.mark.asyncio
+    async def test_database_and_fsm_metrics(self, bot, db):
+        """Test that database timings and FSM state counts are exported"""
+        dp = Dispatcher()
+        metrics = install_metrics(dp, bot, db)
+        await db.add_employee(1, "worker", added_by=1)
+        await db.get_all_employees()
+        for user_id, state in ((1, "Form:amount"), (2, "Form:amount"), (3, "Form:screenshot")):
+            await dp.storage.set_state(StorageKey(bot_id=42, chat_id=user_id, user_id=user_id), state)
+        
+        text = await metrics.render()
+        assert 'telepay_db_query_duration_seconds_count{method="get_all_employees"} 1' in text
+        assert 'telepay_db_rows_total{method="get_all_employees"} 1' in text
+        assert 'telepay_db_slow_queries_total 0' in text
+        assert 'telepay_fsm_states{state="Form:amount"} 2' in text
+        assert 'telepay_fsm_states{state="Form:screenshot"} 1' in text
+    
+    @pytest.mark.asyncio
+    async def test_event_loop_lag(self):
+        """Test that a blocked event loop shows up as lag"""
+        metrics = BotMetrics()
+        task = asyncio.create_task(metrics.watch_event_loop(interval=0.01))
+        await asyncio.sleep(0)
+        time.sleep(0.05)
+        await asyncio.sleep(0.03)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        
+        assert metrics.loop_lag.count >= 1
+        assert metrics.loop_lag.sum >= 0.03
+    
+    @pytest.mark.asyncio
+    async def test_label_escaping(self):
+        """Test that label values are escaped"""
+        metrics = BotMetrics()
+        metrics.observe_api_call('say "hi"\n', 0.1, 'Bad\\Error')
+        text = await metrics.render()
+        assert 'method="say \\"hi\\"\\n",error="Bad\\\\Error"' in text
+
+
+class TestMetricsServer:
+    """Test cases for the HTTP endpoint"""
+    
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self):
+        """Test that /metrics serves the exposition text"""
+        metrics = BotMetrics()
+        metrics.observe_update("message")
+        runner = await start_metrics_server(metrics, "127.0.0.1", 0)
+        try:
+            port = runner.addresses[0][1]
+            async with ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    assert response.status == 200
+                    assert response.headers['Content-Type'].startswith("text/plain; version=0.0.4")
+                    assert 'telepay_updates_total{type="message"} 1' in await response.text()
+        finally:
+            await runner.cleanup()
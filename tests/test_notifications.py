@@ -0,0 +1,126 @@
+"""
+Outbox worker tests
+Delivery, retries and resumption of settlement notifications.
+Run with: pytest tests/
+"""
+import pytest
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+
+from config import Config
+from memory_storage import MemoryStorage
+from models import Payment
+from notifications import PAYMENT_PAID_EVENTS, OutboxWorker
+from outbound import OutboundScheduler
+from tests.conftest import FakeBot
+
+async def settled_payment(storage):
+    payment_id = await storage.create_payment(Payment(
+        employee_id=7,
+        employee_username="worker",
+        employee_first_name="Иван",
+        balance="100$",
+        username_field="@acc",
+        screenshot_file_id="file"
+    ))
+    await storage.settle_payment(payment_id, 25, notify=PAYMENT_PAID_EVENTS)
+    return payment_id
+
+
+async def drain(worker, storage, timeout=2.0):
+    """Run the worker until the outbox has nothing due"""
+    task = asyncio.create_task(worker.run())
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        await asyncio.sleep(0.05)
+        while await storage.get_due_outbox() or worker._in_flight:
+            assert loop.time() < deadline, "outbox was not drained"
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await worker.outbound.close()
+
+
+def make_worker(storage, bot, **kwargs):
+    outbound = OutboundScheduler(bot, global_rate=1000, private_rate=1000, group_rate_per_minute=60000, max_retries=0)
+    return OutboxWorker(storage, outbound, poll_interval=0.01, **kwargs)
+
+
+class TestOutboxWorker:
+    """Test cases for the outbox delivery worker"""
+    
+    @pytest.mark.asyncio
+    async def test_delivers_settlement_notifications(self):
+        """Test that the group announcement and the employee notice are sent"""
+        storage = MemoryStorage()
+        payment_id = await settled_payment(storage)
+        bot = FakeBot()
+        
+        await drain(make_worker(storage, bot), storage)
+        
+        group, employee = sorted(bot.sent, key=lambda m: m.chat_id != Config.GROUP_CHAT_ID)
+        assert group.chat_id == Config.GROUP_CHAT_ID
+        assert group.photo == "file"
+        assert "💵 <b>Оплата:</b> 25" in group.caption
+        assert employee.chat_id == 7
+        assert f"#{payment_id} оплачена" in employee.text
+        assert "Иван" in employee.text
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_and_backoff(self):
+        """Test that flood control and network errors reschedule the entry"""
+        storage = MemoryStorage()
+        await settled_payment(storage)
+        bot = FakeBot([
+            TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=30),
+            TelegramNetworkError(method=None, message="connection reset")
+        ])
+        worker = make_worker(storage, bot, base_delay=60)
+        
+        await drain(worker, storage)
+        
+        assert bot.sent == []
+        now = datetime.now()
+        network, flood = sorted(storage._outbox.values(), key=lambda entry: entry[0].last_error)
+        assert network[0].attempts == flood[0].attempts == 1
+        assert "connection reset" in network[0].last_error
+        assert 55 < (network[1] - now).total_seconds() <= 60
+        assert "Too Many Requests" in flood[0].last_error
+        assert 25 < (flood[1] - now).total_seconds() <= 30
+        assert worker.backoff(0) == 60
+        assert worker.backoff(20) == worker.max_delay
+    
+    @pytest.mark.asyncio
+    async def test_permanent_errors_are_abandoned(self):
+        """Test that a blocked chat is not retried"""
+        storage = MemoryStorage()
+        await settled_payment(storage)
+        bot = FakeBot([TelegramForbiddenError(method=None, message="bot was blocked by the user")])
+        
+        await drain(make_worker(storage, bot), storage)
+        
+        assert len(bot.sent) == 1
+        (failed,) = storage._outbox.values()
+        assert failed[2] is not None
+        assert "blocked" in failed[0].last_error
+    
+    @pytest.mark.asyncio
+    async def test_resumes_after_restart(self, make_db):
+        """Test that notifications committed before a restart are delivered after it"""
+        db = await make_db()
+        await settled_payment(db)
+        await db.close()
+        
+        db = await make_db()
+        assert len(await db.get_due_outbox()) == 2
+        bot = FakeBot()
+        await drain(make_worker(db, bot), db)
+        assert {method.chat_id for method in bot.sent} == {Config.GROUP_CHAT_ID, 7}
@@ -0,0 +1,196 @@
+"""
+Outbound scheduler tests
+Priorities, per-chat and global rate limits, flood-control retries.
+Run with: pytest tests/
+"""
+import pytest
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from outbound import OutboundScheduler, Priority, TokenBucket, fan_out
+from tests.conftest import FakeBot
+
+
+def message(chat_id, text="hi"):
+    return SendMessage(chat_id=chat_id, text=text)
+
+
+class TestTokenBucket:
+    """Test cases for the token bucket"""
+    
+    def test_rate_and_pause(self):
+        """Test refill rate and the pause after a 429"""
+        bucket = TokenBucket(rate=2, capacity=1, now=0.0)
+        assert bucket.delay(0.0) == 0
+        bucket.take(0.0)
+        assert bucket.delay(0.0) == pytest.approx(0.5)
+        assert bucket.delay(0.5) == 0
+        
+        bucket.pause(1.0, 3)
+        assert bucket.delay(1.0) == pytest.approx(3)
+        bucket.take(4.0)
+        assert bucket.delay(4.0) == pytest.approx(0.5)
+        assert not bucket.idle(2.0)
+        assert bucket.idle(10.0)
+
+
+class TestOutboundScheduler:
+    """Test cases for the outbound message scheduler"""
+    
+    @pytest.mark.asyncio
+    async def test_priorities(self):
+        """Test that higher priority classes are sent first"""
+        bot = FakeBot()
+        outbound = OutboundScheduler(bot, global_rate=1000)
+        outbound.send_nowait(message(1, "courtesy"), Priority.LOW)
+        outbound.send_nowait(message(-100, "group"), Priority.NORMAL)
+        outbound.send_nowait(message(2, "alert"), Priority.HIGH)
+        await outbound.close()
+        
+        assert [m.text for m in bot.sent] == ["alert", "group", "courtesy"]
+    
+    @pytest.mark.asyncio
+    async def test_per_chat_limit(self):
+        """Test that a group chat is throttled without delaying other chats"""
+        bot = FakeBot()
+        outbound = OutboundScheduler(bot, global_rate=1000, group_rate_per_minute=600)
+        for i in range(3):
+            outbound.send_nowait(message(-100, f"group {i}"))
+        assert await outbound.send(message(1, "private")) == "private"
+        await outbound.close()
+        
+        group = [at for m, at in zip(bot.sent, bot.sent_at) if m.chat_id == -100]
+        assert [m.text for m in bot.sent if m.chat_id == -100] == ["group 0", "group 1", "group 2"]
+        assert group[2] - group[0] >= 0.19
+        # Личное сообщение не ждёт очереди группы
+        assert bot.sent[1].text == "private"
+    
+    @pytest.mark.asyncio
+    async def test_global_limit(self):
+        """Test that the global bucket spaces out messages to different chats"""
+        bot = FakeBot()
+        outbound = OutboundScheduler(bot, global_rate=20)
+        results = await asyncio.gather(*(outbound.send(message(chat_id)) for chat_id in range(1, 6)))
+        await outbound.close()
+        
+        assert results == ["hi"] * 5
+        assert bot.sent_at[-1] - bot.sent_at[0] >= 0.19
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_chat(self):
+        """Test that a 429 from a group pauses only that group and the message is retried"""
+        method = message(-100, "group")
+        bot = FakeBot(failures={-100: [TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)]})
+        outbound = OutboundScheduler(bot, global_rate=1000)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        
+        group = asyncio.ensure_future(outbound.send(method))
+        assert await outbound.send(message(1, "private")) == "private"
+        assert loop.time() - started < 0.5
+        assert await group == "group"
+        assert loop.time() - started >= 1
+        await outbound.close()
+    
+    @pytest.mark.asyncio
+    async def test_private_retry_after_pauses_everything(self):
+        """Test that a 429 from a private chat pauses delivery to every chat"""
+        method = message(1, "first")
+        bot = FakeBot(failures={1: [TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)]})
+        outbound = OutboundScheduler(bot, global_rate=1000, private_rate=1000)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        
+        first = asyncio.ensure_future(outbound.send(method))
+        await asyncio.sleep(0.05)
+        assert await outbound.send(message(2, "other")) == "other"
+        assert loop.time() - started >= 1
+        assert await first == "first"
+        await outbound.close()
+    
+    @pytest.mark.asyncio
+    async def test_errors(self, caplog):
+        """Test that send raises and send_nowait logs delivery errors"""
+        method = message(1)
+        bot = FakeBot(failures={1: [TelegramBadRequest(method=method, message="chat not found")] * 2})
+        outbound = OutboundScheduler(bot, global_rate=1000, private_rate=1000)
+        
+        with pytest.raises(TelegramBadRequest):
+            await outbound.send(method)
+        with caplog.at_level(logging.ERROR, logger="outbound"):
+            future = outbound.send_nowait(method)
+            await outbound.close()
+        
+        assert isinstance(future.exception(), TelegramBadRequest)
+        assert "Outbound sendMessage failed" in caplog.text
+        with pytest.raises(RuntimeError):
+            outbound.send_nowait(method)
+
+
+class TestFanOut:
+    """Test cases for concurrent multi-recipient delivery"""
+    
+    @pytest.mark.asyncio
+    async def test_first_success_is_reported_early(self):
+        """Test that a slow recipient neither delays success nor other recipients"""
+        bot = FakeBot(delays={1: 5})
+        outbound = OutboundScheduler(bot, global_rate=1000)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        
+        delivery = fan_out(outbound, [1, 2, 3], lambda chat_id: message(chat_id, f"to {chat_id}"), timeout=0.3)
+        assert await delivery.any_delivered() is True
+        assert loop.time() - started < 0.2
+        
+        results = await delivery.wait()
+        assert loop.time() - started < 1
+        assert results[2] == "to 2" and results[3] == "to 3"
+        assert isinstance(results[1], asyncio.TimeoutError)
+        await outbound.close(timeout=0.1)
+    
+    @pytest.mark.asyncio
+    async def test_queue_wait_does_not_count_toward_timeout(self):
+        """Test that cards queued behind the per-chat limit are all sent despite a short timeout"""
+        bot = FakeBot()
+        outbound = OutboundScheduler(bot, global_rate=1000, private_rate=10)
+        deliveries = [
+            fan_out(outbound, [1], lambda chat_id, n=n: message(chat_id, f"card {n}"), timeout=0.15)
+            for n in range(6)
+        ]
+        results = [await delivery.wait() for delivery in deliveries]
+        await outbound.close()
+        
+        assert [result[1] for result in results] == [f"card {n}" for n in range(6)]
+        # Шесть сообщений при 10 в секунду идут дольше timeout
+        assert bot.sent_at[-1] - bot.sent_at[0] >= 0.45
+    
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency(self):
+        """Test that no more than `concurrency` deliveries run at once"""
+        bot = FakeBot(delays={chat_id: 0.05 for chat_id in range(1, 9)})
+        outbound = OutboundScheduler(bot, global_rate=1000)
+        results = await fan_out(outbound, range(1, 9), message, concurrency=3).wait()
+        await outbound.close()
+        
+        assert list(results.values()) == ["hi"] * 8
+        assert bot.max_active == 3
+    
+    @pytest.mark.asyncio
+    async def test_all_failed(self):
+        """Test that failure is reported when no recipient got the message"""
+        method = message(1)
+        bot = FakeBot(failures={
+            1: [TelegramBadRequest(method=method, message="chat not found")],
+            2: [TelegramBadRequest(method=method, message="bot was blocked")]
+        })
+        outbound = OutboundScheduler(bot, global_rate=1000)
+        assert await fan_out(outbound, [1, 2, 1], message).any_delivered() is False
+        await outbound.close()
+        assert bot.sent == []
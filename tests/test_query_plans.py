@@ -0,0 +1,122 @@
+"""
+Query plan regression tests
+Every statement issued by Database is run through EXPLAIN QUERY PLAN;
+a full table scan fails the test.
+Run with: pytest tests/
+"""
+import pytest
+import inspect
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database, now_ms
+from models import FSMRecord, Payment
+
+
+# Полный проход по таблице без индекса: "SCAN payments", но не "SCAN payments USING INDEX ..."
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+PLANNED = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+# Методы, которые не обращаются к SQL напрямую
+NOT_QUERIES = {"connect", "get_connection", "transaction", "close", "init_db", "set_trace_callback"}
+
+
+async def exercise(db: Database) -> set:
+    """Вызвать каждый публичный метод Database; вернуть имена вызванных"""
+    called = set()
+    
+    def call(name):
+        called.add(name)
+        return getattr(db, name)
+    
+    payment_id = await call("create_payment")(Payment(
+        employee_id=1, employee_username="user", balance="100$",
+        username_field="@acc", screenshot_file_id="file"
+    ))
+    await call("create_payments_many")([Payment(
+        employee_id=2, balance="100$", username_field="@bulk", screenshot_file_id="file"
+    )])
+    await call("get_payment_by_id")(payment_id)
+    await call("get_user_pending_payments")(1)
+    _, cursor, _ = await call("get_user_pending_payments_page")(1, 1)
+    await db.get_user_pending_payments_page(1, 1, cursor)
+    await db.get_user_pending_payments_page(1, 1, cursor, newer=True)
+    [p async for p in call("iter_user_pending_payments")(1)]
+    await call("update_payment_replied")(payment_id)
+    await call("update_employee_message_id")(payment_id, 10)
+    await call("settle_payment")(payment_id, 15, ("paid_group", "paid_employee"))
+    first, second = await call("get_due_outbox")(10)
+    await call("retry_outbox")(first.id, 60, "timeout")
+    await call("fail_outbox")(second.id, "chat not found")
+    await call("complete_outbox")(first.id)
+    await call("update_payment_status")(payment_id, "paid", 25)
+    await call("rebuild_payment_rollup")()
+    await call("get_statistics")(30)
+    await call("add_admin_message")(payment_id, 100, 1)
+    await call("get_admin_messages")(payment_id)
+    await call("delete_payment")(payment_id, 1)
+    # Отрицательный возраст: граница в будущем, переносится и свежая оплата
+    await call("archive_settled_payments")(-1)
+    assert await db.get_payment_by_id(payment_id) is not None
+    await call("incremental_vacuum")()
+    await call("migrate_timestamps_to_epoch")()
+    await call("vacuum_full")()
+    
+    await call("add_employee")(5, "worker", "Иван", 1)
+    await call("add_employee")(6, "other", "Пётр", 1)
+    await call("add_employees_many")([(6, None, None), (7, "bulk", "Анна")], 1)
+    await call("get_all_employees")()
+    _, cursor = await call("get_employees_page")(1)
+    await db.get_employees_page(1, cursor)
+    [e async for e in call("iter_employees")()]
+    await call("reload_employee_directory")()
+    await call("is_employee")(5)
+    await call("get_employee_count")()
+    await call("get_employee_name")(5)
+    await call("remove_employee")(5)
+    
+    await call("save_fsm_records")([
+        FSMRecord(1, 1, "42:0::default", "Form:amount", {"payment_id": 1}, now_ms()),
+        FSMRecord(2, 2, "42:0::default", updated_at=now_ms())
+    ])
+    await call("get_fsm_record")(1, 1, "42:0::default")
+    await call("get_fsm_state_counts")(3600)
+    await call("purge_fsm_records")(3600)
+    return called
+
+
+def public_query_methods() -> set:
+    return {
+        name for name, member in inspect.getmembers(Database)
+        if (inspect.iscoroutinefunction(member) or inspect.isasyncgenfunction(member))
+        and not name.startswith("_") and name not in NOT_QUERIES
+    }
+
+
+class TestQueryPlans:
+    """Index coverage for every query in database.py"""
+    
+    @pytest.mark.asyncio
+    async def test_no_full_table_scans(self, db):
+        """Test that no statement falls back to a full table scan"""
+        conn = await db.connect()
+        statements = []
+        await db.set_trace_callback(statements.append)
+        try:
+            called = await exercise(db)
+        finally:
+            await db.set_trace_callback(None)
+        
+        assert called == public_query_methods(), "exercise() must call every public Database method"
+        
+        offenders = []
+        for sql in dict.fromkeys(s for s in statements if PLANNED.match(s)):
+            cursor = await conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+            for row in await cursor.fetchall():
+                if FULL_SCAN.match(row[3]):
+                    offenders.append(f"{row[3]}: {' '.join(sql.split())}")
+        
+        assert not offenders, "Full table scans:\n" + "\n".join(offenders)
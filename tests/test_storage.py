@@ -0,0 +1,218 @@
+"""
+Storage contract tests
+The same behaviour is checked against every storage engine.
+Run with: pytest tests/
+"""
+import pytest
+import asyncio
+import inspect
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database
+from memory_storage import MemoryStorage
+from models import Payment
+from storage import Storage
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+async def storage(request, db_path):
+    """Create an empty storage of each kind"""
+    engine = Database(db_path) if request.param == "sqlite" else MemoryStorage()
+    await engine.init_db()
+    yield engine
+    await engine.close()
+
+
+def make_payment(employee_id=1, index=0, **kwargs):
+    return Payment(
+        employee_id=employee_id,
+        employee_username=f"user{employee_id}",
+        balance="100$",
+        username_field=f"@acc{index}",
+        screenshot_file_id=f"file_{index}",
+        **kwargs
+    )
+
+
+class TestStorageContract:
+    """Behaviour shared by all storage engines"""
+    
+    @pytest.mark.parametrize("engine", [Database, MemoryStorage])
+    def test_engines_implement_protocol(self, engine):
+        """Test that every engine has every protocol method with the same parameters"""
+        for name, member in inspect.getmembers(Storage, inspect.isfunction):
+            if name.startswith("_"):
+                continue
+            implementation = getattr(engine, name, None)
+            assert implementation is not None, f"{engine.__name__}.{name} is missing"
+            expected = list(inspect.signature(member).parameters)
+            assert list(inspect.signature(implementation).parameters) == expected, name
+    
+    @pytest.mark.asyncio
+    async def test_payment_lifecycle(self, storage):
+        """Test create, read, flags, settlement and deletion"""
+        assert isinstance(storage, Storage)
+        payment_id = await storage.create_payment(make_payment())
+        other_id = await storage.create_payment(make_payment(index=1))
+        
+        payment = await storage.get_payment_by_id(payment_id)
+        assert payment.id == payment_id
+        assert payment.status == "pending"
+        assert payment.username_field == "@acc0"
+        assert await storage.get_payment_by_id(999999) is None
+        
+        await storage.update_payment_replied(payment_id)
+        await storage.update_employee_message_id(payment_id, 77)
+        payment = await storage.get_payment_by_id(payment_id)
+        assert payment.replied is True
+        assert payment.employee_message_id == 77
+        
+        settled = await storage.settle_payment(payment_id, 25)
+        assert settled.status == "paid"
+        assert settled.payment_amount == 25
+        assert isinstance(settled.paid_at, datetime)
+        assert await storage.settle_payment(payment_id, 30) is None
+        
+        assert await storage.delete_payment(payment_id, 1) is False
+        assert await storage.delete_payment(other_id, 2) is False
+        assert await storage.delete_payment(other_id, 1) is True
+        assert await storage.get_payment_by_id(other_id) is None
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_settlement_pays_once(self, storage):
+        """Test that racing settlements produce exactly one payout"""
+        payment_id = await storage.create_payment(make_payment())
+        results = await asyncio.gather(*(storage.settle_payment(payment_id, 15) for _ in range(5)))
+        assert sum(result is not None for result in results) == 1
+    
+    @pytest.mark.asyncio
+    async def test_pending_payments_and_pages(self, storage):
+        """Test ordering, keyset pages and streaming of pending requests"""
+        created = await storage.create_payments_many(
+            make_payment(index=i, created_at=datetime(2025, 1, 1, 12, 0, i)) for i in range(7)
+        )
+        await storage.create_payment(make_payment(employee_id=2, index=99))
+        assert created == 7
+        
+        pending = await storage.get_user_pending_payments(1)
+        assert [p.username_field for p in pending] == [f"@acc{i}" for i in reversed(range(7))]
+        
+        seen, cursor = [], None
+        while True:
+            page, cursor, _ = await storage.get_user_pending_payments_page(1, 3, cursor)
+            seen.extend(p.username_field for p in page)
+            if cursor is None:
+                break
+        assert seen == [p.username_field for p in pending]
+        
+        # Назад от третьей страницы: вторая страница, затем первая
+        first, older, newer = await storage.get_user_pending_payments_page(1, 3)
+        assert newer is None
+        second, older, _ = await storage.get_user_pending_payments_page(1, 3, older)
+        third, older, newer = await storage.get_user_pending_payments_page(1, 3, older)
+        assert older is None
+        back, older, newer = await storage.get_user_pending_payments_page(1, 3, newer, newer=True)
+        assert [p.id for p in back] == [p.id for p in second]
+        assert (await storage.get_user_pending_payments_page(1, 3, older))[0] == third
+        back, _, newer = await storage.get_user_pending_payments_page(1, 3, newer, newer=True)
+        assert [p.id for p in back] == [p.id for p in first]
+        assert newer is None
+        
+        streamed = [p.username_field async for p in storage.iter_user_pending_payments(1, batch_size=2)]
+        assert streamed == seen
+        
+        # Возвращаются копии: правка объекта не меняет хранилище
+        pending[0].status = "paid"
+        assert (await storage.get_user_pending_payments(1))[0].status == "pending"
+    
+    @pytest.mark.asyncio
+    async def test_outbox(self, storage):
+        """Test that settlement events are queued and can be retried, failed and completed"""
+        payment_id = await storage.create_payment(make_payment())
+        assert await storage.get_due_outbox() == []
+        await storage.settle_payment(payment_id, 15, notify=("paid_group", "paid_employee"))
+        # Повторная оплата не создаёт уведомлений
+        await storage.settle_payment(payment_id, 15, notify=("paid_group",))
+        
+        group, employee = await storage.get_due_outbox()
+        assert (group.event, group.payment_id, group.attempts) == ("paid_group", payment_id, 0)
+        assert employee.event == "paid_employee"
+        assert len(await storage.get_due_outbox(limit=1)) == 1
+        
+        await storage.retry_outbox(group.id, 60, "timeout")
+        await storage.fail_outbox(employee.id, "chat not found")
+        assert await storage.get_due_outbox() == []
+        
+        await storage.retry_outbox(group.id, 0, "timeout")
+        (again,) = await storage.get_due_outbox()
+        assert (again.id, again.attempts, again.last_error) == (group.id, 2, "timeout")
+        await storage.complete_outbox(group.id)
+        assert await storage.get_due_outbox() == []
+    
+    @pytest.mark.asyncio
+    async def test_admin_messages(self, storage):
+        """Test that card copies are stored per admin and removed with the request"""
+        payment_id = await storage.create_payment(make_payment())
+        other_id = await storage.create_payment(make_payment(index=1))
+        assert await storage.get_admin_messages(payment_id) == []
+        
+        await storage.add_admin_message(payment_id, 100, 1)
+        await storage.add_admin_message(payment_id, 200, 2)
+        await storage.add_admin_message(payment_id, 200, 3)
+        await storage.add_admin_message(other_id, 100, 4)
+        assert sorted(await storage.get_admin_messages(payment_id)) == [(100, 1), (200, 3)]
+        
+        assert await storage.delete_payment(payment_id, 1)
+        assert await storage.get_admin_messages(payment_id) == []
+        assert await storage.get_admin_messages(other_id) == [(100, 4)]
+    
+    @pytest.mark.asyncio
+    async def test_statistics(self, storage):
+        """Test that statistics follow settlements and status changes"""
+        ids = [await storage.create_payment(make_payment(employee_id=10 + i % 2, index=i)) for i in range(4)]
+        await storage.settle_payment(ids[0], 15)
+        await storage.settle_payment(ids[1], 25)
+        await storage.settle_payment(ids[2], 15)
+        await storage.update_payment_status(ids[2], "pending", None)
+        
+        stats = await storage.get_statistics(days=30)
+        assert stats['total_paid'] == 2
+        assert stats['total_amount'] == 40
+        assert stats['pending'] == 2
+        assert stats['by_employee'][11]['amount'] == 25
+        assert list(stats['by_employee']) == [11, 10]
+    
+    @pytest.mark.asyncio
+    async def test_employees(self, storage):
+        """Test employee add/remove, bulk insert, lookups and pages"""
+        assert await storage.add_employee(1, "first", "Иван", added_by=100) is True
+        assert await storage.add_employee(2, "second", "Пётр", added_by=100) is True
+        assert await storage.remove_employee(2) is True
+        
+        inserted, skipped = await storage.add_employees_many(
+            [(1, None, None), (2, None, None), (3, "third", "Анна"), (4, None, None)], added_by=100
+        )
+        assert (inserted, skipped) == (3, 1)
+        
+        assert await storage.is_employee(2) is True
+        assert await storage.is_employee(5) is False
+        assert await storage.get_employee_count() == 4
+        assert await storage.get_employee_name(2) == "Пётр"
+        assert await storage.get_employee_name(4) is None
+        
+        everyone = await storage.get_all_employees()
+        assert {e['user_id'] for e in everyone} == {1, 2, 3, 4}
+        assert all(isinstance(e['added_at'], datetime) for e in everyone)
+        
+        seen, cursor = [], None
+        while True:
+            page, cursor = await storage.get_employees_page(3, cursor)
+            seen.extend(e['user_id'] for e in page)
+            if cursor is None:
+                break
+        assert seen == [e['user_id'] for e in everyone]
+        assert [e['user_id'] async for e in storage.iter_employees()] == seen
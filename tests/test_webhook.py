@@ -0,0 +1,151 @@
+"""
+Webhook endpoint tests
+Secret token check, fast acknowledgement and the bounded handler pool.
+Run with: pytest tests/
+"""
+import pytest
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "test-secret"
+
+
+def raw_update(update_id: int, text: str = "hello") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Иван"},
+            "text": text
+        }
+    }
+
+
+class BlockingHandlers:
+    """Message handlers that wait for `release` and record concurrency"""
+    
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.handled = []
+        self.active = 0
+        self.max_active = 0
+        self.router = Router()
+        self.router.message()(self.on_message)
+    
+    async def on_message(self, message: Message):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if message.text == "fail":
+                raise RuntimeError("handler failed")
+            await self.release.wait()
+            self.handled.append(message.message_id)
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+async def bot():
+    test_bot = Bot(token="42:TEST")
+    yield test_bot
+    await test_bot.session.close()
+
+
+async def make_client(bot, handlers, **kwargs):
+    dp = Dispatcher()
+    dp.include_router(handlers.router)
+    server = WebhookServer(dp, bot, SECRET, **kwargs)
+    server.start()
+    client = TestClient(TestServer(server.app()))
+    await client.start_server()
+    return server, client
+
+
+async def post(client, update, secret=SECRET):
+    return await client.post("/webhook", json=update, headers={SECRET_HEADER: secret})
+
+
+class TestWebhookServer:
+    """Test cases for the webhook receiver"""
+    
+    @pytest.mark.asyncio
+    async def test_secret_token(self, bot):
+        """Test that requests without the right secret are rejected"""
+        handlers = BlockingHandlers()
+        handlers.release.set()
+        server, client = await make_client(bot, handlers)
+        try:
+            assert (await post(client, raw_update(1), secret="wrong")).status == 401
+            assert (await client.post("/webhook", json=raw_update(2))).status == 401
+            assert server.pending() == 0
+            assert (await post(client, raw_update(3))).status == 200
+            await server.close()
+            assert handlers.handled == [3]
+        finally:
+            await client.close()
+    
+    @pytest.mark.asyncio
+    async def test_acknowledged_before_handling(self, bot):
+        """Test that Telegram gets 200 while the handler is still running"""
+        handlers = BlockingHandlers()
+        server, client = await make_client(bot, handlers)
+        try:
+            response = await asyncio.wait_for(post(client, raw_update(1)), timeout=1)
+            assert response.status == 200
+            await asyncio.sleep(0.05)
+            assert handlers.active == 1 and handlers.handled == []
+            
+            handlers.release.set()
+            await server.close()
+            assert handlers.handled == [1]
+        finally:
+            await client.close()
+    
+    @pytest.mark.asyncio
+    async def test_bounded_pool(self, bot):
+        """Test that at most `workers` updates run at once and overflow gets 503"""
+        handlers = BlockingHandlers()
+        server, client = await make_client(bot, handlers, workers=2, queue_size=2)
+        try:
+            statuses = [(await post(client, raw_update(update_id))).status for update_id in range(1, 6)]
+            # Два апдейта у воркеров, два в очереди, пятый Telegram пришлёт снова
+            assert statuses == [200, 200, 200, 200, 503]
+            assert handlers.active == 2
+            
+            handlers.release.set()
+            await server.close()
+            assert handlers.max_active == 2
+            assert sorted(handlers.handled) == [1, 2, 3, 4]
+            assert (await post(client, raw_update(6))).status == 503
+        finally:
+            await client.close()
+    
+    @pytest.mark.asyncio
+    async def test_bad_requests_and_handler_errors(self, bot):
+        """Test that malformed bodies get 400 and a failing handler does not stop the pool"""
+        handlers = BlockingHandlers()
+        handlers.release.set()
+        server, client = await make_client(bot, handlers, workers=1)
+        try:
+            bad = await client.post("/webhook", data="not json", headers={SECRET_HEADER: SECRET})
+            assert bad.status == 400
+            assert (await post(client, {"message": "no update id"})).status == 400
+            
+            assert (await post(client, raw_update(1, "fail"))).status == 200
+            assert (await post(client, raw_update(2))).status == 200
+            await server.close()
+            assert handlers.handled == [2]
+        finally:
+            await client.close()
@@ -0,0 +1,115 @@
+"""
+Приём апдейтов по вебхуку.
+
+Вместо long polling Telegram сам присылает апдейты POST-запросом на
+встроенный aiohttp-сервер. Запрос проверяется по заголовку
+X-Telegram-Bot-Api-Secret-Token, апдейт кладётся в ограниченную очередь,
+и Telegram сразу получает 200 — не дожидаясь хендлера. Очередь разбирает
+фиксированный пул воркеров, поэтому всплеск апдейтов не порождает
+неограниченное число задач. Если очередь заполнена, ответ 503: Telegram
+повторит доставку позже.
+
+Несколько процессов бота могут стоять за одним балансировщиком: каждый
+апдейт Telegram отправляет один раз, обработчику всё равно, какой процесс
+его принял.
+"""
+import asyncio
+import hmac
+import logging
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """HTTP-приёмник апдейтов с ограниченным пулом обработчиков"""
+    
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        secret_token: str,
+        path: str = "/webhook",
+        workers: int = 16,
+        queue_size: int = 1000
+    ):
+        self.dp = dp
+        self.bot = bot
+        self.secret_token = secret_token
+        self.path = path
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+    
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+    
+    def start(self) -> None:
+        """Запустить воркеры; вызывается внутри работающего цикла событий"""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    def pending(self) -> int:
+        """Сколько принятых апдейтов ещё ждут обработчика"""
+        return self._queue.qsize()
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            return web.Response(status=401, text="Unauthorized")
+        if self._closing:
+            return web.Response(status=503, text="Shutting down")
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            return web.Response(status=400, text="Bad Request")
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning(f"Webhook queue is full, update {update.update_id} will be redelivered by Telegram")
+            return web.Response(status=503, text="Busy")
+        return web.Response(status=200)
+    
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                result = await self.dp.feed_update(self.bot, update)
+                if isinstance(result, TelegramMethod):
+                    # Ответ хендлера нельзя вернуть в теле: Telegram уже получил 200
+                    await self.dp.silent_call_request(self.bot, result)
+            except Exception as e:
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+    
+    async def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Перестать принимать апдейты, дообработать очередь и остановить воркеры"""
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Webhook queue not drained in {timeout}s, {self.pending()} updates dropped")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+async def start_webhook_server(server: WebhookServer, host: str, port: int) -> web.AppRunner:
+    """Запустить воркеры и HTTP-сервер; остановка — server.close(), затем runner.cleanup()"""
+    server.start()
+    runner = web.AppRunner(server.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Webhook endpoint listening on http://{host}:{port}{server.path}")
+    return runner